@@ -0,0 +1,247 @@
+'''
+ASR 调用封装
+在内存中构建 WAV 容器直接 POST 到 ASR_API_URL，不再落盘临时文件；
+仅在开启调试（ASR_DEBUG_DIR）时按数量上限归档到磁盘。
+
+配置 ASR_STREAM_URL 后，流式上传的语音会边收边转发给增量 ASR 服务：
+  POST {ASR_STREAM_URL}/start            {"sample_rate", "channels"} -> {"session_id"}
+  POST {ASR_STREAM_URL}/<id>/chunk       原始 PCM                     -> {"partial"}
+  POST {ASR_STREAM_URL}/<id>/finish                                   -> {"text"}
+本地替身服务见 fake_asr_server.py。
+'''
+import io
+import itertools
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http_pool import get_session
+from config import ASR_API_URL, ASR_DEBUG_DIR, ASR_DEBUG_MAX_FILES, ASR_STREAM_URL, ASR_STREAM_WORKERS
+
+
+def wav_header(data_size, sample_rate=16000, channels=1, sampwidth=2):
+    """生成 44 字节的 PCM WAV 头"""
+    byte_rate = sample_rate * channels * sampwidth
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, byte_rate, channels * sampwidth, sampwidth * 8,
+        b'data', data_size
+    )
+
+
+def build_wav(pcm, sample_rate=16000, channels=1, sampwidth=2):
+    """把原始 PCM（bytes / bytearray / memoryview）封装为内存中的 WAV 文件对象"""
+    buf = io.BytesIO()
+    buf.write(wav_header(len(pcm), sample_rate, channels, sampwidth))
+    buf.write(pcm)
+    buf.seek(0)
+    return buf
+
+
+class AudioArchive:
+    """调试用的磁盘归档，只保留最近 max_files 条语音"""
+
+    def __init__(self, directory, max_files=100):
+        self.directory = directory
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        self.sequence = itertools.count(1)
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, wav_bytes, tag="utterance"):
+        with self.lock:
+            # 多个连接可能在同一毫秒内保存，加上序号避免互相覆盖
+            filename = os.path.join(self.directory, f"{tag}_{int(time.time() * 1000)}_{next(self.sequence)}.wav")
+            with open(filename, "wb") as f:
+                f.write(wav_bytes)
+            self.prune()
+        return filename
+
+    def prune(self):
+        files = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".wav")),
+            key=os.path.getmtime
+        )
+        for path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class AsrClient:
+    """把语音发送到离线 ASR 服务（SenseVoice /recognize 接口）"""
+
+    def __init__(self, url=ASR_API_URL, timeout=10, archive_dir=ASR_DEBUG_DIR, archive_max_files=ASR_DEBUG_MAX_FILES):
+        self.url = url
+        self.timeout = timeout
+        self.archive = AudioArchive(archive_dir, archive_max_files) if archive_dir else None
+
+    def recognize(self, audio, sample_rate=16000, channels=1, tag="utterance"):
+        """
+        识别一段语音
+        :param audio: 原始 PCM（bytes-like），或已有 WAV 文件路径（兼容旧调用）
+        :return: 识别文本，出错返回 None
+        """
+        try:
+            if isinstance(audio, (str, os.PathLike)):
+                with open(audio, "rb") as f:
+                    wav = io.BytesIO(f.read())
+                name = os.path.basename(audio)
+            else:
+                wav = build_wav(audio, sample_rate, channels)
+                name = f"{tag}.wav"
+
+            if self.archive:
+                self.archive.save(wav.getvalue(), tag)
+
+            files = {"audio": (name, wav, "audio/wav")}
+            response = get_session("asr").post(self.url, files=files, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+            return result.get('text', '')
+        except Exception as e:
+            print(f"[ASR ERROR] {str(e)}")
+            return None
+
+
+class StreamingAsrSession:
+    """
+    一条流式语音的增量识别会话
+    feed() 在接收线程/协程中调用，只做入队；实际转发在共享线程池中按顺序进行，
+    期间积压的分片会合并成一次请求。finish() 时大部分音频已被识别，只剩最后一小段。
+    """
+
+    def __init__(self, client, sample_rate=16000, channels=1):
+        self.client = client
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.session_id = None
+        self.pending = []
+        self.partials = []
+        self.last_partial = ""
+        self.error = None
+        self.closed = False     # finish() 或 abort() 之后为 True，服务端会话只结束一次
+        self.aborted = False
+        self.draining = False
+        self.idle = threading.Event()
+        self.idle.set()
+        self.lock = threading.Lock()
+
+    def feed(self, chunk):
+        """加入一段 PCM（会复制，调用方的缓冲区可以立即复用）"""
+        with self.lock:
+            if self.aborted:
+                return
+            self.pending.append(bytes(chunk))
+            if self.draining:
+                return
+            self.draining = True
+            self.idle.clear()
+        self.client.executor.submit(self.drain)
+
+    def drain(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.draining = False
+                    self.idle.set()
+                    aborted = self.aborted
+                    break
+                data = b''.join(self.pending)
+                self.pending.clear()
+            if self.error or self.aborted:
+                continue
+            try:
+                if self.session_id is None:
+                    self.session_id = self.client.start(self.sample_rate, self.channels)
+                partial = self.client.send_chunk(self.session_id, data)
+                if partial and partial != self.last_partial:
+                    self.last_partial = partial
+                    with self.lock:
+                        self.partials.append(partial)
+            except Exception as e:
+                print(f"[ASR STREAM ERROR] {str(e)}")
+                self.error = e
+        if aborted:
+            self.release()
+
+    def pop_partials(self):
+        """取出自上次调用以来新产生的中间结果"""
+        with self.lock:
+            partials, self.partials = self.partials, []
+        return partials
+
+    def finish(self, timeout=10):
+        """等待剩余分片转发完毕并取得最终文本，失败返回 None（调用方应回退到整段识别）"""
+        self.closed = True
+        if not self.idle.wait(timeout):
+            print("[ASR STREAM ERROR] Timed out waiting for pending chunks")
+            return None
+        if self.error or self.session_id is None:
+            return None
+        try:
+            return self.client.finish(self.session_id)
+        except Exception as e:
+            print(f"[ASR STREAM ERROR] {str(e)}")
+            return None
+
+    def abort(self):
+        """
+        放弃识别（上传中断、空语音等没有调用 finish() 的情况），不阻塞调用方：
+        丢弃未转发的分片，并在后台结束服务端已创建的会话；已经 finish() 过时什么也不做
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.aborted = True
+            self.pending.clear()
+            if self.draining:
+                return      # 正在转发的 drain 结束时释放
+        self.client.executor.submit(self.release)
+
+    def release(self):
+        if self.session_id is None:
+            return
+        try:
+            self.client.finish(self.session_id)
+        except Exception as e:
+            print(f"[ASR STREAM] Failed to release aborted session {self.session_id}: {e}")
+
+
+class StreamingAsrClient:
+    """增量 ASR 服务客户端，所有会话共享一个有界线程池和 keep-alive 连接池
+
+    分片请求不是幂等的，使用单独的 asr_stream 连接池，只在连接失败时重试。
+    """
+
+    def __init__(self, url=ASR_STREAM_URL, timeout=10, max_workers=ASR_STREAM_WORKERS):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asr-stream")
+
+    def open(self, sample_rate=16000, channels=1):
+        return StreamingAsrSession(self, sample_rate, channels)
+
+    def start(self, sample_rate, channels):
+        response = get_session("asr_stream").post(
+            f"{self.url}/start", json={"sample_rate": sample_rate, "channels": channels}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["session_id"]
+
+    def send_chunk(self, session_id, pcm):
+        response = get_session("asr_stream").post(
+            f"{self.url}/{session_id}/chunk", data=pcm,
+            headers={"Content-Type": "application/octet-stream"}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json().get("partial", "")
+
+    def finish(self, session_id):
+        response = get_session("asr_stream").post(f"{self.url}/{session_id}/finish", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get("text", "")
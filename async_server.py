@@ -0,0 +1,360 @@
+import asyncio
+import functools
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pipeline import VoicePipeline
+from llm_metrics import LlmMetrics
+from framing import AsyncFrameReader, encode_message
+from server import ClientSession, log_chunk_progress, normalize, execution_result
+from config import (
+    LLM_API_KEY, LLM_BASE_URL, LLM_MODEL, LLM_STREAM, ASYNC_IO_WORKERS, ASYNC_CPU_WORKERS, EXEC_OPTIMISTIC_ACK
+)
+
+
+class AsyncVoiceServer:
+    """asyncio 版语音控制服务器 - 与 LightweightVoiceServer 协议完全一致，但不为每个连接创建线程
+
+    每个连接只是一个协程，空闲的卫星设备几乎不占资源；
+    ASR / LLM / HA 等阻塞 I/O 在有界的 io 线程池中以 awaitable 方式执行，
+    响应解析等 CPU 操作放在独立的小线程池中，不会阻塞事件循环。
+    """
+
+    def __init__(self, host='0.0.0.0', port=9999, io_workers=ASYNC_IO_WORKERS, cpu_workers=ASYNC_CPU_WORKERS, pipeline=None):
+        self.host = host
+        self.port = port
+
+        # 所有连接共享同一条流水线
+        self.pipeline = pipeline or VoicePipeline(
+            api_key=LLM_API_KEY,
+            base_url=LLM_BASE_URL,
+            model=LLM_MODEL
+        )
+
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="ha-io")
+        self.cpu_executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="ha-cpu")
+
+        self.server_socket = None
+        self.active_clients = {}
+        self.client_tasks = set()  # 事件循环只弱引用任务，这里持有强引用
+        self.send_locks = {}       # 乐观确认模式下执行结果由独立的任务推送，与连接协程的发送互斥
+        self.loop = None
+
+    def start(self):
+        """启动服务器（阻塞直到 Ctrl+C）"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n Server shutting down...")
+        finally:
+            self.pipeline.close()
+            self.io_executor.shutdown(wait=False)
+            self.cpu_executor.shutdown(wait=False)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(socket.SOMAXCONN)
+        self.server_socket.setblocking(False)
+
+        await self.loop.run_in_executor(self.io_executor, self.pipeline.warm_up)
+
+        print(f" Async Voice Server started on {self.host}:{self.port}")
+        print(f" Waiting for clients...")
+
+        try:
+            while True:
+                client_socket, address = await self.loop.sock_accept(self.server_socket)
+                client_socket.setblocking(False)
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                client_id = f"{address[0]}:{address[1]}"
+                print(f"✅ Client connected: {client_id}")
+
+                self.active_clients[client_id] = ClientSession(client_socket, address)
+                task = self.loop.create_task(self.handle_client(client_socket, address, client_id))
+                self.client_tasks.add(task)
+                task.add_done_callback(self.client_tasks.discard)
+        finally:
+            self.server_socket.close()
+
+    async def handle_client(self, client_socket, address, client_id):
+        """处理客户端请求（协程版本，消息类型与同步服务器一致）"""
+        reader = AsyncFrameReader(self.loop, client_socket)
+        self.send_locks[client_socket] = asyncio.Lock()
+        try:
+            while True:
+                # 1. 接收消息头 [4字节长度][JSON]
+                header = await reader.read_json()
+                if header is None: break
+
+                msg_type = header.get('type')
+                request_id = header.get('request_id', str(uuid.uuid4()))
+
+                print(f"[{client_id}] Received {msg_type} (ID: {request_id[:8]})")
+
+                if msg_type == 'HEARTBEAT':
+                    await self.send_response(client_socket, 'PONG', 'alive', request_id)
+
+                elif msg_type == 'VOICE_COMMAND':
+                    audio_size = header.get('size', 0)  # 如果是 0 或 -1，代表流式传输
+
+                    asr_stream = None
+                    if audio_size > 0:
+                        # --- 兼容旧模式：一次性接收固定长度 ---
+                        print(f"[{client_id}] Receiving fixed audio: {audio_size} bytes")
+                    else:
+                        # --- 新模式：流式接收 (Chunked) ---
+                        # C++ 客户端逻辑：循环发送 [4字节长度][数据]，最后发送 [0000] 结束
+                        print(f"[{client_id}] Receiving streamed audio...")
+                        # 配置了增量 ASR 时边收边识别，并推送 ASR_PARTIAL
+                        asr_stream = self.pipeline.open_asr_stream(header.get('sample_rate', 16000), header.get('channels', 1))
+
+                    try:
+                        # 直接 recv_into 到池化缓冲区，音频以 memoryview 交给后续处理，不做整段拷贝
+                        audio = await reader.read_audio(
+                            audio_size,
+                            on_chunk=lambda chunk, count, total: self.forward_chunk(client_socket, client_id, request_id, asr_stream, chunk, count, total)
+                        )
+                        if audio is None:
+                            print(f"[{client_id}] Connection lost during audio recv")
+                            break
+
+                        try:
+                            final_size = len(audio)
+                            print(f"[{client_id}] Audio received completely. Total: {final_size} bytes")
+
+                            if final_size == 0:
+                                await self.send_response(client_socket, 'ERROR', 'Empty audio', request_id)
+                                continue
+
+                            # 立即发送ACK
+                            await self.send_response(client_socket, 'ACK', 'Audio received', request_id)
+
+                            await self.process_voice_command(client_socket, client_id, audio.view, header, request_id, asr_stream)
+                        finally:
+                            audio.release()
+                    finally:
+                        # 上传中断、空语音等没有走到识别（finish）时，结束服务端已创建的增量识别会话
+                        if asr_stream is not None:
+                            asr_stream.abort()
+
+                elif msg_type == 'PING':
+                    await self.send_response(client_socket, 'PONG', 'Server is alive', request_id)
+
+                else:
+                    print(f"[{client_id}]  Unknown message type: {msg_type}")
+
+        except ConnectionResetError:
+            print(f"[{client_id}] Connection reset by client")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[{client_id}]  Error: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            self.send_locks.pop(client_socket, None)
+            client_socket.close()
+            self.active_clients.pop(client_id, None)
+            print(f"[{client_id}]  Client disconnected")
+
+    async def run_io(self, func, *args):
+        """在 io 线程池中执行阻塞调用（ASR / LLM / HA）"""
+        return await self.loop.run_in_executor(self.io_executor, func, *args)
+
+    async def run_io_with_events(self, func, *args, on_event):
+        """
+        在 io 线程池中执行 func(*args, callback)，func 在线程里每次回调都会转交给事件循环，
+        按顺序 await on_event(*event)；所有发送仍在本连接的协程中完成，帧不会交错
+        """
+        events = asyncio.Queue()
+
+        def callback(*event):
+            self.loop.call_soon_threadsafe(events.put_nowait, event)
+
+        job = self.loop.run_in_executor(self.io_executor, func, *args, callback)
+        while True:
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({getter, job}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                await on_event(*getter.result())
+                continue
+            getter.cancel()
+            break
+        # 线程结束前投递的事件一定排在 job 完成之前，这里补发剩余的
+        while not events.empty():
+            await on_event(*events.get_nowait())
+        return job.result()
+
+    async def forward_chunk(self, client_socket, client_id, request_id, asr_stream, chunk, chunk_count, total):
+        """每收到一个音频分片：打印进度，转发给增量 ASR，并把新的中间结果推给客户端"""
+        log_chunk_progress(client_id, chunk_count, total)
+        if asr_stream is None:
+            return
+        asr_stream.feed(chunk)
+        for partial in asr_stream.pop_partials():
+            await self.send_response(client_socket, 'ASR_PARTIAL', {
+                'text': normalize(partial),
+                'audio_bytes': total
+            }, request_id)
+
+    async def process_voice_command(self, client_socket, client_id, audio_data, header, request_id, asr_stream=None):
+        """处理语音命令：ASR + LLM + 执行"""
+        try:
+            # 固定本请求使用的设备配置快照，处理过程中 devices.yaml 被重新加载也不受影响
+            pipeline = self.pipeline.pinned()
+
+            sample_rate = header.get('sample_rate', 16000)
+            channels = header.get('channels', 1)
+
+            # 1. ASR识别
+            print(f"[{client_id}][{request_id[:8]}]  Running ASR...")
+            asr_start = time.time()
+            text = await self.run_io(pipeline.recognize_speech, audio_data, sample_rate, channels, asr_stream)
+            text = normalize(text) if text else text
+            asr_time = time.time() - asr_start
+
+            if not text or not text.strip():
+                print(f"[{client_id}][{request_id[:8]}]  ASR failed or empty")
+                await self.send_response(client_socket, 'ERROR', 'ASR recognition failed or empty result', request_id)
+                return
+
+            print(f"[{client_id}][{request_id[:8]}]  ASR Result: '{text}' ({asr_time:.2f}s)")
+
+            await self.send_response(client_socket, 'ASR_RESULT', {
+                'text': text,
+                'asr_time': round(asr_time, 2)
+            }, request_id)
+
+            # 2. LLM处理
+            print(f"[{client_id}][{request_id[:8]}]  Processing with LLM...")
+            llm_start = time.time()
+            # 每条命令执行完立即推送 COMMAND_EXECUTED，不等 LLM 输出结束
+            async def on_executed(index, cmd, status):
+                await self.send_response(client_socket, 'COMMAND_EXECUTED', {
+                    'index': index,
+                    'command': cmd,
+                    'status': status,
+                    'elapsed': round(time.time() - llm_start, 3)
+                }, request_id)
+
+            # 快速通道和意图缓存都是微秒级的本地匹配，先在事件循环内尝试，未命中再去线程池调用 LLM
+            metrics = LlmMetrics()
+            batch = None
+            local = pipeline.match_local(text)
+            if EXEC_OPTIMISTIC_ACK:
+                # 乐观确认：命令校验通过、进入队列即回复，不等 HA 返回；执行结果由独立的任务推送。
+                # 同一设备的命令排在之前的命令之后执行，不等上一次回复的其他命令；
+                # 本地匹配的提交只是校验和入队，直接在事件循环内完成
+                if local:
+                    content, command, source = local
+                    batch = pipeline.queue_commands(command)
+                else:
+                    content, command, batch = await self.run_io(
+                        functools.partial(pipeline.llm_and_queue, metrics=metrics), text
+                    )
+                    source = "llm"
+                results = batch.snapshot()
+            elif local:
+                content, command, source = local
+                results = await self.run_io_with_events(pipeline.execute_commands, command, on_event=on_executed)
+            elif LLM_STREAM or pipeline.structured_output():
+                # 结构化输出 / 流式解码都在线程里边生成边执行，命令执行结果逐条转交给本协程发送
+                content, command, results = await self.run_io_with_events(
+                    functools.partial(pipeline.llm_and_execute, metrics=metrics), text, on_event=on_executed
+                )
+                source = "llm"
+            else:
+                content = await self.run_io(pipeline.ask_llm, text, metrics)
+                command = await self.loop.run_in_executor(self.cpu_executor, pipeline.parse_response, content)
+                results = await self.run_io_with_events(pipeline.execute_commands, command, on_event=on_executed)
+                source = "llm"
+            if source == "llm":
+                # 写缓存可能落盘，放到线程池里做，不阻塞事件循环也不推迟响应
+                self.io_executor.submit(pipeline.remember, text, content, command)
+            llm_time = time.time() - llm_start
+            llm_metrics = metrics.as_dict() if source == "llm" else None
+
+            print(f"[{client_id}][{request_id[:8]}]  LLM Response [{source}] ({llm_time:.2f}s):")
+            print(f"   {content[:200]}...")
+
+            if command:
+                execution_status = pipeline.summarize_status(results)
+                print(f"[{client_id}][{request_id[:8]}]  Executed: {command} ({execution_status})")
+
+                await self.send_response(client_socket, 'SUCCESS', {
+                    'text': text,
+                    'response': content,
+                    'command': command,
+                    'execution_status': execution_status,
+                    'results': results,
+                    'asr_time': round(asr_time, 2),
+                    'llm_time': round(llm_time, 2),
+                    'source': source,
+                    'llm_metrics': llm_metrics,
+                    'total_time': round(asr_time + llm_time, 2)
+                }, request_id)
+                if batch is not None:
+                    task = self.loop.create_task(self.follow_execution(client_socket, client_id, request_id, batch))
+                    self.client_tasks.add(task)
+                    task.add_done_callback(self.client_tasks.discard)
+            else:
+                print(f"[{client_id}][{request_id[:8]}] ℹ No executable command")
+                await self.send_response(client_socket, 'INFO', {
+                    'text': text,
+                    'response': content,
+                    'message': 'No executable command found in response',
+                    'asr_time': round(asr_time, 2),
+                    'llm_time': round(llm_time, 2),
+                    'source': source,
+                    'llm_metrics': llm_metrics
+                }, request_id)
+
+        except Exception as e:
+            print(f"[{client_id}][{request_id[:8]}]  Processing error: {e}")
+            import traceback
+            traceback.print_exc()
+            await self.send_response(client_socket, 'ERROR', str(e), request_id)
+
+    async def follow_execution(self, client_socket, client_id, request_id, batch):
+        """乐观确认之后：每条命令执行完推送 EXECUTION_RESULT，有命令失败时最后推送一条 EXECUTION_FAILED 更正"""
+        async def on_result(result, remaining):
+            await self.send_response(client_socket, 'EXECUTION_RESULT', execution_result(batch, result, remaining), request_id)
+
+        results = await self.run_io_with_events(batch.follow, on_event=on_result)
+        execution_status = self.pipeline.summarize_status(results)
+        print(f"[{client_id}][{request_id[:8]}]  Execution finished ({execution_status})")
+        if execution_status != "success":
+            await self.send_response(client_socket, 'EXECUTION_FAILED', {
+                'execution_status': execution_status,
+                'results': results
+            }, request_id)
+
+    async def send_response(self, client_socket, msg_type, data, request_id=None):
+        """发送响应给客户端"""
+        try:
+            response = {
+                'type': msg_type,
+                'data': data,
+                'request_id': request_id,
+                'timestamp': time.time()
+            }
+            lock = self.send_locks.get(client_socket)
+            if lock is None:
+                await self.loop.sock_sendall(client_socket, encode_message(response))
+            else:
+                async with lock:
+                    await self.loop.sock_sendall(client_socket, encode_message(response))
+
+            print(f"    Sent {msg_type} response (ID: {request_id[:8] if request_id else 'N/A'})")
+        except Exception as e:
+            print(f"    Error sending response: {e}")
+
+
+if __name__ == "__main__":
+    server = AsyncVoiceServer(host='0.0.0.0', port=9999)
+    server.start()
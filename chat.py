@@ -6,8 +6,16 @@ import os
 import json
 from typing import List, Dict, Any, Optional, Union, Callable
 import time
-from openai import OpenAI
-from config import SYSTEM_PROMPT
+from openai import OpenAI, APIConnectionError, RateLimitError, InternalServerError
+from config import (
+    SYSTEM_PROMPT, LLM_TIMEOUT, LLM_HEDGE_PERCENTILE, LLM_HEDGE_DEFAULT_MS, LLM_HEDGE_MIN_MS,
+    LLM_EJECT_AFTER, LLM_PROBE_INTERVAL, LLM_MAX_RETRIES, LLM_STREAM_USAGE
+)
+from llm_router import EndpointRouter
+from llm_metrics import LlmMetrics, LlmStats
+
+# 可以重试的错误（连接失败 / 超时、限流、服务端 5xx）
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
 
 
 
@@ -25,7 +33,8 @@ class ChatBot:
         
         Args:
             api_key: OpenAI API密钥，如果为None则从环境变量OPENAI_API_KEY获取
-            base_url: API基础URL，可自定义为其他兼容OpenAI API的服务
+            base_url: API基础URL，可自定义为其他兼容OpenAI API的服务；
+                      多个地址（逗号分隔的字符串或列表）时无状态请求经 EndpointRouter 对冲路由
             model: 使用的模型名称或推理接入点ID
             system_message: 系统预设指令
         """
@@ -33,16 +42,34 @@ class ChatBot:
         if not self.api_key:
             raise ValueError("API key is required. Either pass it directly or set OPENAI_API_KEY environment variable.")
         
-        # 初始化OpenAI客户端
+        base_urls = [u.strip() for u in base_url.split(",") if u.strip()] if isinstance(base_url, str) else list(base_url)
+
+        # 初始化OpenAI客户端（多个地址时 chat() 使用第一个）；重试由 create() 自己做，以便计数
         self.client = OpenAI(
-            base_url=base_url,
-            api_key=self.api_key
+            base_url=base_urls[0],
+            api_key=self.api_key,
+            timeout=LLM_TIMEOUT,
+            max_retries=0
         )
+        self.max_retries = LLM_MAX_RETRIES
+        self.router = None
+        if len(base_urls) > 1:
+            self.router = EndpointRouter(
+                base_urls, self.api_key, timeout=LLM_TIMEOUT,
+                hedge_percentile=LLM_HEDGE_PERCENTILE,
+                hedge_default=LLM_HEDGE_DEFAULT_MS / 1000.0,
+                hedge_min=LLM_HEDGE_MIN_MS / 1000.0,
+                eject_after=LLM_EJECT_AFTER,
+                probe_interval=LLM_PROBE_INTERVAL
+            )
         
         self.model = model
+        self.system_message = system_message
         self.conversation_history = [{"role": "system", "content": system_message}]
         self.tools = []
         self.function_map = {}
+        # 无状态请求的 TTFT / token / 重试统计
+        self.stats = LlmStats()
          
     def set_system_message(self, message: str) -> None:
         """
@@ -51,6 +78,8 @@ class ChatBot:
         Args:
             message: 新的系统预设指令
         """
+        # 整体替换字符串引用，并发中的无状态请求要么用旧值要么用新值
+        self.system_message = message
         if self.conversation_history and self.conversation_history[0]["role"] == "system":
             self.conversation_history[0]["content"] = message
         else:
@@ -105,10 +134,12 @@ class ChatBot:
             params["tools"] = self.tools
             params["tool_choice"] = "auto"
         
+        # self.client 不自动重试（见 create()），这里沿用 SDK 的重试
+        client = self.client.with_options(max_retries=self.max_retries)
         try:
             if not stream:
                 # 非流式请求
-                response = self.client.chat.completions.create(**params)
+                response = client.chat.completions.create(**params)
 
                 # 获取助手消息
                 assistant_message = {
@@ -123,8 +154,7 @@ class ChatBot:
                 return response.choices[0].message.content
             else:
                 # 流式响应处理
-                stream_response = self.client.chat.completions.create(**params)
-                print(stream_response)
+                stream_response = client.chat.completions.create(**params)
                 collected_content = ""
                 
                 for chunk in stream_response:
@@ -145,7 +175,8 @@ class ChatBot:
                 })
                 
                 # 注意：流式响应不处理工具调用，如需工具调用，应使用非流式模式
-                return stream_response
+                # 迭代器此时已被消费完，返回拼接好的文本；需要逐段处理请使用 stream_complete
+                return collected_content
         
         except Exception as e:
             print(f"Error during API call: {e}")
@@ -154,6 +185,157 @@ class ChatBot:
             return {"error": error_message}
     
     
+    def build_messages(self, message: str, system_message: Optional[str] = None) -> List[Dict[str, str]]:
+        """为单次请求构建消息列表（系统指令 + 用户消息），不读写对话历史"""
+        return [
+            {"role": "system", "content": system_message or self.system_message},
+            {"role": "user", "content": message},
+        ]
+
+    def build_params(self, messages: List[Dict[str, str]], stream: bool, model: Optional[str] = None) -> Dict[str, Any]:
+        params = {
+            "model": model or self.model,
+            "messages": messages,
+            "stream": stream,
+            "temperature": 0.1,  # 越接近0越确定不随机
+            "top_p": 0.1,
+        }
+        if stream and LLM_STREAM_USAGE:
+            # 让推理服务在最后一个分片里返回 usage
+            params["stream_options"] = {"include_usage": True}
+        return params
+
+    def create(self, params: Dict[str, Any], metrics: Optional[LlmMetrics] = None) -> Any:
+        """
+        发送一次补全请求；配置了多个推理服务时由路由器选择节点并对冲（对冲和故障转移计为重试），
+        否则对可重试的错误最多重试 max_retries 次
+        """
+        if self.router:
+            info = {}
+            request = lambda client: client.chat.completions.create(**params)
+            if params.get("stream"):
+                return self.track_attempts(self.router.stream(request, info), info, metrics)
+            try:
+                return self.router.call(request, info)
+            finally:
+                if metrics:
+                    metrics.retries = info.get("attempts", 1) - 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.client.chat.completions.create(**params)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                if metrics:
+                    metrics.retries += 1
+                print(f"[LLM] Retrying ({attempt + 1}/{self.max_retries}) after error: {e}")
+                time.sleep(min(2.0, 0.25 * 2 ** attempt))
+
+    @staticmethod
+    def track_attempts(chunks, info, metrics):
+        """路由的流式请求在产出第一段时才选出节点，结束后再把实际请求数记入 metrics"""
+        try:
+            yield from chunks
+        finally:
+            if metrics:
+                metrics.retries = info.get("attempts", 1) - 1
+
+    def complete(self, message: str, system_message: Optional[str] = None, model: Optional[str] = None,
+                 metrics: Optional[LlmMetrics] = None) -> Any:
+        """
+        无状态请求：每次独立构建消息，不修改 conversation_history，可被多个线程同时调用，
+        也不需要再发送 "reset" 清理上下文
+
+        Args:
+            message: 用户消息
+            system_message: 本次请求使用的系统指令，默认使用实例的系统指令
+            model: 本次请求使用的模型（按复杂度分档时），默认使用实例的模型
+            metrics: 可选的 LlmMetrics，请求结束后包含耗时、token 数和重试次数
+
+        Returns:
+            回复文本；出错时返回 {"error": ...}（与 chat 一致）
+        """
+        messages = self.build_messages(message, system_message)
+        params = self.build_params(messages, stream=False, model=model)
+        metrics = metrics or LlmMetrics()
+        metrics.reset(params["model"], stream=False)
+        try:
+            response = self.create(params, metrics)
+            content = response.choices[0].message.content
+            metrics.finish(response.usage, messages, content)
+            return content
+        except Exception as e:
+            print(f"Error during API call: {e}")
+            metrics.finish(messages=messages, error=str(e))
+            return {"error": f"API call failed: {str(e)}"}
+        finally:
+            self.stats.record(metrics)
+
+    def complete_json(self, message: str, system_message: Optional[str] = None, model: Optional[str] = None,
+                      metrics: Optional[LlmMetrics] = None, **options) -> str:
+        """
+        结构化输出请求（无状态）：options 中可带 response_format / tools / tool_choice / max_tokens / stop
+
+        Returns:
+            模型输出的 JSON 文本（强制工具调用时为工具参数）；调用出错时抛出异常，由调用方回退
+        """
+        messages = self.build_messages(message, system_message)
+        params = self.build_params(messages, stream=False, model=model)
+        params.update(options)
+        metrics = metrics or LlmMetrics()
+        metrics.reset(params["model"], stream=False)
+        try:
+            response = self.create(params, metrics)
+            reply = response.choices[0].message
+            output = reply.tool_calls[0].function.arguments if reply.tool_calls else reply.content
+            metrics.finish(response.usage, messages, output)
+            return output
+        except Exception as e:
+            metrics.finish(messages=messages, error=str(e))
+            raise
+        finally:
+            self.stats.record(metrics)
+
+    def stream_complete(self, message: str, system_message: Optional[str] = None, model: Optional[str] = None,
+                        metrics: Optional[LlmMetrics] = None):
+        """
+        无状态流式请求，逐段产出回复文本（生成器），线程安全
+
+        Args:
+            message: 用户消息
+            system_message: 本次请求使用的系统指令，默认使用实例的系统指令
+            model: 本次请求使用的模型，默认使用实例的模型
+            metrics: 可选的 LlmMetrics，生成结束后包含 TTFT、decode 速度、token 数和重试次数
+
+        Yields:
+            增量文本 delta.content；调用出错时抛出异常，由调用方处理
+        """
+        messages = self.build_messages(message, system_message)
+        params = self.build_params(messages, stream=True, model=model)
+        metrics = metrics or LlmMetrics()
+        metrics.reset(params["model"], stream=True)
+        parts = []
+        usage = None
+        error = None
+        try:
+            stream_response = self.create(params, metrics)
+            for chunk in stream_response:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    metrics.first_token()
+                    parts.append(delta.content)
+                    yield delta.content
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            metrics.finish(usage, messages, "".join(parts), chunks=len(parts), error=error)
+            self.stats.record(metrics)
+
     def get_conversation_history(self) -> List[Dict[str, Any]]:
         """获取完整对话历史"""
         return self.conversation_history
@@ -210,7 +392,6 @@ def main():
         # user_input += 'no_think'
         response = bot.chat(user_input, stream=False)
         print(response)
-        response = bot.chat("reset", stream=False)
         
         
 
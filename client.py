@@ -8,6 +8,7 @@ import sounddevice as sd
 from kws import KeywordSpotter
 from vad import SileroVAD
 from collections import OrderedDict
+from framing import FrameReader, encode_message
 
 class SmartVoiceClient:
     """智能语音客户端 - 本地运行KWS和VAD，只发送命令片段"""
@@ -16,6 +17,7 @@ class SmartVoiceClient:
         self.server_host = server_host
         self.server_port = server_port
         self.socket = None
+        self.reader = None
         self.connected = False
         
         # 请求追踪
@@ -50,6 +52,7 @@ class SmartVoiceClient:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.server_host, self.server_port))
+            self.reader = FrameReader(self.socket)
             self.connected = True
             print(f"✅ Connected to {self.server_host}:{self.server_port}")
             
@@ -99,18 +102,11 @@ class SmartVoiceClient:
             header.update(data)
             
             # 发送头部
-            header_json = json.dumps(header, ensure_ascii=False).encode('utf-8')
-            header_size = len(header_json).to_bytes(4, 'big')
-            self.socket.sendall(header_size + header_json)
+            self.socket.sendall(encode_message(header))
             
-            # 如果有音频数据，分块发送
+            # 如果有音频数据，整段交给 sendall（内核分段发送，避免切片拷贝）
             if audio_data:
-                total_sent = 0
-                chunk_size = 8192
-                while total_sent < len(audio_data):
-                    chunk = audio_data[total_sent:total_sent + chunk_size]
-                    self.socket.sendall(chunk)
-                    total_sent += len(chunk)
+                self.socket.sendall(audio_data)
                 
                 print(f"📤 Sent audio: {len(audio_data)} bytes (ID: {request_id[:8]})")
             
@@ -139,25 +135,8 @@ class SmartVoiceClient:
         try:
             self.socket.settimeout(timeout)
             
-            # 接收响应长度
-            size_data = self.socket.recv(4)
-            if not size_data or len(size_data) < 4:
-                return None
-            
-            response_size = int.from_bytes(size_data, 'big')
-            
-            # 接收响应内容
-            response_data = b''
-            while len(response_data) < response_size:
-                chunk = self.socket.recv(min(4096, response_size - len(response_data)))
-                if not chunk:
-                    break
-                response_data += chunk
-            
-            if len(response_data) < response_size:
-                return None
-            
-            response = json.loads(response_data.decode('utf-8'))
+            # 接收 [4字节长度][JSON]，recv_into 到复用缓冲区
+            response = self.reader.read_json()
             return response
         except socket.timeout:
             raise
@@ -284,12 +263,33 @@ class SmartVoiceClient:
             print(f"📝 You said: \"{text}\"")
             print(f"   ASR time: {asr_time}s")
         
+        elif msg_type == 'COMMAND_EXECUTED':
+            print(f"⚡ Executed #{data.get('index')}: {data.get('command')} ({data.get('status')}, {data.get('elapsed')}s)")
+        
+        elif msg_type == 'EXECUTION_RESULT':
+            # 乐观确认模式：SUCCESS 之后逐条到达的执行结果
+            print(f"⚡ Confirmed #{data.get('index')}: {data.get('command')} ({data.get('status')}, "
+                  f"{data.get('duration')}s, {data.get('remaining')} remaining)")
+        
+        elif msg_type == 'EXECUTION_FAILED':
+            print(f"❌ Execution failed after acknowledgement: {data.get('execution_status')}")
+            for result in data.get('results') or []:
+                if result.get('status') != 'success':
+                    print(f"     #{result.get('index')} {result.get('service')} {result.get('target_device')}: {result.get('status')}")
+        
         elif msg_type == 'SUCCESS':
             print(f"✅ Command executed!")
             print(f"   Text: {data.get('text')}")
             print(f"   Command: {data.get('command')}")
             print(f"   Status: {data.get('execution_status')}")
+            for result in data.get('results') or []:
+                print(f"     #{result.get('index')} {result.get('service')} {result.get('target_device')}: "
+                      f"{result.get('status')} (+{result.get('started')}s, {result.get('duration')}s)")
             print(f"   Timing: ASR={data.get('asr_time')}s, LLM={data.get('llm_time')}s, Total={data.get('total_time')}s")
+            metrics = data.get('llm_metrics')
+            if metrics:
+                print(f"   LLM: TTFT={metrics.get('ttft_ms')}ms, tokens={metrics.get('prompt_tokens')}+{metrics.get('completion_tokens')}, "
+                      f"decode={metrics.get('decode_tps')} tok/s, retries={metrics.get('retries')}")
             if latency:
                 print(f"   Round-trip: {latency:.2f}s")
             
@@ -0,0 +1,235 @@
+'''
+并发命令执行
+一次回复里的多条命令（如"全部关掉"）原来逐条串行执行，每条之间还 sleep 0.1 秒。
+这里按目标实体分队列：不同实体的命令并发执行，同一实体的命令严格按提交顺序执行（队列由所有批次共享，
+后一次回复里同一实体的命令排在前一次之后，其他实体不受影响），线程池大小即同时在途的 HA 请求上限。
+每条命令返回状态和耗时。
+整组提交时，服务和参数都相同、实体各不相同的命令合并为一次调用（entity_id 传列表），结果仍逐条返回。
+提交时先校验命令，不合法的命令不进入队列，直接记为 rejected。
+'''
+import itertools
+import json
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def coalesce(items, can_merge):
+    """
+    把服务和参数都相同的命令分为一组；同一实体在本组命令中出现多次时不合并，保证该实体的命令顺序
+    :param items: [(index, command)]
+    :param can_merge: can_merge(command) 为 False 的命令（如状态查询）单独执行
+    :return: [[(index, command), ...]]，按每组第一条命令的顺序
+    """
+    counts = Counter(c["target_device"] for _, c in items
+                     if isinstance(c, dict) and isinstance(c.get("target_device"), str))
+    groups = {}
+    ordered = []
+    for index, command in items:
+        key = None
+        if (isinstance(command, dict) and isinstance(command.get("target_device"), str)
+                and counts[command["target_device"]] == 1 and can_merge(command)):
+            params = {k: v for k, v in command.items() if k not in ("service", "target_device")}
+            key = (command.get("service"), json.dumps(params, sort_keys=True))
+        if key in groups:
+            groups[key].append((index, command))
+            continue
+        group = [(index, command)]
+        ordered.append(group)
+        if key is not None:
+            groups[key] = group
+    return ordered
+
+
+class CommandExecutor:
+    def __init__(self, execute, max_in_flight=4):
+        """
+        :param execute: 执行单条命令的函数 execute(command)，出错时抛出异常
+        :param max_in_flight: 同时在途的命令数上限（所有连接共享）
+        """
+        self.execute = execute
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="exec")
+        self.lock = threading.Lock()
+        self.queues = {}        # 实体 -> 排在正在执行的命令之后的 [(batch, group), ...]
+        self.ids = itertools.count()    # 没有合法实体的命令各自单独一个队列
+
+    def batch(self, on_executed=None, validate=None):
+        """
+        开始一组命令的执行；命令可以边生成边提交（流式解码时）
+        :param validate: 可选，validate(command) 返回错误信息（不合法）或 None，在提交时调用
+        """
+        return ExecutionBatch(self, on_executed, validate)
+
+    def enqueue(self, batch, group):
+        """
+        单条命令排在该实体前面的命令（任何批次）之后；合并的命令组只在所有成员实体都空闲时一起执行，
+        执行期间占住这些实体，否则拆开逐条排队
+        """
+        entities = [command.get("target_device") if isinstance(command, dict) else None for _, command in group]
+        keys = [entity if isinstance(entity, str) and entity else f"#{next(self.ids)}" for entity in entities]
+        with self.lock:
+            if len(group) > 1 and not any(key in self.queues for key in keys):
+                for key in keys:
+                    self.queues[key] = deque()
+                self.pool.submit(self.run_group, batch, group, keys)
+                return
+            idle = []
+            for key, item in zip(keys, group):
+                queue = self.queues.get(key)
+                if queue is not None:
+                    # 该实体已有命令在执行，由那条链路按顺序继续执行
+                    queue.append((batch, [item]))
+                else:
+                    self.queues[key] = deque([(batch, [item])])
+                    idle.append(key)
+        for key in idle:
+            self.pool.submit(self.drain, key)
+
+    def run_group(self, batch, group, keys):
+        batch.run(group)
+        # 执行期间排到各成员实体后面的命令，各自继续按顺序执行
+        for key in keys[1:]:
+            self.pool.submit(self.drain, key)
+        self.drain(keys[0])
+
+    def drain(self, key):
+        """依次执行某个实体队列中的命令，直到队列为空"""
+        while True:
+            with self.lock:
+                queue = self.queues[key]
+                if not queue:
+                    del self.queues[key]
+                    return
+                batch, group = queue.popleft()
+            batch.run(group)
+
+
+class ExecutionBatch:
+    def __init__(self, executor, on_executed=None, validate=None):
+        """
+        :param on_executed: 每条命令执行完后回调 on_executed(index, command, status)；
+                            回调在工作线程中调用，但同一批次内互斥，不会并发
+        """
+        self.executor = executor
+        self.on_executed = on_executed
+        self.validate = validate
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.callback_lock = threading.Lock()
+        self.commands = []
+        self.results = []
+        self.finished = []      # 按完成顺序排列的序号
+        self.pending = 0
+        self.done = threading.Condition(self.lock)
+
+    def submit(self, command):
+        """提交一条命令，立即返回序号；同一实体的命令排在该实体前一条命令（包括其他批次的）之后"""
+        return self.submit_many([command])[0]
+
+    def submit_many(self, commands, can_merge=None):
+        """
+        一次提交多条命令，立即返回各自的序号
+        :param can_merge: 给出时按 coalesce 合并服务和参数相同的命令，每组只调用一次 execute
+        """
+        with self.lock:
+            first = len(self.results)
+            self.commands.extend(commands)
+            self.results.extend([None] * len(commands))
+            self.pending += len(commands)
+        items = list(enumerate(commands, first))
+        valid = []
+        # 以下任何一步出错都不能让命令停留在 pending 中，否则 wait() 永远不返回
+        for index, command in items:
+            try:
+                error = self.validate(command) if self.validate else None
+            except Exception as e:
+                error = f"validation failed: {e}"
+            if error:
+                print(f"[ERROR] Rejected command {command}: {error}")
+                now = time.time()
+                self.finish([(index, command)], f"rejected: {error}", now, now)
+            else:
+                valid.append((index, command))
+        try:
+            groups = coalesce(valid, can_merge) if can_merge else [[item] for item in valid]
+        except Exception as e:
+            print(f"[ERROR] Failed to coalesce commands, executing them one by one: {e}")
+            groups = [[item] for item in valid]
+        for group in groups:
+            self.executor.enqueue(self, group)
+        return [index for index, _ in items]
+
+    def run(self, group):
+        if len(group) == 1:
+            command = group[0][1]
+        else:
+            # 合并后的命令：target_device 为实体列表，其余字段各命令相同
+            command = dict(group[0][1], target_device=[c["target_device"] for _, c in group])
+        start = time.time()
+        try:
+            self.executor.execute(command)
+            status = "success"
+        except Exception as e:
+            print(f"[ERROR] Execution error: {e}")
+            status = f"error: {str(e)}"
+        self.finish(group, status, start, time.time())
+
+    def finish(self, group, status, start, end):
+        """记录一组命令的结果并逐条回调 on_executed"""
+        results = []
+        for index, member in group:
+            results.append({
+                "index": index,
+                "service": member.get("service") if isinstance(member, dict) else None,
+                "target_device": member.get("target_device") if isinstance(member, dict) else None,
+                "status": status,
+                "started": round(start - self.started_at, 3),
+                "duration": round(end - start, 3),
+                "coalesced": len(group),
+            })
+            if self.on_executed:
+                with self.callback_lock:
+                    try:
+                        self.on_executed(index, member, status)
+                    except Exception as e:
+                        print(f"[ERROR] on_executed callback failed: {e}")
+        with self.lock:
+            for result in results:
+                self.results[result["index"]] = result
+                self.finished.append(result["index"])
+            self.pending -= len(group)
+            self.done.notify_all()
+
+    def wait(self, timeout=None):
+        """等待已提交的命令全部执行完，按提交顺序返回每条命令的结果"""
+        with self.lock:
+            self.done.wait_for(lambda: self.pending == 0, timeout)
+            return list(self.results)
+
+    def snapshot(self):
+        """当前每条命令的结果，尚未执行完的命令 status 为 'queued'"""
+        with self.lock:
+            return [result or {
+                "index": index,
+                "service": command.get("service") if isinstance(command, dict) else None,
+                "target_device": command.get("target_device") if isinstance(command, dict) else None,
+                "status": "queued",
+            } for index, (command, result) in enumerate(zip(self.commands, self.results))]
+
+    def follow(self, on_result):
+        """
+        按完成顺序对每条命令回调 on_result(result, remaining)（调用前已完成的命令先补发），
+        remaining 为尚未完成的命令数；全部完成后返回结果。用于先回复、后推送执行结果
+        """
+        seen = 0
+        while True:
+            with self.lock:
+                self.done.wait_for(lambda: len(self.finished) > seen or self.pending == 0)
+                fresh = [self.results[index] for index in self.finished[seen:]]
+                seen = len(self.finished)
+                remaining = len(self.results) - seen
+            for offset, result in enumerate(fresh, 1):
+                on_result(result, remaining + len(fresh) - offset)
+            if remaining == 0:
+                return self.wait()
@@ -0,0 +1,83 @@
+'''
+增量命令解析
+LLM 流式输出时逐段喂入 delta，```homeassistant 代码块中的每一行 JSON 在换行到达时立即解析出来，
+不必等整段回复结束。解析规则与 VoicePipeline.parse_response 一致：代码块内一行一条命令，解析失败的行跳过。
+唯一的区别在没有闭合的代码块（回复被截断、达到 max_tokens）：parse_response 整块丢弃，
+这里已经换行的命令在到达时就已执行、无法收回，只丢弃末尾没有换行的半行（可能是被截断的 JSON）。
+'''
+import json
+
+FENCE_OPEN = "```homeassistant\n"
+FENCE_CLOSE = "```"
+
+
+def render_content(reply, commands):
+    """把回复文本和命令列表拼成 LLM 自由文本模式的格式（回复 + homeassistant 代码块）"""
+    if not commands:
+        return reply
+    lines = "\n".join(json.dumps(cmd, ensure_ascii=False) for cmd in commands)
+    return f"{reply}\n{FENCE_OPEN}{lines}\n{FENCE_CLOSE}"
+
+
+class IncrementalCommandParser:
+    def __init__(self):
+        self.parts = []      # 完整回复文本
+        self.buffer = ""     # 尚未消费的文本
+        self.in_block = False
+        self.commands = []
+
+    @property
+    def content(self):
+        return "".join(self.parts)
+
+    def feed(self, delta):
+        """喂入一段增量文本，返回其中新闭合的命令列表"""
+        if not delta:
+            return []
+        self.parts.append(delta)
+        self.buffer += delta
+        completed = []
+        while True:
+            if not self.in_block:
+                idx = self.buffer.find(FENCE_OPEN)
+                if idx < 0:
+                    # 只保留可能是代码块起始标记前缀的尾部
+                    self.buffer = self.buffer[-(len(FENCE_OPEN) - 1):]
+                    break
+                self.buffer = self.buffer[idx + len(FENCE_OPEN):]
+                self.in_block = True
+            else:
+                nl = self.buffer.find("\n")
+                if nl < 0:
+                    break
+                line = self.buffer[:nl]
+                self.buffer = self.buffer[nl + 1:]
+                self.consume_line(line, completed)
+        return completed
+
+    def close(self):
+        """
+        输出结束：只剩闭合标记（最后没有换行）时正常结束代码块；
+        代码块没有闭合时末尾的半行不执行
+        """
+        rest = self.buffer.strip()
+        if self.in_block and not rest.startswith(FENCE_CLOSE):
+            print(f"[WARNING] Unterminated homeassistant block, ignoring: {rest[:200]!r}")
+        self.buffer = ""
+        self.in_block = False
+
+    def consume_line(self, line, completed):
+        line = line.strip()
+        if not line:
+            return
+        if line.startswith(FENCE_CLOSE):
+            self.in_block = False
+            return
+        try:
+            command = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"[WARNING] Failed to parse command: {line}")
+            print(f"[WARNING] JSON Error: {e}")
+            return
+        self.commands.append(command)
+        completed.append(command)
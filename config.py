@@ -2,6 +2,7 @@
 import os
 import yaml
 from dotenv import load_dotenv
+from service_registry import SERVICE_REGISTRY
 
 # 加载.env环境变量
 load_dotenv()
@@ -9,10 +10,61 @@ load_dotenv()
 # API配置
 HA_BASE_URL = os.getenv("HA_BASE_URL", "http://localhost:8123")
 HA_TOKEN = os.getenv("HA_TOKEN", "")
+HA_TRANSPORT = os.getenv("HA_TRANSPORT", "rest")  # rest: 每次调用一个 HTTP 请求; websocket: 复用一条鉴权后的 WebSocket 长连接
+HA_WS_URL = os.getenv("HA_WS_URL", "")  # 为空时由 HA_BASE_URL 推出（ws://<host>/api/websocket）
+HA_STATE_MIRROR = os.getenv("HA_STATE_MIRROR", "false").lower() == "true"  # 通过 WebSocket 事件在内存中镜像实体状态，状态查询不再请求 HA
+HA_MIRROR_MAX_STALE = float(os.getenv("HA_MIRROR_MAX_STALE", "30"))  # 与 HA 断开超过该秒数后状态查询回退到请求 HA
 ASR_API_URL = os.getenv("ASR_API_URL", "http://localhost:8001/recognize")
+ASR_STREAM_URL = os.getenv("ASR_STREAM_URL", "")  # 增量 ASR 服务地址，为空时流式上传仍整段识别
+ASR_STREAM_WORKERS = int(os.getenv("ASR_STREAM_WORKERS", "4"))
+ASR_DEBUG_DIR = os.getenv("ASR_DEBUG_DIR", "")  # 非空时把每条语音归档到该目录（仅调试用）
+ASR_DEBUG_MAX_FILES = int(os.getenv("ASR_DEBUG_MAX_FILES", "100"))  # 归档文件数量上限
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
-LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://localhost:8000/v1")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://localhost:8000/v1")  # 多个推理服务用逗号分隔，启用对冲路由
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "")  # 非空时按复杂度分档：简单控制指令使用该模型
+LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "") or LLM_MODEL  # 提问、多步骤等请求使用的模型
+PROMPT_TOP_K = int(os.getenv("PROMPT_TOP_K", "16"))  # 每次请求只把最相关的 k 个设备写进提示词，0 表示总是使用完整提示词
+PROMPT_PRUNE_SERVICES = os.getenv("PROMPT_PRUNE_SERVICES", "false").lower() == "true"  # 同时裁剪服务列表（牺牲稳定前缀）
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "off")  # off: 自由文本 + 代码块; json_schema: response_format; tools: 强制工具调用
+STRUCTURED_MAX_TOKENS = int(os.getenv("STRUCTURED_MAX_TOKENS", "256"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))  # >0 时启用 LLM 调度器，同时发往推理服务的请求上限
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "5"))  # 调度器收集同批请求的时间窗口
+LLM_MAX_BATCH = int(os.getenv("LLM_MAX_BATCH", "8"))
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() == "true"  # 流式解码，命令一生成完就执行
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # 单次 LLM 请求超时（秒）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # 连接失败 / 限流 / 5xx 时的重试次数
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "false").lower() == "true"  # 流式请求带 stream_options.include_usage，推理服务支持时开启
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9"))  # 主节点超过其该分位延迟未响应时对冲到下一个节点，0 表示不对冲
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "500"))  # 延迟样本不足时的对冲等待时间
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "50"))  # 对冲等待时间下限
+LLM_EJECT_AFTER = int(os.getenv("LLM_EJECT_AFTER", "2"))  # 连续失败多少次后摘除节点
+LLM_PROBE_INTERVAL = float(os.getenv("LLM_PROBE_INTERVAL", "10"))  # 被摘除节点的探测间隔（秒）
+
+# HTTP 连接池配置（ASR / Home Assistant 共享 keep-alive 连接）
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # 缓存的主机连接池数量
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))  # 每个主机的最大连接数
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "true").lower() == "true"  # 达到上限时排队等待而不是新建连接
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.1"))
+HTTP_PRECONNECT = os.getenv("HTTP_PRECONNECT", "true").lower() == "true"  # 启动时预先建立连接
+
+# 服务器配置
+SERVER_MODE = os.getenv("SERVER_MODE", "thread")  # thread: 每连接一个线程; async: asyncio 单进程
+ASYNC_IO_WORKERS = int(os.getenv("ASYNC_IO_WORKERS", "16"))  # ASR/LLM/HA 阻塞调用并发上限
+ASYNC_CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", "2"))
+
+# 快速通道：常见指令由 devices.yaml 编译出的规则直接匹配，不调用 LLM
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+EXEC_MAX_IN_FLIGHT = int(os.getenv("EXEC_MAX_IN_FLIGHT", "4"))  # 同时在途的 HA 服务调用上限；不同实体的命令并发执行
+EXEC_COALESCE = os.getenv("EXEC_COALESCE", "true").lower() == "true"  # 服务和参数相同的命令合并为一次 HA 调用
+EXEC_VALIDATE_ENTITIES = os.getenv("EXEC_VALIDATE_ENTITIES", "true").lower() == "true"  # 调用 HA 前按 devices.yaml 校验 / 修正实体 ID
+EXEC_OPTIMISTIC_ACK = os.getenv("EXEC_OPTIMISTIC_ACK", "false").lower() == "true"  # 命令校验通过、进入队列即回复 SUCCESS，执行结果随后用 EXECUTION_RESULT 推送
+
+# 意图缓存：相同指令直接复用上次 LLM 的结果
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "256"))  # 最大条目数，0 表示关闭
+INTENT_CACHE_TTL = int(os.getenv("INTENT_CACHE_TTL", "86400"))  # 有效期（秒）
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH", "")  # 非空时持久化到该文件，重启后仍可命中
 
 # 读取设备配置
 def load_device_config(path="devices.yaml"):
@@ -21,30 +73,43 @@ def load_device_config(path="devices.yaml"):
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-DEVICE_CONFIG = load_device_config()
+DEVICE_CONFIG_PATH = "devices.yaml"
+DEVICE_CONFIG = load_device_config(DEVICE_CONFIG_PATH)
+# 热加载：每隔这么多秒检查 devices.yaml 是否修改，修改后在后台重建提示词和设备索引，不必重启服务（0 表示关闭）
+CONFIG_RELOAD_INTERVAL = float(os.getenv("CONFIG_RELOAD_INTERVAL", "2"))
 
 # 根据配置生成 system_prompt
-def generate_system_prompt():
-    services_str = "\n".join(
-        f"{svc['name']}({','.join(svc.get('params', []))})" if svc.get('params') else svc['name']
-        for svc in DEVICE_CONFIG['services']
-    )
-
-    devices_str = "\n".join(
-        f"{dev['id']} '{dev['name']}'"
-        + (f";{dev['brightness']}%" if 'brightness' in dev else "")
-        for dev in DEVICE_CONFIG['devices']
-    )
-
-    return f"""
+PROMPT_HEADER = """
 You are 'm5', a helpful AI Assistant that controls the devices in a house.
 Complete the task as instructed or answer the question with the provided information only.
+""".strip()
+
+
+def format_service(svc):
+    # devices.yaml 没有写参数时，列出服务注册表中登记的参数
+    params = svc.get('params') or ([] if '(' in svc['name'] else SERVICE_REGISTRY.default_params(svc['name']))
+    return f"{svc['name']}({','.join(params)})" if params else svc['name']
+
+
+def format_device(dev):
+    return f"{dev['id']} '{dev['name']}'" + (f";{dev['brightness']}%" if 'brightness' in dev else "")
+
+
+def render_system_prompt(services, devices):
+    """按固定格式拼接提示词：头部和服务列表在前（稳定前缀），设备列表在后"""
+    services_str = "\n".join(format_service(svc) for svc in services)
+    devices_str = "\n".join(format_device(dev) for dev in devices)
+    return f"""{PROMPT_HEADER}
 
 Services:
 {services_str}
 
 Devices:
-{devices_str}
-""".strip()
+{devices_str}"""
+
+
+def generate_system_prompt(config=None):
+    config = config if config is not None else DEVICE_CONFIG
+    return render_system_prompt(config['services'], config['devices'])
 
 SYSTEM_PROMPT = generate_system_prompt()
\ No newline at end of file
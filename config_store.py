@@ -0,0 +1,98 @@
+'''
+设备配置热加载
+后台线程定期检查 devices.yaml 的修改时间和大小，变化后重新读取并交给监听者重建
+（提示词、设备注册表、快速通道等派生结构），整个重建过程不在请求路径上。
+文件格式错误或重建失败时保留旧配置并打印原因，修正文件后会再次尝试。
+'''
+import os
+import threading
+import time
+import yaml
+
+# 有 libyaml 时用 C 实现解析，几千个设备的文件快一个数量级
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def validate_device_config(config):
+    """只检查结构，具体的设备 / 服务内容由注册表解析"""
+    if not isinstance(config, dict):
+        raise ValueError("top level must be a mapping")
+    for key in ("devices", "services"):
+        items = config.get(key)
+        if not isinstance(items, list):
+            raise ValueError(f"'{key}' must be a list")
+        for item in items:
+            if not isinstance(item, dict) or not item.get("id" if key == "devices" else "name"):
+                raise ValueError(f"invalid entry in '{key}': {item}")
+
+
+class ConfigStore:
+    def __init__(self, path, config, interval=2.0):
+        """
+        :param config: 启动时已读取的配置（config.DEVICE_CONFIG），作为版本 1
+        :param interval: 检查文件的间隔（秒），0 表示不检查
+        """
+        self.path = path
+        self.config = config
+        self.interval = interval
+        self.version = 1
+        self.listeners = []     # 配置变化后调用 listener(config, version)，抛出异常表示拒绝该配置
+        self.stamp = self.file_stamp()
+        self.lock = threading.Lock()
+        self.watcher = None
+
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        if self.interval <= 0 or self.watcher:
+            return
+        self.watcher = threading.Thread(target=self.watch_loop, name="config-watch", daemon=True)
+        self.watcher.start()
+        print(f"[CONFIG] Watching {self.path} every {self.interval}s")
+
+    def watch_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[CONFIG] Check failed: {e}")
+
+    def check(self):
+        """文件有变化时重新加载；返回是否加载了新配置"""
+        stamp = self.file_stamp()
+        if stamp is None or stamp == self.stamp:
+            return False
+        return self.reload(stamp)
+
+    def reload(self, stamp=None):
+        with self.lock:
+            stamp = stamp or self.file_stamp()
+            self.stamp = stamp
+            start = time.time()
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    config = yaml.load(f, Loader=YAML_LOADER)
+                validate_device_config(config)
+            except (OSError, yaml.YAMLError, ValueError) as e:
+                print(f"[CONFIG] Ignoring invalid {self.path}, keeping version {self.version}: {e}")
+                return False
+            if config == self.config:
+                return False
+            version = self.version + 1
+            try:
+                for listener in list(self.listeners):
+                    listener(config, version)
+            except Exception as e:
+                print(f"[CONFIG] Failed to apply {self.path}, keeping version {self.version}: {e}")
+                return False
+            self.config = config
+            self.version = version
+        print(f"[CONFIG] Loaded {self.path} version {version}: {len(config['devices'])} devices, "
+              f"{len(config['services'])} services ({(time.time() - start) * 1000:.1f} ms)")
+        return True
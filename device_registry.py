@@ -0,0 +1,157 @@
+'''
+设备注册表
+把 devices.yaml 规范化为便于检索的结构：实体、服务（含参数）、按 domain 分组，
+以及设备名称/别名/房间词组到实体 ID 的短语索引。
+'''
+import re
+from config import DEVICE_CONFIG
+from service_registry import SERVICE_REGISTRY
+
+_PUNCT = str.maketrans({p: " " for p in r"""!"#$%&()*+,-./:;<=>?@[\]^_`{|}~"""})
+
+# 各 domain 在口语中的常见叫法，用于在没有房间词时确定设备类型
+DOMAIN_WORDS = {
+    "light": ("light", "lights", "lamp", "lamps", "bulb", "bulbs"),
+    "cover": ("curtain", "curtains", "blind", "blinds", "shade", "shades", "shutter", "shutters", "cover", "covers",
+              "garage door", "garage"),
+    "fan": ("fan", "fans"),
+    "climate": ("ac", "a c", "air conditioner", "air conditioning", "aircon", "thermostat", "heating", "climate"),
+    "lock": ("lock", "locks", "door", "doors"),
+    "media_player": ("speaker", "speakers", "tv", "television", "music", "player", "media"),
+    "switch": ("switch", "switches", "plug", "plugs", "socket", "outlet"),
+}
+
+
+def normalize(s: str) -> str:
+    """小写、去标点、合并空白"""
+    return " ".join(s.lower().translate(_PUNCT).split())
+
+
+def parse_service(spec):
+    """
+    解析 services 条目，兼容两种写法：
+      - name: light.turn_on(rgb_color,brightness)
+      - name: light.turn_on
+        params: ["rgb_color", "brightness"]
+    都没有写参数时使用服务注册表中登记的参数
+    :return: (service_name, [params])
+    """
+    name = spec["name"].strip()
+    params = list(spec.get("params") or [])
+    m = re.match(r"^([\w.]+)\((.*)\)$", name)
+    if m:
+        name = m.group(1)
+        params += [p.strip() for p in m.group(2).split(",") if p.strip()]
+    elif not params:
+        params = SERVICE_REGISTRY.default_params(name)
+    return name, params
+
+
+class Device:
+    __slots__ = ("id", "domain", "object_id", "name", "aliases", "attributes", "phrases", "spec")
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.id = spec["id"]
+        self.domain, _, self.object_id = self.id.partition(".")
+        self.name = str(spec.get("name") or self.object_id.replace("_", " "))
+        aliases = spec.get("aliases") or []
+        self.aliases = [aliases] if isinstance(aliases, str) else list(aliases)
+        self.attributes = {k: v for k, v in spec.items() if k not in ("id", "name", "aliases")}
+        self.phrases = self.build_phrases()
+
+    def build_phrases(self):
+        """设备可被称呼的所有短语：名称、别名、实体ID，以及去掉类型词后的房间名"""
+        phrases = set()
+        domain_words = set(DOMAIN_WORDS.get(self.domain, ()))
+        for raw in [self.name, self.object_id.replace("_", " ")] + self.aliases:
+            text = normalize(str(raw))
+            if not text:
+                continue
+            phrases.add(text)
+            words = text.split()
+            stripped = [w for w in words if w not in domain_words]
+            if stripped and len(stripped) < len(words):
+                phrases.add(" ".join(stripped))
+        # 同时收录去空格形式，使 "living room" 能匹配 "livingroom"
+        phrases |= {p.replace(" ", "") for p in phrases}
+        return phrases
+
+
+class DeviceRegistry:
+    def __init__(self, config=None):
+        config = config if config is not None else DEVICE_CONFIG
+        self.devices = {}
+        self.by_domain = {}
+        self.services = {}
+        self.phrase_index = {}
+        self.service_specs = list(config.get("services") or [])
+
+        for spec in self.service_specs:
+            name, params = parse_service(spec)
+            self.services[name] = params
+
+        for spec in config.get("devices") or []:
+            device = Device(spec)
+            self.devices[device.id] = device
+            self.by_domain.setdefault(device.domain, []).append(device)
+            for phrase in device.phrases:
+                self.phrase_index.setdefault(phrase, set()).add(device.id)
+
+        # 文本中出现的类型词 -> domain
+        self.domain_words = {}
+        for domain, words in DOMAIN_WORDS.items():
+            for word in words:
+                self.domain_words.setdefault(word, set()).add(domain)
+
+        # 至少看 3 个词，口语里 "living room" 这样的分写要拼起来匹配 "livingroom"
+        self.max_phrase_words = max(3, max((len(p.split()) for p in self.phrase_index), default=1))
+
+    def has_service(self, service):
+        return service in self.services
+
+    def service_params(self, service):
+        return self.services.get(service, [])
+
+    def group_members(self, service, target):
+        """组目标 -> 注册表中该 domain 的全部实体 ID
+        "light.all" 取 light；"all" 取服务所在的 domain。不是组目标或该 domain 没有设备时返回 None
+        """
+        if not isinstance(service, str) or not isinstance(target, str):
+            return None
+        domain, _, name = target.rpartition(".")
+        if name != "all":
+            return None
+        devices = self.by_domain.get(domain or service.split(".", 1)[0])
+        return [device.id for device in devices] if devices else None
+
+    def mentioned_domains(self, words):
+        """文本中通过类型词（light / curtain / ac ...）提到的 domain"""
+        domains = set()
+        for size in (2, 1):
+            for i in range(len(words) - size + 1):
+                domains |= self.domain_words.get(" ".join(words[i:i + size]), set())
+        return domains
+
+    def find_phrases(self, words):
+        """
+        在分词后的文本中查找设备短语（最长匹配、互不重叠）
+        :return: [(start, end, {entity_ids})]
+        """
+        matches = []
+        i = 0
+        n = len(words)
+        while i < n:
+            found = None
+            for size in range(min(self.max_phrase_words, n - i), 0, -1):
+                gram = words[i:i + size]
+                ids = self.phrase_index.get(" ".join(gram)) or self.phrase_index.get("".join(gram))
+                if ids:
+                    found = (i, i + size, ids)
+                    break
+            if found:
+                matches.append(found)
+                i = found[1]
+            else:
+                i += 1
+        return matches
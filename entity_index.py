@@ -0,0 +1,123 @@
+'''
+实体索引：在调用 HA 之前校验或修正 LLM 给出的 target_device
+LLM 偶尔会自己"编"实体 ID（light.living_room，实际是 light.livingroom），原来要等 HA 返回 400
+才知道。这里由设备注册表编译出：
+  - 实体 ID 哈希表：命中即合法，O(1)
+  - 紧凑名称表：(domain, 去掉空格/下划线/标点的名称、别名、实体ID) -> 实体，O(1) 修正分写、大小写差异
+  - 词集合表：(domain, 排序后的词) -> 实体，O(1) 修正词序颠倒（light.room_living）
+  - 三元组（trigram）倒排索引：拼写错误时按相似度（Dice 系数）找最接近的实体，
+    用前缀过滤只取最少的候选，几千个实体时仍是微秒级
+  - 每个实体支持的服务：devices.yaml 中该 domain 声明的服务（含登记的别名服务）
+相似度不够高或有两个同样接近的实体时不做猜测，返回 None。
+'''
+import math
+import re
+from device_registry import DeviceRegistry, normalize
+from service_registry import SERVICE_REGISTRY
+
+MIN_SIMILARITY = 0.6    # Dice 系数低于该值不修正
+MIN_MARGIN = 0.1        # 最接近的两个实体相似度相差不足该值时视为有歧义
+NUMBER_RE = re.compile(r"\d+")
+
+
+def trigrams(text):
+    padded = f" {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class EntityIndex:
+    def __init__(self, registry=None, min_similarity=MIN_SIMILARITY):
+        self.registry = registry or DeviceRegistry()
+        self.min_similarity = min_similarity
+        self.devices = self.registry.devices
+        self.compact = {}       # (domain, 紧凑名称) -> {entity_id}
+        self.token_sets = {}    # (domain, 排序后的词) -> {entity_id}
+        self.keys = []          # [(entity_id, trigrams, 名称中的编号)]
+        self.postings = {}      # (domain, trigram) -> [key 序号]
+        for device in self.devices.values():
+            for phrase in device.phrases:
+                if " " in phrase:
+                    self.token_sets.setdefault((device.domain, tuple(sorted(phrase.split()))), set()).add(device.id)
+                    continue
+                self.compact.setdefault((device.domain, phrase), set()).add(device.id)
+                grams = trigrams(phrase)
+                for gram in grams:
+                    self.postings.setdefault((device.domain, gram), []).append(len(self.keys))
+                self.keys.append((device.id, grams, NUMBER_RE.findall(phrase)))
+
+        # domain -> 支持的服务；devices.yaml 没有声明该 domain 的服务时不限制（None）
+        declared = {}
+        for service in self.registry.services:
+            declared.setdefault(service.split(".", 1)[0], set()).add(service)
+        for service in SERVICE_REGISTRY.services.values():
+            if f"{service.ha_domain}.{service.ha_service}" in declared.get(service.domain, ()):
+                declared[service.domain].add(service.name)
+        self.domain_services = {domain: frozenset(services | {f"{domain}.get_state"})
+                                for domain, services in declared.items()}
+
+    def supported_services(self, entity_id):
+        """实体支持的服务；未知实体或不限制时返回 None"""
+        device = self.devices.get(entity_id)
+        return self.domain_services.get(device.domain) if device else None
+
+    def supports(self, entity_id, service):
+        if not isinstance(service, str):
+            return False
+        domain = service.split(".", 1)[0]
+        if domain == "homeassistant":
+            return True     # homeassistant.turn_on 等通用服务适用于任何实体
+        services = self.supported_services(entity_id)
+        if services is None:
+            return domain == entity_id.split(".", 1)[0]
+        return service in services
+
+    def resolve(self, target, service=None):
+        """
+        :param service: 命令的服务名；target 的 domain 下没有设备时（如 lights.xxx）按服务的 domain 查找
+        :return: 注册表中的实体 ID（target 本身合法时原样返回）；无法确定时返回 None
+        """
+        if not isinstance(target, str):
+            return None
+        if target in self.devices:
+            return target
+        domain, _, name = target.rpartition(".")
+        if domain not in self.registry.by_domain:
+            domain = service.split(".", 1)[0] if isinstance(service, str) else None
+            if domain not in self.registry.by_domain:
+                return None
+        words = normalize(name).split()
+        if not words:
+            return None
+        ids = self.compact.get((domain, "".join(words))) or self.token_sets.get((domain, tuple(sorted(words))))
+        if ids:
+            return next(iter(ids)) if len(ids) == 1 else None
+        return self.closest(domain, "".join(words))
+
+    def closest(self, domain, key):
+        """
+        三元组相似度最高且没有歧义的实体
+        编号只差一个字符（bedroom_2 / bedroom_9）时相似度几乎相同，因此编号必须完全一致才算候选
+        """
+        grams = trigrams(key)
+        numbers = NUMBER_RE.findall(key)
+        # 前缀过滤：相似度达到阈值的实体至少与查询共享 need 个三元组，
+        # 因此必然出现在最稀有的 len(grams) - need + 1 个三元组的倒排表中
+        need = math.ceil(self.min_similarity * len(grams) / (2 - self.min_similarity))
+        postings = sorted((self.postings.get((domain, gram), ()) for gram in grams), key=len)
+        candidates = set()
+        for posting in postings[:len(grams) - need + 1]:
+            candidates.update(posting)
+        best = {}
+        for i in candidates:
+            entity_id, key_grams, key_numbers = self.keys[i]
+            if key_numbers != numbers:
+                continue
+            score = 2 * len(grams & key_grams) / (len(grams) + len(key_grams))
+            if score > best.get(entity_id, 0.0):
+                best[entity_id] = score
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < self.min_similarity:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < MIN_MARGIN:
+            return None
+        return ranked[0][0]
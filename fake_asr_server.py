@@ -0,0 +1,141 @@
+'''
+本地替身 ASR 服务（离线测试用）
+不做真正的识别：对任何音频都返回 --text 指定的文本，并按收到的音频时长逐词给出中间结果。
+同时实现整段识别接口和 asr.py 使用的增量接口：
+  POST /recognize                  multipart 字段 audio（WAV）       -> {"text"}
+  POST /stream/start               {"sample_rate", "channels"}       -> {"session_id"}
+  POST /stream/<id>/chunk          原始 PCM                          -> {"partial"}
+  POST /stream/<id>/finish                                           -> {"text"}
+
+用法：python fake_asr_server.py --port 8001 --text "turn on the kitchen light" --rtf 0.1
+然后在 .env 中设置 ASR_API_URL=http://127.0.0.1:8001/recognize  ASR_STREAM_URL=http://127.0.0.1:8001/stream
+'''
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FakeAsrState:
+    def __init__(self, text, rtf=0.0, words_per_second=3.0, finish_latency=0.005, session_ttl=60):
+        self.text = text
+        self.rtf = rtf                            # 实时率：处理 1 秒音频耗时 rtf 秒
+        self.words_per_second = words_per_second  # 中间结果按该语速逐词展开
+        self.finish_latency = finish_latency
+        self.session_ttl = session_ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def audio_seconds(self, nbytes, sample_rate=16000, channels=1):
+        return nbytes / float(sample_rate * channels * 2)
+
+    def partial_for(self, seconds):
+        words = self.text.split()
+        count = min(len(words), int(seconds * self.words_per_second))
+        return " ".join(words[:count])
+
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            for sid in [sid for sid, sess in self.sessions.items() if now - sess['updated'] > self.session_ttl]:
+                del self.sessions[sid]
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # 头和正文分两次写出，避免与延迟 ACK 叠加出 40ms 停顿
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, code, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length', 0))
+            return self.rfile.read(length) if length else b''
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            body = self.read_body()
+            parts = [p for p in self.path.split('/') if p]
+
+            if parts == ['recognize']:
+                # 粗略估算 WAV 中的 PCM 长度（multipart 开销可忽略）
+                time.sleep(state.rtf * state.audio_seconds(max(0, len(body) - 44)))
+                return self.reply(200, {'text': state.text})
+
+            if parts == ['stream', 'start']:
+                params = json.loads(body or b'{}')
+                sid = uuid.uuid4().hex
+                with state.lock:
+                    state.sessions[sid] = {
+                        'bytes': 0,
+                        'sample_rate': params.get('sample_rate', 16000),
+                        'channels': params.get('channels', 1),
+                        'updated': time.time(),
+                    }
+                state.expire()
+                return self.reply(200, {'session_id': sid})
+
+            if len(parts) == 3 and parts[0] == 'stream':
+                sid, action = parts[1], parts[2]
+                with state.lock:
+                    sess = state.sessions.get(sid)
+                if sess is None:
+                    return self.reply(404, {'error': 'unknown session'})
+
+                if action == 'chunk':
+                    time.sleep(state.rtf * state.audio_seconds(len(body), sess['sample_rate'], sess['channels']))
+                    sess['bytes'] += len(body)
+                    sess['updated'] = time.time()
+                    seconds = state.audio_seconds(sess['bytes'], sess['sample_rate'], sess['channels'])
+                    return self.reply(200, {'partial': state.partial_for(seconds)})
+
+                if action == 'finish':
+                    time.sleep(state.finish_latency)
+                    with state.lock:
+                        state.sessions.pop(sid, None)
+                    return self.reply(200, {'text': state.text})
+
+            self.reply(404, {'error': 'not found'})
+
+    return Handler
+
+
+def start_fake_asr(host='127.0.0.1', port=8001, **kwargs):
+    """在后台线程启动替身服务，返回 (server, state)；测试结束后调用 server.shutdown()"""
+    state = FakeAsrState(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake streaming ASR server for offline testing")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--text', default='turn on the living room light')
+    parser.add_argument('--rtf', type=float, default=0.1, help='模拟的实时率（识别耗时 / 音频时长）')
+    args = parser.parse_args()
+
+    state = FakeAsrState(args.text, rtf=args.rtf)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f" Fake ASR server on {args.host}:{args.port} (text={args.text!r}, rtf={args.rtf})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
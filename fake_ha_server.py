@@ -0,0 +1,529 @@
+'''
+本地替身 Home Assistant（离线功能测试与压测用）
+在同一个端口上同时提供 REST 和 WebSocket API：
+  POST /api/services/<domain>/<service>   -> 变化后的状态列表；服务不存在 / 参数不合法时 400
+  GET  /api/states/<entity_id>            -> 状态（不存在时 404）
+  GET  /api/states                        -> 全部状态
+  POST /api/states/<entity_id>            {"state", "attributes"}，直接设置状态（模拟设备在 HA 之外被操作）
+  GET  /api/fake/stats                    替身自身的统计：调用数、注入的错误 / 超时数
+  GET  /api/websocket                     WebSocket：auth、call_service、get_states、subscribe_events、ping
+实体由 devices.yaml 初始化（--devices），light / cover / fan / climate / lock / media_player / switch
+按 HA 的语义改变状态并校验参数（如 brightness 必须是 0-255 的整数），其他 domain 只处理 turn_on / turn_off / toggle。
+延迟与故障注入（--seed 固定随机序列，结果可复现）：
+  --latency-ms 固定处理耗时，--jitter-ms 再叠加指数分布的随机耗时（长尾），--domain-latency-ms 按 domain 额外耗时
+  --error-rate 按概率返回 500，--timeout-rate 按概率卡住 --timeout-ms 后返回 504
+WebSocket 上的请求并发处理，结果可能乱序返回（与真实 HA 相同），客户端需按 id 对应。
+任何状态变化（服务调用、POST /api/states、进程内 state.set_state）都会向订阅者推送 state_changed 事件。
+
+用法：python fake_ha_server.py --port 8123 --token test-token --devices devices.yaml --latency-ms 5 --jitter-ms 5
+然后在 .env 中设置 HA_BASE_URL=http://127.0.0.1:8123  HA_TOKEN=test-token（可选 HA_TRANSPORT=websocket）
+'''
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import yaml
+import websocket_frames
+
+FAN_MODES = ["auto", "low", "medium", "high"]
+HVAC_MODES = ["off", "heat", "cool", "heat_cool", "auto", "dry", "fan_only"]
+
+# 各 domain 的初始状态和属性
+INITIAL_STATES = {
+    "light": ("off", {"supported_color_modes": ["rgb"], "color_mode": None, "brightness": None, "rgb_color": None}),
+    "cover": ("closed", {"current_position": 0}),
+    "fan": ("off", {"percentage": 0, "percentage_step": 25, "preset_mode": None}),
+    "climate": ("cool", {"hvac_modes": HVAC_MODES, "fan_modes": FAN_MODES, "hvac_action": "idle",
+                         "temperature": 24, "current_temperature": 26.5, "fan_mode": "auto"}),
+    "lock": ("locked", {}),
+    "media_player": ("paused", {"volume_level": 0.3, "media_title": None}),
+    "switch": ("off", {}),
+}
+
+
+class ServiceError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def invalid(message):
+    return ServiceError(400, "invalid_format", message)
+
+
+def check_range(data, key, low, high, kind=(int, float)):
+    """参数存在时校验类型和范围，返回该值；不存在时返回 None"""
+    if key not in data:
+        return None
+    value = data[key]
+    if isinstance(value, bool) or not isinstance(value, kind) or not low <= value <= high:
+        raise invalid(f"expected {kind.__name__ if isinstance(kind, type) else 'number'} "
+                      f"between {low} and {high} for dictionary value @ data['{key}']. Got {value!r}")
+    return value
+
+
+def on_off(service, state):
+    """turn_on / turn_off / toggle -> 新状态；其他服务返回 None"""
+    if service == "toggle":
+        return "off" if state == "on" else "on"
+    return {"turn_on": "on", "turn_off": "off"}.get(service)
+
+
+def apply_light(service, state, attrs, data):
+    new = on_off(service, state)
+    if new is None:
+        return None
+    if new == "on":
+        brightness = check_range(data, "brightness", 0, 255, int)
+        attrs["brightness"] = brightness if brightness is not None else attrs.get("brightness") or 255
+        if "rgb_color" in data:
+            rgb = data["rgb_color"]
+            if not isinstance(rgb, list) or len(rgb) != 3 or not all(isinstance(c, int) and 0 <= c <= 255 for c in rgb):
+                raise invalid(f"invalid rgb_color: {rgb!r}")
+            attrs["rgb_color"], attrs["color_mode"] = rgb, "rgb"
+        elif "color_name" in data:
+            attrs["color_mode"] = "rgb"
+        if brightness == 0:
+            new = "off"
+    if new == "off":
+        attrs["brightness"] = None
+    return new
+
+
+def apply_cover(service, state, attrs, data):
+    if service == "toggle":
+        service = "close_cover" if state == "open" else "open_cover"
+    if service == "open_cover":
+        attrs["current_position"] = 100
+        return "open"
+    if service == "close_cover":
+        attrs["current_position"] = 0
+        return "closed"
+    if service == "stop_cover":
+        return state
+    if service == "set_cover_position":
+        position = check_range(data, "position", 0, 100, int)
+        if position is None:
+            raise invalid("required key not provided @ data['position']")
+        attrs["current_position"] = position
+        return "closed" if position == 0 else "open"
+    return None
+
+
+def apply_fan(service, state, attrs, data):
+    step = attrs.get("percentage_step", 25)
+    if service in ("increase_speed", "decrease_speed"):
+        delta = step if service == "increase_speed" else -step
+        attrs["percentage"] = max(0, min(100, (attrs.get("percentage") or 0) + delta))
+        return "on" if attrs["percentage"] else "off"
+    if service == "set_percentage":
+        percentage = check_range(data, "percentage", 0, 100, int)
+        if percentage is None:
+            raise invalid("required key not provided @ data['percentage']")
+        attrs["percentage"] = percentage
+        return "on" if percentage else "off"
+    new = on_off(service, state)
+    if new is not None:
+        attrs["percentage"] = (attrs.get("percentage") or 100) if new == "on" else 0
+    return new
+
+
+def apply_climate(service, state, attrs, data):
+    if service == "set_temperature":
+        temperature = check_range(data, "temperature", 7, 35)
+        if temperature is None:
+            raise invalid("required key not provided @ data['temperature']")
+        attrs["temperature"] = temperature
+        return state
+    if service == "set_fan_mode":
+        if data.get("fan_mode") not in FAN_MODES:
+            raise invalid(f"fan_mode must be one of {FAN_MODES}. Got {data.get('fan_mode')!r}")
+        attrs["fan_mode"] = data["fan_mode"]
+        return state
+    if service == "set_hvac_mode":
+        if data.get("hvac_mode") not in HVAC_MODES:
+            raise invalid(f"hvac_mode must be one of {HVAC_MODES}. Got {data.get('hvac_mode')!r}")
+        return data["hvac_mode"]
+    if service == "turn_on":
+        return "cool" if state == "off" else state
+    if service == "turn_off":
+        return "off"
+    return None
+
+
+def apply_lock(service, state, attrs, data):
+    return {"lock": "locked", "unlock": "unlocked", "open": "open"}.get(service)
+
+
+def apply_media_player(service, state, attrs, data):
+    if service == "volume_set":
+        volume = check_range(data, "volume_level", 0, 1)
+        if volume is None:
+            raise invalid("required key not provided @ data['volume_level']")
+        attrs["volume_level"] = volume
+        return state
+    if service in ("media_next_track", "media_previous_track"):
+        return "playing" if state != "off" else state
+    return {"media_play": "playing", "media_pause": "paused", "media_stop": "idle",
+            "media_play_pause": "paused" if state == "playing" else "playing",
+            "turn_on": "idle", "turn_off": "off"}.get(service)
+
+
+def apply_generic(service, state, attrs, data):
+    new = on_off(service, state)
+    if new is not None:
+        attrs.update({k: v for k, v in data.items() if k != "entity_id"})
+    return new
+
+
+SERVICE_HANDLERS = {
+    "light": apply_light,
+    "cover": apply_cover,
+    "fan": apply_fan,
+    "climate": apply_climate,
+    "lock": apply_lock,
+    "media_player": apply_media_player,
+    "switch": apply_generic,
+}
+
+
+def load_devices(path):
+    """devices.yaml -> [{id, name, ...}]；文件不存在时返回空列表"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return (yaml.safe_load(f) or {}).get('devices') or []
+
+
+class FakeHaState:
+    def __init__(self, token="test-token", latency_ms=0.0, entities=(), devices=(), jitter_ms=0.0,
+                 domain_latency_ms=None, error_rate=0.0, timeout_rate=0.0, timeout_ms=15000.0,
+                 strict=False, seed=None):
+        """
+        :param latency_ms: 每次服务调用的固定处理耗时（毫秒）
+        :param entities: 额外的初始实体 ID
+        :param devices: devices.yaml 中的设备列表，按 domain 初始化状态，name 作为 friendly_name
+        :param jitter_ms: 叠加的随机耗时（指数分布的均值），模拟长尾
+        :param domain_latency_ms: {domain: 额外耗时}，例如 Zigbee 窗帘较慢
+        :param error_rate: 服务调用返回 500 的概率
+        :param timeout_rate: 服务调用卡住 timeout_ms 后返回 504 的概率
+        :param strict: 服务调用指定了不存在的实体时返回 400（真实 HA 会忽略）
+        :param seed: 随机种子，固定后延迟和故障序列可复现
+        """
+        self.token = token
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.domain_latency_ms = dict(domain_latency_ms or {})
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_ms = timeout_ms
+        self.strict = strict
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.states = {}
+        self.stats = Counter()
+        self.listeners = []     # listener(event)，每个订阅了 state_changed 的 WebSocket 一个
+        for device in devices:
+            self.add_entity(device["id"], device.get("name"))
+        for entity_id in entities:
+            self.add_entity(entity_id)
+
+    @property
+    def calls(self):
+        return self.stats["calls"]
+
+    def add_entity(self, entity_id, name=None):
+        state, attributes = INITIAL_STATES.get(entity_id.split(".", 1)[0], ("off", {}))
+        attributes = dict(attributes, friendly_name=name or entity_id.split(".", 1)[-1])
+        return self.set_state(entity_id, state, attributes)
+
+    def set_state(self, entity_id, state, attributes=None):
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        with self.lock:
+            old = self.states.get(entity_id)
+            attrs = dict(old["attributes"]) if old else {"friendly_name": entity_id.split(".", 1)[-1]}
+            attrs.update(attributes or {})
+            new = {
+                "entity_id": entity_id,
+                "state": state,
+                "attributes": attrs,
+                "last_changed": now if not old or old["state"] != state else old["last_changed"],
+                "last_updated": now,
+                "context": {"id": uuid.uuid4().hex, "parent_id": None, "user_id": None},
+            }
+            self.states[entity_id] = new
+            # 持锁推送，保证订阅者看到的事件顺序与状态变化顺序一致
+            event = {
+                "event_type": "state_changed",
+                "data": {"entity_id": entity_id, "old_state": old, "new_state": new},
+                "origin": "LOCAL",
+                "time_fired": now,
+            }
+            for listener in list(self.listeners):
+                listener(event)
+            return new
+
+    def get_state(self, entity_id):
+        with self.lock:
+            return self.states.get(entity_id)
+
+    def all_states(self):
+        with self.lock:
+            return list(self.states.values())
+
+    def inject(self, domain):
+        """按配置等待处理耗时，并按概率注入错误 / 超时"""
+        delay = self.latency_ms + self.domain_latency_ms.get(domain, 0.0)
+        if self.jitter_ms:
+            delay += self.random.expovariate(1.0 / self.jitter_ms)
+        roll = self.random.random()
+        if roll < self.timeout_rate:
+            with self.lock:
+                self.stats["timeouts"] += 1
+            time.sleep(self.timeout_ms / 1000.0)
+            raise ServiceError(504, "timeout", "Injected timeout")
+        if delay:
+            time.sleep(delay / 1000.0)
+        if roll < self.timeout_rate + self.error_rate:
+            with self.lock:
+                self.stats["errors"] += 1
+            raise ServiceError(500, "unknown_error", "Injected failure")
+
+    def call_service(self, domain, service, data):
+        """
+        :return: 变化后的状态列表
+        :raises ServiceError: 服务不存在、参数不合法或注入的故障
+        """
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats[f"{domain}.{service}"] += 1
+        self.inject(domain)
+        entity_ids = data.get("entity_id") or []
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        handler = SERVICE_HANDLERS.get(domain, apply_generic)
+        # 先全部校验再修改，参数不合法时不会只改了一部分实体
+        updates = []
+        for entity_id in entity_ids:
+            old = self.get_state(entity_id)
+            if old is None:
+                if self.strict:
+                    raise ServiceError(400, "not_found", f"Entity {entity_id} not found")
+                continue
+            if entity_id.split(".", 1)[0] != domain:
+                continue
+            attrs = dict(old["attributes"])
+            new = handler(service, old["state"], attrs, data)
+            if new is None:
+                raise ServiceError(400, "service_not_found", f"Service {domain}.{service} not found.")
+            updates.append((entity_id, new, attrs))
+        if not entity_ids and handler(service, "off", {}, data) is None:
+            raise ServiceError(400, "service_not_found", f"Service {domain}.{service} not found.")
+        return [self.set_state(entity_id, new, attrs) for entity_id, new, attrs in updates]
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, code, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def authorized(self):
+            if self.headers.get('Authorization') == f"Bearer {state.token}":
+                return True
+            self.reply(401, {"message": "Unauthorized"})
+            return False
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_GET(self):
+            if self.path == '/api/websocket':
+                return self.websocket()
+            if not self.authorized():
+                return
+            if self.path in ('/api/', '/api'):
+                return self.reply(200, {"message": "API running."})
+            if self.path == '/api/fake/stats':
+                with state.lock:
+                    return self.reply(200, dict(state.stats))
+            if self.path == '/api/states':
+                return self.reply(200, state.all_states())
+            if self.path.startswith('/api/states/'):
+                found = state.get_state(self.path[len('/api/states/'):])
+                return self.reply(200, found) if found else self.reply(404, {"message": "Entity not found."})
+            self.reply(404, {"message": "Not found"})
+
+        def do_POST(self):
+            # 先读完请求体，返回 401 / 404 时 keep-alive 连接上的下一个请求才不会错位
+            try:
+                data = self.read_json()
+            except ValueError:
+                data = None
+            if not self.authorized():
+                return
+            if self.path.startswith('/api/states/') and isinstance(data, dict) and 'state' in data:
+                entity_id = self.path[len('/api/states/'):]
+                return self.reply(200, state.set_state(entity_id, str(data['state']), data.get('attributes')))
+            parts = self.path.strip('/').split('/')
+            if len(parts) != 4 or parts[:2] != ['api', 'services']:
+                return self.reply(404, {"message": "Not found"})
+            if not isinstance(data, dict):
+                return self.reply(400, {"message": "Invalid JSON"})
+            try:
+                changed = state.call_service(parts[2], parts[3], data)
+            except ServiceError as e:
+                return self.reply(e.status, {"message": e.message})
+            self.reply(200, changed)
+
+        # ---------------- WebSocket ----------------
+        def websocket(self):
+            key = self.headers.get('Sec-WebSocket-Key')
+            if not key or self.headers.get('Upgrade', '').lower() != 'websocket':
+                return self.reply(400, {"message": "Expected WebSocket upgrade"})
+            self.send_response(101, 'Switching Protocols')
+            self.send_header('Upgrade', 'websocket')
+            self.send_header('Connection', 'Upgrade')
+            self.send_header('Sec-WebSocket-Accept', websocket_frames.accept_key(key))
+            self.end_headers()
+            self.wfile.flush()
+            self.close_connection = True
+            ws = websocket_frames.WebSocket(self.connection, mask=False)
+            listeners = []
+
+            def send(message):
+                ws.send_text(json.dumps(message))
+
+            try:
+                send({"type": "auth_required", "ha_version": "fake"})
+                auth = json.loads(ws.recv_text())
+                if auth.get("type") != "auth" or auth.get("access_token") != state.token:
+                    send({"type": "auth_invalid", "message": "Invalid access token or password"})
+                    return ws.close()
+                send({"type": "auth_ok", "ha_version": "fake"})
+                while True:
+                    message = json.loads(ws.recv_text())
+                    if message.get("type") == "subscribe_events":
+                        # 订阅在读循环里同步完成，之后的状态变化一定会推送
+                        self.subscribe(message, send, listeners)
+                        continue
+                    # 与真实 HA 一样并发处理，慢的服务调用不阻塞后面的请求
+                    threading.Thread(target=self.handle_ws, args=(message, send), daemon=True).start()
+            except (OSError, ValueError):
+                ws.close()
+            finally:
+                for listener in listeners:
+                    state.listeners.remove(listener)
+
+        def subscribe(self, message, send, listeners):
+            msg_id, event_type = message.get("id"), message.get("event_type")
+
+            def listener(event):
+                if event_type in (None, event["event_type"]):
+                    try:
+                        send({"id": msg_id, "type": "event", "event": event})
+                    except OSError:
+                        pass
+
+            send({"id": msg_id, "type": "result", "success": True, "result": None})
+            listeners.append(listener)
+            state.listeners.append(listener)
+
+        def handle_ws(self, message, send):
+            msg_id, kind = message.get("id"), message.get("type")
+            try:
+                if kind == "ping":
+                    send({"id": msg_id, "type": "pong"})
+                elif kind == "get_states":
+                    send({"id": msg_id, "type": "result", "success": True, "result": state.all_states()})
+                elif kind == "call_service":
+                    data = dict(message.get("service_data") or {})
+                    data.update(message.get("target") or {})
+                    try:
+                        state.call_service(message.get("domain"), message.get("service"), data)
+                    except ServiceError as e:
+                        return send({"id": msg_id, "type": "result", "success": False,
+                                     "error": {"code": e.code, "message": e.message}})
+                    send({"id": msg_id, "type": "result", "success": True,
+                          "result": {"context": {"id": uuid.uuid4().hex, "parent_id": None, "user_id": None}}})
+                else:
+                    send({"id": msg_id, "type": "result", "success": False,
+                          "error": {"code": "unknown_command", "message": f"Unknown command: {kind}"}})
+            except OSError:
+                pass
+
+    return Handler
+
+
+def start_fake_ha(host='127.0.0.1', port=8123, **kwargs):
+    """在后台线程启动替身服务，返回 (server, state)；测试结束后调用 server.shutdown()"""
+    state = FakeHaState(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def parse_domain_latency(text):
+    """cover=1500,lock=300 -> {"cover": 1500.0, "lock": 300.0}"""
+    result = {}
+    for item in filter(None, (text or "").split(',')):
+        domain, _, ms = item.partition('=')
+        result[domain.strip()] = float(ms)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Home Assistant (REST + WebSocket) for offline testing")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--token', default='test-token')
+    parser.add_argument('--devices', default='devices.yaml', help='用其中的设备初始化实体')
+    parser.add_argument('--entities', default='', help='逗号分隔的额外实体 ID')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='每次服务调用的固定处理耗时（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='叠加的随机耗时均值（指数分布，毫秒）')
+    parser.add_argument('--domain-latency-ms', default='', help='按 domain 的额外耗时，如 cover=1500,lock=300')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='服务调用返回 500 的概率')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='服务调用卡住后返回 504 的概率')
+    parser.add_argument('--timeout-ms', type=float, default=15000.0, help='卡住的时间（毫秒）')
+    parser.add_argument('--strict', action='store_true', help='服务调用指定了不存在的实体时返回 400')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    args = parser.parse_args()
+
+    state = FakeHaState(
+        token=args.token, latency_ms=args.latency_ms, entities=filter(None, args.entities.split(',')),
+        devices=load_devices(args.devices), jitter_ms=args.jitter_ms,
+        domain_latency_ms=parse_domain_latency(args.domain_latency_ms), error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, timeout_ms=args.timeout_ms, strict=args.strict, seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"Fake Home Assistant listening on http://{args.host}:{args.port} (WebSocket: /api/websocket), "
+          f"{len(state.states)} entities")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
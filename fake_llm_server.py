@@ -0,0 +1,206 @@
+'''
+本地替身 LLM 服务（OpenAI 兼容，离线测试用）
+不加载模型：用快速通道规则为用户消息生成与真实模型相同格式的回复（回复 + homeassistant 代码块，
+或结构化输出模式下的 {"reply", "commands"}），并按提示词长度和输出长度模拟 prefill / decode 耗时。
+--slots 限制同时处理的请求数，用来模拟推理服务的并发能力；
+--model-decode-ms 按模型名设置不同的 decode 耗时，用来模拟大小模型分档；
+--stall-prob / --stall-ms 按概率让请求卡顿，state.down 置为 True 时所有请求返回 503，用来测试多节点对冲与摘除。
+  POST /v1/chat/completions     支持 stream（含 stream_options.include_usage）、response_format、tools
+  GET  /v1/models               健康探测
+
+用法：python fake_llm_server.py --port 8000 --prefill-ms 0.5 --decode-ms 15 --slots 2
+然后在 .env 中设置 LLM_BASE_URL=http://127.0.0.1:8000/v1
+'''
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from fast_path import FastPathMatcher
+from prompt_builder import estimate_tokens
+
+_PIECE_RE = re.compile(r"\s*\w+|\s*[^\w\s]|\s+")
+
+
+class FakeLlmState:
+    def __init__(self, prefill_ms=0.5, decode_ms=15.0, slots=4, matcher=None, chatter="",
+                 stall_prob=0.0, stall_ms=0.0, model_decode_ms=None):
+        self.prefill_ms = prefill_ms    # 每个提示词 token 的 prefill 耗时
+        self.decode_ms = decode_ms      # 每个输出 token 的 decode 耗时
+        self.slots = threading.BoundedSemaphore(slots)
+        self.matcher = matcher or FastPathMatcher()
+        self.chatter = chatter          # 代码块之后追加的结尾寒暄，用于观察流式执行的收益
+        self.stall_prob = stall_prob    # 请求卡顿的概率（模拟 GC、换页、显存抖动等长尾）
+        self.stall_ms = stall_ms        # 卡顿时额外等待的时间
+        self.down = False               # True 时模拟服务故障，所有请求返回 503
+        self.model_decode_ms = model_decode_ms or {}  # 按请求中的模型名覆盖 decode 耗时，模拟大小模型
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+
+    def answer(self, text):
+        """返回 (reply, commands)"""
+        result = self.matcher.match(text)
+        if result is None:
+            return "Sorry, I can only control the devices in this house.", []
+        return result.reply, result.commands
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, code, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def write_chunk(self, payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip('/') != '/v1/models':
+                return self.reply(404, {'error': {'message': 'not found'}})
+            if state.down:
+                return self.reply(503, {'error': {'message': 'service unavailable'}})
+            self.reply(200, {'object': 'list', 'data': [{'id': 'fake', 'object': 'model', 'owned_by': 'local'}]})
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/chat/completions':
+                return self.reply(404, {'error': {'message': 'not found'}})
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if state.down:
+                return self.reply(503, {'error': {'message': 'service unavailable'}})
+            messages = body.get('messages', [])
+            user_text = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+            prompt_tokens = sum(estimate_tokens(m.get('content') or '') for m in messages)
+
+            reply, commands = state.answer(user_text)
+            structured = 'response_format' in body or 'tools' in body
+            if structured:
+                content = json.dumps({'reply': reply, 'commands': commands}, ensure_ascii=False)
+            else:
+                content = reply
+                if commands:
+                    lines = "\n".join(json.dumps(cmd, ensure_ascii=False) for cmd in commands)
+                    content += f"\n```homeassistant\n{lines}\n```"
+                if state.chatter:
+                    content += "\n" + state.chatter
+            pieces = _PIECE_RE.findall(content)
+            if body.get('max_tokens'):
+                pieces = pieces[:body['max_tokens']]
+
+            with state.slots:
+                with state.lock:
+                    state.requests += 1
+                    state.active += 1
+                    state.peak_active = max(state.peak_active, state.active)
+                try:
+                    if state.stall_prob and random.random() < state.stall_prob:
+                        time.sleep(state.stall_ms / 1000.0)
+                    time.sleep(prompt_tokens * state.prefill_ms / 1000.0)
+                    decode_ms = state.model_decode_ms.get(body.get('model'), state.decode_ms)
+                    if body.get('stream'):
+                        self.stream(body, pieces, decode_ms, prompt_tokens)
+                    else:
+                        time.sleep(len(pieces) * decode_ms / 1000.0)
+                        self.complete(body, "".join(pieces), prompt_tokens, len(pieces))
+                finally:
+                    with state.lock:
+                        state.active -= 1
+
+        def complete(self, body, content, prompt_tokens, completion_tokens):
+            message = {'role': 'assistant', 'content': content}
+            if 'tools' in body:
+                name = body['tools'][0]['function']['name']
+                message = {'role': 'assistant', 'content': None, 'tool_calls': [{
+                    'id': f"call_{uuid.uuid4().hex[:8]}", 'type': 'function',
+                    'function': {'name': name, 'arguments': content},
+                }]}
+            self.reply(200, {
+                'id': f"chatcmpl-{uuid.uuid4().hex[:12]}", 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{'index': 0, 'message': message, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens},
+            })
+
+        def stream(self, body, pieces, decode_ms, prompt_tokens):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            try:
+                for piece in pieces:
+                    time.sleep(decode_ms / 1000.0)
+                    self.write_chunk(json.dumps({
+                        'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                        'model': body.get('model', 'fake'),
+                        'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}],
+                    }))
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    self.write_chunk(json.dumps({
+                        'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                        'model': body.get('model', 'fake'), 'choices': [],
+                        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(pieces),
+                                  'total_tokens': prompt_tokens + len(pieces)},
+                    }))
+                self.write_chunk('[DONE]')
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前关闭连接（对冲落败被取消），停止生成
+                self.close_connection = True
+
+    return Handler
+
+
+def start_fake_llm(host='127.0.0.1', port=8000, **kwargs):
+    """在后台线程启动替身服务，返回 (server, state)；测试结束后调用 server.shutdown()"""
+    state = FakeLlmState(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server for offline testing")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--prefill-ms', type=float, default=0.5, help='每个提示词 token 的 prefill 耗时（毫秒）')
+    parser.add_argument('--decode-ms', type=float, default=15.0, help='每个输出 token 的 decode 耗时（毫秒）')
+    parser.add_argument('--slots', type=int, default=4, help='同时处理的请求数')
+    parser.add_argument('--chatter', default='', help='代码块之后追加的结尾文本')
+    parser.add_argument('--model-decode-ms', default='', help='按模型设置 decode 耗时，如 small=5,large=15')
+    parser.add_argument('--stall-prob', type=float, default=0.0, help='请求卡顿的概率')
+    parser.add_argument('--stall-ms', type=float, default=0.0, help='卡顿时额外等待的时间（毫秒）')
+    args = parser.parse_args()
+
+    model_decode_ms = {}
+    for item in filter(None, args.model_decode_ms.split(',')):
+        name, _, ms = item.partition('=')
+        model_decode_ms[name.strip()] = float(ms)
+    state = FakeLlmState(args.prefill_ms, args.decode_ms, args.slots, chatter=args.chatter,
+                         stall_prob=args.stall_prob, stall_ms=args.stall_ms, model_decode_ms=model_decode_ms)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f" Fake LLM server on {args.host}:{args.port} "
+          f"(prefill={args.prefill_ms}ms/token, decode={args.decode_ms}ms/token, slots={args.slots})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
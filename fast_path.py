@@ -0,0 +1,282 @@
+'''
+快速通道意图匹配
+由 devices.yaml（设备名、别名、服务及参数）编译出的规则匹配器，对规范化后的 ASR 文本做微秒级匹配，
+直接产出与 parse_response 相同格式的 homeassistant 命令，绕过 LLM。
+只要存在歧义（多个候选设备、未声明的服务/参数、疑问句、定时/条件语句等）就返回 None，交给 LLM 处理。
+"all lights" / "everything" 这类组指令按注册表展开为该类型的全部设备，执行时合并为一次 HA 调用。
+'''
+import re
+from command_stream import render_content
+from device_registry import DeviceRegistry, normalize
+
+COLORS = {
+    "red": [255, 0, 0], "green": [0, 255, 0], "blue": [0, 0, 255], "white": [255, 255, 255],
+    "yellow": [255, 255, 0], "orange": [255, 165, 0], "purple": [128, 0, 128], "pink": [255, 192, 203],
+    "cyan": [0, 255, 255], "magenta": [255, 0, 255], "warm white": [255, 214, 170],
+}
+
+FAN_MODES = ("high", "medium", "middle", "low", "auto")
+
+# 出现这些词时不走快速通道：疑问、定时/条件、否定、多步骤
+REJECT_WORDS = {
+    "what", "whats", "is", "are", "how", "why", "when", "which", "who", "does", "do", "can", "could", "should",
+    "if", "after", "before", "until", "minutes", "minute", "seconds", "hours", "hour", "timer", "schedule",
+    "tomorrow", "tonight", "every", "later", "then", "at", "min", "mins", "am", "pm", "sunset", "sunrise",
+    "dont", "don", "not", "never", "no",
+    "instead", "or", "except", "fahrenheit",
+}
+
+# 组指令："all (the) lights"、"everything"
+GROUP_WORDS = {"all", "everything"}
+GROUP_FILLERS = {"the", "of", "my", "our"}
+# 组指令带这些词时范围不确定（"all lights in the kitchen"、"everything except ..."），交给 LLM
+GROUP_QUALIFIERS = {"in", "inside", "outside", "upstairs", "downstairs", "except", "but", "besides", "apart"}
+
+# 可以出现在类型词前面的非修饰词
+FILLER_WORDS = {
+    "the", "a", "an", "my", "our", "this", "that", "please", "set", "turn", "switch", "power", "shut",
+    "on", "off", "open", "close", "lock", "unlock", "toggle", "play", "pause", "stop", "start",
+    "increase", "decrease", "raise", "lower", "change", "make", "dim",
+}
+
+# 两个动作动词之间出现连词（"turn on the light and turn off the fan"）说明是多个意图，交给 LLM
+ACTION_VERBS = {
+    "turn", "switch", "power", "shut", "open", "close", "lock", "unlock", "toggle", "play", "resume", "pause",
+    "stop", "skip", "set", "change", "make", "increase", "decrease", "raise", "lower", "dim", "brighten",
+}
+CONJUNCTIONS = {"and", "also", "plus"}
+
+ANY = "*"
+
+# (正则, {domain: (action, 参数提取函数)}) ，按顺序匹配，先具体后笼统
+def _brightness(m):
+    value = float(next(g for g in m.groups() if g))
+    if value > 100:
+        return None     # "150 percent" 不是合法的百分比，交给 LLM
+    return {"brightness": round(value / 100.0, 2)}
+
+
+def _temperature(m):
+    value = float(m.group(1))
+    return {"temperature": int(value) if value.is_integer() else value}
+
+
+def _fan_mode(m):
+    mode = m.group(1)
+    return {"fan_mode": "medium" if mode == "middle" else mode}
+
+
+def _color(m):
+    return {"rgb_color": list(COLORS[m.group(1)])}
+
+
+def _none(m):
+    return {}
+
+
+_COLOR_RE = "|".join(sorted(COLORS, key=len, reverse=True))
+
+# 规则没有用到时说明有参数会被丢掉（"at 50 percent"、"to red and 30 percent brightness"），交给 LLM
+VALUE_WORDS = {word for color in COLORS for word in color.split()} | {"percent"}
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+INTENT_RULES = [
+    (re.compile(r"\b(?:brightness|bright|brighten|dim)\b.*?\b(\d+(?:\.\d+)?) ?(?:percent|%)|\b(\d+(?:\.\d+)?) ?(?:percent|%)(?: \w+)? brightness\b"),
+     {"light": ("turn_on", _brightness)}),
+    (re.compile(rf"\b(?:to|in|make it) ({_COLOR_RE})\b"), {"light": ("turn_on", _color)}),
+    (re.compile(r"\b(\d+(?:\.\d+)?) ?(?:degrees?|celsius|°)"), {"climate": ("set_temperature", _temperature)}),
+    (re.compile(rf"\bfan (?:speed |mode )?(?:to )?({'|'.join(FAN_MODES)})\b"), {"climate": ("set_fan_mode", _fan_mode)}),
+    (re.compile(r"\b(?:increase|raise|speed up|faster)\b"), {"fan": ("increase_speed", _none)}),
+    (re.compile(r"\b(?:decrease|lower|slow down|slower)\b"), {"fan": ("decrease_speed", _none)}),
+    (re.compile(r"\bunlock\b"), {"lock": ("unlock", _none)}),
+    (re.compile(r"^(?:please )?lock\b"), {"lock": ("lock", _none)}),
+    (re.compile(r"\b(?:pause)\b"), {"media_player": ("media_pause", _none)}),
+    (re.compile(r"\b(?:play|resume)\b"), {"media_player": ("media_play", _none)}),
+    (re.compile(r"\b(?:next (?:song|track)|skip)\b"), {"media_player": ("media_next_track", _none)}),
+    (re.compile(r"\bprevious (?:song|track)\b"), {"media_player": ("media_previous_track", _none)}),
+    (re.compile(r"\b(?:turn|switch|power|shut) (?:\w+ ){0,4}?off\b|\b(?:turn|switch|power|shut) off\b"), {ANY: ("turn_off", _none)}),
+    (re.compile(r"\b(?:turn|switch|power) (?:\w+ ){0,4}?on\b|\b(?:turn|switch|power) on\b"), {ANY: ("turn_on", _none)}),
+    (re.compile(r"\btoggle\b"), {ANY: ("toggle", _none)}),
+    (re.compile(r"\bstop\b"), {"media_player": ("media_stop", _none), "cover": ("stop_cover", _none)}),
+    (re.compile(r"\bopen\b"), {"cover": ("open_cover", _none)}),
+    (re.compile(r"\b(?:close|shut)\b"), {"cover": ("close_cover", _none)}),
+]
+
+REPLY_VERBS = {
+    "turn_on": "Turning on", "turn_off": "Turning off", "toggle": "Toggling",
+    "open_cover": "Opening", "close_cover": "Closing", "stop_cover": "Stopping",
+    "increase_speed": "Increasing the speed of", "decrease_speed": "Decreasing the speed of",
+    "lock": "Locking", "unlock": "Unlocking",
+    "media_play": "Starting playback on", "media_pause": "Pausing", "media_stop": "Stopping",
+    "media_next_track": "Skipping to the next track on", "media_previous_track": "Going back a track on",
+    "set_temperature": "Setting the temperature of", "set_fan_mode": "Setting the fan mode of",
+}
+
+
+def rule_actions(targets):
+    return {action for action, _ in targets.values()}
+
+
+class FastPathResult:
+    __slots__ = ("commands", "reply", "content")
+
+    def __init__(self, commands, reply):
+        self.commands = commands
+        self.reply = reply
+        # 与 LLM 输出同样的格式，下游（日志、客户端、缓存）无需区分来源
+        self.content = render_content(reply, commands)
+
+
+class FastPathMatcher:
+    def __init__(self, registry=None):
+        self.registry = registry or DeviceRegistry()
+        self.domain_words = self.registry.domain_words
+
+    def match(self, text):
+        """匹配成功返回 FastPathResult，否则返回 None（交给 LLM）"""
+        # 先去掉撇号，使 "don't" 规范化为 "dont" 而不是 "don t"；% 会被当作标点去掉，先换成单词
+        text = normalize(text.replace("'", "").replace("\u2019", "").replace("%", " percent"))
+        words = text.split()
+        if not words or REJECT_WORDS.intersection(words):
+            return None
+
+        if self.multiple_actions(words):
+            return None
+        intent = None
+        for pattern, targets in INTENT_RULES:
+            m = pattern.search(text)
+            if not m:
+                continue
+            if intent is None:
+                intent = (m, targets)
+                continue
+            # 其他规则也命中且动作不同（"turn on ... with 50 percent brightness" 两条规则都是 turn_on，不算冲突），
+            # 与第一条规则重叠的命中（"shut off" 中的 "shut"）除外
+            first, first_targets = intent
+            overlaps = m.start() < first.end() and first.start() < m.end()
+            if not overlaps and rule_actions(targets) != rule_actions(first_targets):
+                return None
+        if intent is None:
+            return None
+        m, targets = intent
+        if self.unused_values(words, m):
+            return None
+
+        mentioned = self.registry.mentioned_domains(words)
+        if GROUP_WORDS.intersection(words):
+            devices, names = self.group_devices(words, targets, mentioned)
+        else:
+            devices = self.resolve_devices(words, targets, mentioned)
+            names = " and ".join(device.name for device in devices or ())
+        if not devices:
+            return None
+
+        commands = []
+        for device in devices:
+            action, extract = targets.get(device.domain) or targets[ANY]
+            service = f"{device.domain}.{action}"
+            if not self.registry.has_service(service):
+                return None
+            params = extract(m)
+            if params is None:
+                return None
+            if any(p not in self.registry.service_params(service) for p in params):
+                return None
+            commands.append({"service": service, "target_device": device.id, **params})
+
+        action = commands[0]["service"].split(".", 1)[1]
+        reply = f"{REPLY_VERBS.get(action, 'Running ' + action + ' on')} {names}."
+        return FastPathResult(commands, reply)
+
+    def unused_values(self, words, m):
+        """匹配到的规则之外还有数字、百分比或颜色词（设备名中的除外）"""
+        named = set()
+        for start, end, _ in self.registry.find_phrases(words):
+            named.update(range(start, end))
+        offset = 0
+        for i, word in enumerate(words):
+            inside = m.start() <= offset and offset + len(word) <= m.end()
+            offset += len(word) + 1
+            if not inside and i not in named and (word in VALUE_WORDS or NUMBER_RE.fullmatch(word)):
+                return True
+        return False
+
+    @staticmethod
+    def multiple_actions(words):
+        """连词前后都有动作动词"""
+        verbs = [i for i, word in enumerate(words) if word in ACTION_VERBS]
+        return any(verbs[0] < i < verbs[-1] for i, word in enumerate(words) if word in CONJUNCTIONS)
+
+    def group_devices(self, words, targets, mentioned):
+        """
+        组指令 -> 该类型的全部设备（只保留支持该动作的设备）
+        带房间、设备名等限定（"all bedroom lights"、"all lights in the kitchen"）或提到多种类型时放弃
+        :return: (devices, 回复中的称呼)，无法确定时 devices 为 None
+        """
+        if GROUP_QUALIFIERS.intersection(words):
+            return None, None
+        i = next(i for i, word in enumerate(words) if word in GROUP_WORDS)
+        if words[i] == "everything":
+            if mentioned:
+                return None, None
+            domains, label = set(self.registry.by_domain), "everything"
+        else:
+            j = i + 1
+            while j < len(words) and words[j] in GROUP_FILLERS:
+                j += 1
+            label = next((" ".join(words[j:j + size]) for size in (2, 1)
+                          if " ".join(words[j:j + size]) in self.domain_words), None)
+            if label is None or mentioned != self.domain_words[label]:
+                return None, None
+            domains, label = set(mentioned), f"all {label}"
+        if any(" ".join(words[start:end]) not in self.domain_words
+               for start, end, _ in self.registry.find_phrases(words)):
+            return None, None
+        if ANY not in targets:
+            domains &= set(targets)
+        devices = []
+        for domain in sorted(domains):
+            action, _ = targets.get(domain) or targets[ANY]
+            if self.registry.has_service(f"{domain}.{action}"):
+                devices.extend(self.registry.by_domain.get(domain, []))
+        return devices or None, label
+
+    def qualified(self, words, i):
+        """类型词前面带了不认识的修饰词（如 "bedroom fan"），说明指的可能是别的设备"""
+        return i > 0 and words[i - 1] not in FILLER_WORDS and words[i - 1] not in self.domain_words
+
+    def resolve_devices(self, words, targets, mentioned):
+        """把文本中的设备短语解析为唯一设备；任何一处有歧义就放弃"""
+        allowed = None if ANY in targets else set(targets)
+        devices = []
+        for start, end, ids in self.registry.find_phrases(words):
+            candidates = [self.registry.devices[i] for i in ids]
+            if allowed is not None:
+                candidates = [d for d in candidates if d.domain in allowed]
+            if len(candidates) > 1 and mentioned:
+                narrowed = [d for d in candidates if d.domain in mentioned]
+                candidates = narrowed or candidates
+            if " ".join(words[start:end]) in self.domain_words and self.qualified(words, start):
+                return None
+            if len(candidates) != 1:
+                # 类型词本身（如 "fan"）也可能被收录为设备短语，此时交给下面按类型兜底
+                if not candidates and " ".join(words[start:end]) in self.domain_words:
+                    continue
+                return None
+            if candidates[0] not in devices:
+                devices.append(candidates[0])
+
+        if devices:
+            return devices
+
+        # 没有设备名时，只提到一种设备类型且该类型只有一个设备，例如 "set the ac to 22 degrees"；
+        if any(self.qualified(words, i) for i, word in enumerate(words) if word in self.domain_words):
+            return None
+        domains = mentioned if allowed is None else mentioned & allowed
+        if allowed is not None and not domains and len(allowed) == 1:
+            domains = allowed
+        if len(domains) == 1:
+            only = self.registry.by_domain.get(next(iter(domains)), [])
+            if len(only) == 1:
+                return only
+        return None
@@ -0,0 +1,290 @@
+'''
+长度前缀帧编解码（客户端与服务端共用）
+
+协议：[4字节大端长度][JSON] ，VOICE_COMMAND 之后紧跟音频：
+  - size > 0：一次性发送 size 字节 PCM
+  - size == 0：流式分片 [4字节长度][PCM] ... [0000]
+
+接收端使用 recv_into 直接写入预分配/复用的缓冲区，音频以 memoryview 形式交给下游，
+不再出现 buf += newbuf 的平方级拷贝。
+'''
+import inspect
+import json
+import threading
+
+HEADER_SIZE = 4
+MAX_HEADER_LENGTH = 1 << 20       # 单个JSON头最大 1MB
+MAX_AUDIO_LENGTH = 64 << 20       # 单条语音最大 64MB
+MIN_BUFFER_SIZE = 64 << 10        # 流式接收的初始缓冲区 64KB
+
+
+class CopyStats:
+    """统计用户态额外拷贝的字节数与缓冲区分配次数（用于基准测试）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bytes_copied = 0
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def copied(self, n):
+        with self.lock:
+            self.bytes_copied += n
+
+    def allocated(self, n):
+        with self.lock:
+            self.allocations += 1
+            self.allocated_bytes += n
+
+
+COPY_STATS = CopyStats()
+
+
+class BufferPool:
+    """按 2 的幂分级复用 bytearray，避免每条语音都重新分配大块内存"""
+
+    def __init__(self, max_per_bucket=8, max_pooled_bytes=32 << 20):
+        self.max_per_bucket = max_per_bucket
+        self.max_pooled_bytes = max_pooled_bytes
+        self.pooled_bytes = 0
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def bucket_size(size):
+        capacity = MIN_BUFFER_SIZE
+        while capacity < size:
+            capacity <<= 1
+        return capacity
+
+    def acquire(self, size):
+        capacity = self.bucket_size(size)
+        with self.lock:
+            free = self.buckets.get(capacity)
+            if free:
+                self.pooled_bytes -= capacity
+                return free.pop()
+        COPY_STATS.allocated(capacity)
+        return bytearray(capacity)
+
+    def release(self, buf):
+        capacity = len(buf)
+        with self.lock:
+            free = self.buckets.setdefault(capacity, [])
+            if len(free) < self.max_per_bucket and self.pooled_bytes + capacity <= self.max_pooled_bytes:
+                free.append(buf)
+                self.pooled_bytes += capacity
+
+
+DEFAULT_POOL = BufferPool()
+
+
+class AudioBuffer:
+    """一段接收到的音频：view 指向池中缓冲区的有效部分，用完必须 release()"""
+    __slots__ = ('buf', 'view', 'pool')
+
+    def __init__(self, buf, size, pool):
+        self.buf = buf
+        self.view = memoryview(buf)[:size]
+        self.pool = pool
+
+    def __len__(self):
+        return len(self.view)
+
+    def release(self):
+        if self.buf is not None:
+            self.view.release()
+            self.pool.release(self.buf)
+            self.buf = None
+
+
+def encode_frame(payload):
+    """[4字节长度] + payload"""
+    return len(payload).to_bytes(HEADER_SIZE, 'big') + payload
+
+
+def encode_message(message):
+    return encode_frame(json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+
+def check_length(length, limit, what):
+    if length > limit:
+        raise ValueError(f"{what} too large: {length} bytes (limit {limit})")
+    return length
+
+
+class FrameReader:
+    """阻塞 socket 的帧读取器，每个连接一个实例"""
+
+    def __init__(self, sock, pool=None):
+        self.sock = sock
+        self.pool = pool or DEFAULT_POOL
+        self.length_buf = bytearray(HEADER_SIZE)
+        self.length_view = memoryview(self.length_buf)
+        self.scratch = bytearray(4096)
+        # 流式语音的初始容量取上一条语音的大小，同一设备的后续请求不再需要扩容拷贝
+        self.stream_hint = MIN_BUFFER_SIZE
+
+    def recv_into(self, view):
+        """把 view 填满，连接关闭时返回 False"""
+        received = 0
+        total = len(view)
+        while received < total:
+            n = self.sock.recv_into(view[received:], total - received)
+            if not n:
+                return False
+            received += n
+        return True
+
+    def read_length(self):
+        if not self.recv_into(self.length_view):
+            return None
+        return int.from_bytes(self.length_buf, 'big')
+
+    def read_frame(self):
+        """读取一个完整帧，返回 memoryview（下一次读取前有效），连接关闭返回 None"""
+        length = self.read_length()
+        if length is None:
+            return None
+        check_length(length, MAX_HEADER_LENGTH, "Frame")
+        if length > len(self.scratch):
+            self.scratch = bytearray(BufferPool.bucket_size(length))
+            COPY_STATS.allocated(len(self.scratch))
+        view = memoryview(self.scratch)[:length]
+        if not self.recv_into(view):
+            return None
+        return view
+
+    def read_json(self):
+        view = self.read_frame()
+        if view is None:
+            return None
+        return json.loads(str(view, 'utf-8'))
+
+    def read_audio(self, size, on_chunk=None):
+        """
+        读取 VOICE_COMMAND 的音频部分
+        :param size: 头部中的 size，>0 为定长，<=0 为流式分片
+        :param on_chunk: 流式模式下每收到一个分片回调 (chunk_view, chunk_count, total)，
+                         chunk_view 只在回调期间有效（缓冲区扩容后会被复用）
+        :return: AudioBuffer，连接中断返回 None
+        """
+        if size > 0:
+            check_length(size, MAX_AUDIO_LENGTH, "Audio")
+            buf = self.pool.acquire(size)
+            audio = AudioBuffer(buf, size, self.pool)
+            if not self.recv_into(audio.view):
+                audio.release()
+                return None
+            return audio
+
+        buf = self.pool.acquire(self.stream_hint)
+        used = 0
+        chunk_count = 0
+        while True:
+            chunk_len = self.read_length()
+            if chunk_len is None:
+                self.pool.release(buf)
+                return None
+            if chunk_len == 0:
+                self.stream_hint = max(used, MIN_BUFFER_SIZE)
+                return AudioBuffer(buf, used, self.pool)
+            check_length(used + chunk_len, MAX_AUDIO_LENGTH, "Audio")
+            if used + chunk_len > len(buf):
+                buf = self.grow(buf, used, used + chunk_len)
+            chunk = memoryview(buf)[used:used + chunk_len]
+            if not self.recv_into(chunk):
+                self.pool.release(buf)
+                return None
+            used += chunk_len
+            chunk_count += 1
+            if on_chunk:
+                on_chunk(chunk, chunk_count, used)
+
+    def grow(self, buf, used, needed):
+        """缓冲区不够时换一个更大的池化缓冲区，只拷贝已用部分（摊还 O(n)）"""
+        bigger = self.pool.acquire(max(needed, len(buf) * 2))
+        bigger[:used] = memoryview(buf)[:used]
+        COPY_STATS.copied(used)
+        self.pool.release(buf)
+        return bigger
+
+
+class AsyncFrameReader(FrameReader):
+    """非阻塞 socket + asyncio 事件循环版本，接口与 FrameReader 相同但均为协程"""
+
+    def __init__(self, loop, sock, pool=None):
+        super().__init__(sock, pool)
+        self.loop = loop
+
+    async def recv_into(self, view):
+        received = 0
+        total = len(view)
+        while received < total:
+            n = await self.loop.sock_recv_into(self.sock, view[received:])
+            if not n:
+                return False
+            received += n
+        return True
+
+    async def read_length(self):
+        if not await self.recv_into(self.length_view):
+            return None
+        return int.from_bytes(self.length_buf, 'big')
+
+    async def read_frame(self):
+        length = await self.read_length()
+        if length is None:
+            return None
+        check_length(length, MAX_HEADER_LENGTH, "Frame")
+        if length > len(self.scratch):
+            self.scratch = bytearray(BufferPool.bucket_size(length))
+            COPY_STATS.allocated(len(self.scratch))
+        view = memoryview(self.scratch)[:length]
+        if not await self.recv_into(view):
+            return None
+        return view
+
+    async def read_json(self):
+        view = await self.read_frame()
+        if view is None:
+            return None
+        return json.loads(str(view, 'utf-8'))
+
+    async def read_audio(self, size, on_chunk=None):
+        if size > 0:
+            check_length(size, MAX_AUDIO_LENGTH, "Audio")
+            buf = self.pool.acquire(size)
+            audio = AudioBuffer(buf, size, self.pool)
+            if not await self.recv_into(audio.view):
+                audio.release()
+                return None
+            return audio
+
+        buf = self.pool.acquire(self.stream_hint)
+        used = 0
+        chunk_count = 0
+        while True:
+            chunk_len = await self.read_length()
+            if chunk_len is None:
+                self.pool.release(buf)
+                return None
+            if chunk_len == 0:
+                self.stream_hint = max(used, MIN_BUFFER_SIZE)
+                return AudioBuffer(buf, used, self.pool)
+            check_length(used + chunk_len, MAX_AUDIO_LENGTH, "Audio")
+            if used + chunk_len > len(buf):
+                buf = self.grow(buf, used, used + chunk_len)
+            chunk = memoryview(buf)[used:used + chunk_len]
+            if not await self.recv_into(chunk):
+                self.pool.release(buf)
+                return None
+            used += chunk_len
+            chunk_count += 1
+            if on_chunk:
+                result = on_chunk(chunk, chunk_count, used)
+                if inspect.isawaitable(result):
+                    await result
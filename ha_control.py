@@ -1,6 +1,9 @@
 import requests
 import ast
-from config import HA_BASE_URL, HA_TOKEN
+import ha_ws
+import state_mirror
+from config import HA_BASE_URL, HA_TRANSPORT
+from http_pool import get_session
 
 def call_service(domain, service, data):
     """
@@ -10,13 +13,16 @@ def call_service(domain, service, data):
     :param data: 需要提交的数据（dict）
     :return: 返回 JSON 数据（dict），如出错返回 None
     """
+    if HA_TRANSPORT == "websocket":
+        try:
+            return ha_ws.call_service(domain, service, data)
+        except ha_ws.NotConnected as e:
+            # 请求没有发出，改走 REST 不会重复执行
+            print(f"[HA WS] {e}, falling back to REST")
     url = f"{HA_BASE_URL.rstrip('/')}/api/services/{domain}/{service}"
-    headers = {
-        "Authorization": f"Bearer {HA_TOKEN}",
-        "Content-Type": "application/json"
-    }
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
+        # 共享连接池，Session 已带鉴权头
+        response = get_session("ha").post(url, json=data, timeout=10)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
@@ -27,15 +33,21 @@ def get_state(entity_id):
     """
     查询实体状态。
     :param entity_id: 实体ID
-    :return: 状态字典，出错返回None
+    :return: 状态字典，出错返回None；来自状态镜像时带 "mirror" 字段（live / age / stale_for）
     """
+    mirror = state_mirror.get_mirror()
+    found = mirror.lookup(entity_id) if mirror else None
+    if found is not None:
+        state, freshness = found
+        return dict(state, mirror=freshness) if state else None
+    if HA_TRANSPORT == "websocket":
+        try:
+            return ha_ws.get_state(entity_id)
+        except ha_ws.NotConnected as e:
+            print(f"[HA WS] {e}, falling back to REST")
     url = f"{HA_BASE_URL.rstrip('/')}/api/states/{entity_id}"
-    headers = {
-        "Authorization": f"Bearer {HA_TOKEN}",
-        "Content-Type": "application/json"
-    }
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = get_session("ha").get(url, timeout=10)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
@@ -295,6 +307,29 @@ def control_switch(entity_id, action):
     else:
         print("不支持的操作类型。action应为'on', 'off', 'state'")
         return None
+
+# ------------------------ 状态查询 ------------------------
+# 各 domain 的状态描述；其余 domain 使用通用描述
+STATE_DESCRIBERS = {
+    "light": control_light,
+    "cover": control_curtain,
+    "fan": control_fan,
+    "climate": control_climate,
+    "lock": control_lock,
+    "media_player": control_media_player,
+    "switch": control_switch,
+}
+
+def describe_state(entity_id):
+    """查询实体状态并生成文字描述"""
+    describer = STATE_DESCRIBERS.get(entity_id.split(".", 1)[0])
+    if describer:
+        return describer(entity_id, "state")
+    state = get_state(entity_id)
+    if not state:
+        return f"未能获取到“{entity_id}”的状态信息。"
+    name = state.get("attributes", {}).get("friendly_name", entity_id)
+    return f'“{name}”当前状态为：{state.get("state")}。'
     
 
 import time
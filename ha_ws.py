@@ -0,0 +1,316 @@
+'''
+Home Assistant WebSocket 传输
+一条鉴权后的长连接承载所有服务调用：每个请求带自增 id，读线程按 id 把结果交给等待的线程，
+多个线程的请求在同一连接上复用，不再为每次调用单独发 HTTP 请求、带一遍鉴权头。
+连接断开时在途请求立即失败，下一次调用自动重连（失败后指数退避，退避期间直接报 NotConnected）。
+有事件订阅时（见 subscribe）断线后在后台自动重连，并在新连接上重新订阅。
+call_service / get_state 与 ha_control 中 REST 版本的签名和返回约定相同（出错返回 None）。
+'''
+import itertools
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+import websocket_frames
+from config import HA_BASE_URL, HA_TOKEN, HA_WS_URL
+
+
+class NotConnected(ConnectionError):
+    """请求没有发出（连不上或正在退避），调用方可以安全地改走 REST"""
+
+
+class HaError(Exception):
+    """HA 返回 success: false"""
+
+    def __init__(self, error):
+        self.code = (error or {}).get("code")
+        super().__init__(f"{self.code}: {(error or {}).get('message')}")
+
+
+def websocket_url(base_url):
+    """http://host:8123 -> ws://host:8123/api/websocket"""
+    parts = urlsplit(base_url)
+    scheme = "wss" if parts.scheme == "https" else "ws"
+    return f"{scheme}://{parts.netloc}{parts.path.rstrip('/')}/api/websocket"
+
+
+class PendingRequest:
+    __slots__ = ("ws", "event", "result", "error")
+
+    def __init__(self, ws):
+        self.ws = ws                  # 请求发在哪条连接上，该连接断开时只让这些请求失败
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class HaWebSocketClient:
+    def __init__(self, url, token, timeout=10, reconnect_min=0.5, reconnect_max=30):
+        """
+        :param timeout: 连接、鉴权和单个请求的超时（秒）
+        :param reconnect_min: 连接失败后的首次退避时间，之后每次翻倍，最多 reconnect_max
+        """
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.backoff = reconnect_min
+        self.retry_at = 0.0
+        self.ws = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.lock = threading.Lock()          # 建立连接
+        self.pending_lock = threading.Lock()
+        self.connects = 0
+        self.subscriptions = []     # [(event_type, callback)]，重连后重新订阅
+        self.listeners = {}         # 订阅请求 id -> (ws, callback)
+        self.on_connect = []        # 每次（重新）连接并订阅完成后调用 hook()
+        self.on_disconnect = []     # 当前连接断开时调用 hook()
+        self.reconnecting = False
+        self.closed = False
+
+    def connect(self):
+        """已连接时直接返回，否则建立连接并完成鉴权；失败时抛出 NotConnected"""
+        ws = self.ws
+        if ws is not None:
+            return ws
+        with self.lock:
+            if self.ws is not None:
+                return self.ws
+            wait = self.retry_at - time.time()
+            if wait > 0:
+                raise NotConnected(f"Home Assistant WebSocket reconnecting in {wait:.1f}s")
+            try:
+                ws = websocket_frames.connect(self.url, timeout=self.timeout)
+                ws.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                self.authenticate(ws)
+            except (OSError, ValueError) as e:
+                self.retry_at = time.time() + self.backoff
+                self.backoff = min(self.backoff * 2, self.reconnect_max)
+                raise NotConnected(f"Home Assistant WebSocket connect failed: {e}")
+            # 读线程一直阻塞在 recv 上，请求超时由 PendingRequest 控制
+            ws.sock.settimeout(None)
+            self.backoff = self.reconnect_min
+            self.retry_at = 0.0
+            self.ws = ws
+            self.connects += 1
+        threading.Thread(target=self.read_loop, args=(ws,), name="ha-ws", daemon=True).start()
+        print(f"[HA WS] Connected: {self.url}")
+        self.after_connect(ws)
+        return ws
+
+    def after_connect(self, ws):
+        """在新连接上恢复订阅，然后通知 on_connect（例如状态镜像重新全量加载）"""
+        try:
+            for event_type, callback in list(self.subscriptions):
+                self.listen(ws, event_type, callback)
+            for hook in list(self.on_connect):
+                hook()
+        except (OSError, HaError, TimeoutError) as e:
+            print(f"[HA WS] Resubscribe failed: {e}")
+            self.drop(ws, e)
+
+    def listen(self, ws, event_type, callback):
+        msg_id = next(self.ids)
+        with self.pending_lock:
+            self.listeners[msg_id] = (ws, callback)
+        try:
+            self.request({"type": "subscribe_events", "event_type": event_type}, msg_id=msg_id, ws=ws)
+        except BaseException:
+            with self.pending_lock:
+                self.listeners.pop(msg_id, None)
+            raise
+
+    def subscribe(self, event_type, callback):
+        """
+        订阅事件，callback(event) 在读线程中调用，应尽快返回；断线重连后自动重新订阅
+        :raises NotConnected / HaError: 首次订阅失败（之后的重连仍会订阅）
+        """
+        ws = self.ws
+        self.subscriptions.append((event_type, callback))
+        if ws is None:
+            # 建立连接后 after_connect 会订阅全部事件（包括这一条）；连不上时在后台重连
+            try:
+                self.connect()
+            except NotConnected:
+                self.start_reconnect()
+                raise
+            return
+        self.listen(ws, event_type, callback)
+
+    def authenticate(self, ws):
+        """auth_required -> auth -> auth_ok"""
+        message = json.loads(ws.recv_text())
+        if message.get("type") != "auth_required":
+            ws.close()
+            raise ConnectionError(f"Unexpected message before auth: {message.get('type')}")
+        ws.send_text(json.dumps({"type": "auth", "access_token": self.token}))
+        message = json.loads(ws.recv_text())
+        if message.get("type") != "auth_ok":
+            ws.close()
+            raise ConnectionError(f"Authentication failed: {message.get('message') or message.get('type')}")
+
+    def read_loop(self, ws):
+        error = None
+        try:
+            while True:
+                message = json.loads(ws.recv_text())
+                # HA 可能把多条消息合并成一个 JSON 数组发送
+                for item in message if isinstance(message, list) else [message]:
+                    self.dispatch(item)
+        except (OSError, ValueError) as e:
+            error = e
+        finally:
+            self.drop(ws, error)
+
+    def dispatch(self, message):
+        if message.get("type") == "event":
+            listener = self.listeners.get(message.get("id"))
+            if listener:
+                try:
+                    listener[1](message.get("event") or {})
+                except Exception as e:
+                    print(f"[HA WS] Event callback failed: {e}")
+            return
+        if message.get("type") not in ("result", "pong"):
+            return
+        with self.pending_lock:
+            pending = self.pending.pop(message.get("id"), None)
+        if pending is None:
+            return
+        if message.get("type") == "result" and not message.get("success"):
+            pending.error = HaError(message.get("error"))
+        else:
+            pending.result = message.get("result")
+        pending.event.set()
+
+    def drop(self, ws, error=None):
+        """连接断开：清掉当前连接，让这条连接上的在途请求立即失败"""
+        with self.lock:
+            current = self.ws is ws
+            if current:
+                self.ws = None
+                print(f"[HA WS] Disconnected: {error or 'closed'}")
+        ws.close()
+        if current:
+            for hook in list(self.on_disconnect):
+                hook()
+        with self.pending_lock:
+            lost = [(msg_id, p) for msg_id, p in self.pending.items() if p.ws is ws]
+            for msg_id, _ in lost:
+                del self.pending[msg_id]
+            for msg_id in [msg_id for msg_id, (owner, _) in self.listeners.items() if owner is ws]:
+                del self.listeners[msg_id]
+        for _, pending in lost:
+            pending.error = ConnectionError(f"Home Assistant WebSocket connection lost: {error or 'closed'}")
+            pending.event.set()
+        if self.subscriptions and not self.closed:
+            self.start_reconnect()
+
+    def start_reconnect(self):
+        with self.lock:
+            if self.reconnecting:
+                return
+            self.reconnecting = True
+        threading.Thread(target=self.reconnect_loop, name="ha-ws-reconnect", daemon=True).start()
+
+    def reconnect_loop(self):
+        """有订阅时断线后在后台重连，不等下一次服务调用"""
+        try:
+            while not self.closed and self.ws is None:
+                try:
+                    self.connect()
+                except NotConnected:
+                    time.sleep(max(0.1, self.retry_at - time.time()))
+        finally:
+            with self.lock:
+                self.reconnecting = False
+
+    def request(self, payload, timeout=None, msg_id=None, ws=None):
+        """
+        发送一条命令并等待结果
+        :param msg_id / ws: 指定请求 id 和连接（订阅时使用，事件会带着订阅请求的 id）
+        :return: result 字段
+        :raises NotConnected: 请求没有发出；ConnectionError: 发出后连接断开；HaError；TimeoutError
+        """
+        # 请求没有发出时换一条新连接重试一次；指定了连接（订阅）时不重试，由重连后的重新订阅负责
+        attempts = 1 if ws is not None else 2
+        for attempt in range(attempts):
+            if ws is None or attempt:
+                ws = self.connect()
+            if msg_id is None or attempt:
+                msg_id = next(self.ids)
+            pending = PendingRequest(ws)
+            with self.pending_lock:
+                self.pending[msg_id] = pending
+            try:
+                # WebSocket 内部加锁，不会与读线程回复的 pong 交错
+                ws.send_text(json.dumps(dict(payload, id=msg_id)))
+                break
+            except OSError as e:
+                with self.pending_lock:
+                    self.pending.pop(msg_id, None)
+                self.drop(ws, e)
+                if attempt == attempts - 1:
+                    raise NotConnected(f"Home Assistant WebSocket send failed: {e}")
+        if not pending.event.wait(timeout or self.timeout):
+            with self.pending_lock:
+                self.pending.pop(msg_id, None)
+            raise TimeoutError(f"Home Assistant WebSocket request {payload.get('type')} timed out")
+        if pending.error:
+            raise pending.error
+        return pending.result
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            ws, self.ws = self.ws, None
+        if ws:
+            self.drop(ws)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """所有线程共享的客户端（首次调用时创建，连接按需建立）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HaWebSocketClient(HA_WS_URL or websocket_url(HA_BASE_URL), HA_TOKEN)
+    return _client
+
+
+def call_service(domain, service, data):
+    """
+    通过 WebSocket 调用服务，参数和返回值与 ha_control.call_service 相同
+    :raises NotConnected: 请求没有发出（调用方可改走 REST，不会重复执行）
+    """
+    try:
+        return get_client().request({
+            "type": "call_service", "domain": domain, "service": service, "service_data": data
+        })
+    except NotConnected:
+        raise
+    except (HaError, ConnectionError, TimeoutError) as e:
+        print(f"请求出错: {e}")
+        return None
+
+
+def get_state(entity_id):
+    """
+    WebSocket API 没有单实体查询，只能取全部状态再挑出来；实体很多时开销较大
+    :raises NotConnected: 同 call_service
+    """
+    try:
+        states = get_client().request({"type": "get_states"})
+    except NotConnected:
+        raise
+    except (HaError, ConnectionError, TimeoutError) as e:
+        print(f"查询状态出错: {e}")
+        return None
+    return next((s for s in states or () if s.get("entity_id") == entity_id), None)
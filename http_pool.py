@@ -0,0 +1,92 @@
+'''
+共享的 HTTP 连接池
+ASR 与 Home Assistant 调用各自持有一个 keep-alive 的 requests.Session，所有连接/线程共享，
+稳态下不会再为每次请求重新建立 TCP（以及 HTTPS 下的 TLS）连接。
+'''
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (
+    HA_BASE_URL, HA_TOKEN, ASR_API_URL,
+    HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_POOL_BLOCK, HTTP_RETRIES, HTTP_BACKOFF
+)
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def create_session(headers=None, retry_methods=("GET", "HEAD"), pool_connections=HTTP_POOL_CONNECTIONS,
+                   pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=HTTP_POOL_BLOCK, retries=HTTP_RETRIES,
+                   backoff=HTTP_BACKOFF):
+    """
+    创建带连接池和重试策略的 Session
+    :param retry_methods: 允许在读超时/5xx 时重试的方法；连接失败（请求尚未发出）对所有方法都会重试
+    :param pool_connections: 缓存的主机连接池数量
+    :param pool_maxsize: 每个主机的最大连接数
+    :param pool_block: 连接数达到上限时是否等待，而不是临时新建连接
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(retry_methods),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def get_session(name):
+    """获取共享 Session：'ha' 自带鉴权头，'asr' 允许重试 POST（识别请求是幂等的）"""
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                if name == "ha":
+                    session = create_session(headers={
+                        "Authorization": f"Bearer {HA_TOKEN}",
+                        "Content-Type": "application/json"
+                    })
+                elif name == "asr":
+                    session = create_session(retry_methods=("GET", "HEAD", "POST"))
+                else:
+                    session = create_session()
+                _sessions[name] = session
+    return session
+
+
+def preconnect(timeout=3):
+    """启动时预先建立到 HA 与 ASR 的连接，第一条语音不再承担握手开销"""
+    targets = (
+        ("ha", f"{HA_BASE_URL.rstrip('/')}/api/"),
+        ("asr", "{0.scheme}://{0.netloc}/".format(urlsplit(ASR_API_URL))),
+    )
+    for name, url in targets:
+        try:
+            get_session(name).head(url, timeout=timeout)
+            print(f"[HTTP] Pre-connected {name}: {url}")
+        except requests.RequestException as e:
+            print(f"[HTTP] Pre-connect {name} failed: {e}")
+
+
+def close_all():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,167 @@
+'''
+意图缓存
+以规范化后的识别文本为键，缓存 LLM 给出的回复文本和解析后的命令列表，按 LRU + TTL 淘汰。
+缓存与设备配置/系统提示词的指纹绑定：指纹变化时整体失效；可选持久化到磁盘，重启后直接命中。
+'''
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from device_registry import normalize
+
+
+def config_fingerprint(device_config, system_prompt):
+    """设备配置和系统提示词的指纹，任一变化都会得到不同的值"""
+    raw = json.dumps(device_config, sort_keys=True, ensure_ascii=False, default=str) + "\n" + system_prompt
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class IntentCache:
+    """线程安全的 LRU + TTL 缓存：normalized text -> (content, commands)"""
+
+    def __init__(self, fingerprint, max_entries=256, ttl=3600, path=None, save_interval=30):
+        """
+        :param fingerprint: config_fingerprint() 的结果
+        :param max_entries: 最大条目数，超出时淘汰最久未使用的
+        :param ttl: 条目有效期（秒），<= 0 表示不过期
+        :param path: 持久化文件路径，为空时只保存在内存
+        :param save_interval: 两次落盘的最小间隔（秒）
+        """
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self.entries = OrderedDict()  # key -> (stored_at, content, commands)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.dirty = False
+        self.last_save = 0.0
+        if path:
+            self.load()
+
+    @staticmethod
+    def key(text):
+        return normalize(text)
+
+    def get(self, text):
+        """命中返回 (content, commands)，否则返回 None"""
+        key = self.key(text)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl > 0 and now - entry[0] > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.dirty = True
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        # 返回副本，调用方修改命令不会污染缓存
+        return entry[1], [dict(cmd) if isinstance(cmd, dict) else cmd for cmd in entry[2]]
+
+    def put(self, text, content, commands):
+        """
+        只缓存可执行的结果；回复内容不是字符串（LLM 出错）、没有命令，
+        或 LLM 输出了不是对象的 JSON 行（数组、数字等）时不缓存
+        """
+        if not isinstance(content, str) or not commands or not all(isinstance(cmd, dict) for cmd in commands):
+            return
+        key = self.key(text)
+        with self.lock:
+            self.entries[key] = (time.time(), content, [dict(cmd) for cmd in commands])
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.dirty = True
+        self.maybe_save()
+
+    def rebind(self, fingerprint):
+        """设备配置或提示词变化后调用，指纹不同则清空缓存"""
+        with self.lock:
+            if fingerprint == self.fingerprint:
+                return False
+            self.fingerprint = fingerprint
+            self.entries.clear()
+            self.dirty = True
+        print("[CACHE] Device config changed, intent cache invalidated")
+        self.maybe_save(force=True)
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.dirty = True
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def maybe_save(self, force=False):
+        if self.path and self.dirty and (force or time.time() - self.last_save >= self.save_interval):
+            self.save()
+
+    def save(self):
+        """原子写入（先写临时文件再替换），只保存未过期的条目"""
+        if not self.path:
+            return
+        now = time.time()
+        with self.lock:
+            data = {
+                "fingerprint": self.fingerprint,
+                "entries": [
+                    [key, stored_at, content, commands]
+                    for key, (stored_at, content, commands) in self.entries.items()
+                    if self.ttl <= 0 or now - stored_at <= self.ttl
+                ],
+            }
+            self.dirty = False
+            self.last_save = now
+        tmp = f"{self.path}.tmp"
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[CACHE] Failed to save intent cache: {e}")
+
+    def load(self):
+        """加载持久化的缓存；指纹不一致（设备配置已修改）或文件损坏时忽略"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[CACHE] Ignoring unreadable intent cache {self.path}: {e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            print(f"[CACHE] Device config changed since last run, discarding {self.path}")
+            return
+        now = time.time()
+        with self.lock:
+            for key, stored_at, content, commands in data.get("entries", [])[-self.max_entries:]:
+                if not isinstance(commands, list) or not all(isinstance(cmd, dict) for cmd in commands):
+                    continue
+                if self.ttl <= 0 or now - stored_at <= self.ttl:
+                    self.entries[key] = (stored_at, content, commands)
+        print(f"[CACHE] Loaded {len(self.entries)} cached intents from {self.path}")
@@ -0,0 +1,165 @@
+'''
+LLM 请求调度器
+多个卫星设备同时说话（例如各房间的"晚安"场景）时，各连接原本各自直接请求推理服务。
+调度器放在 ChatBot 前面：把几毫秒内到达的请求收成一批，在并发上限内同时提交给 OpenAI 兼容接口
+（由推理服务做 continuous batching），再按请求 ID 把结果分发回各自的调用方。
+同时统计排队等待时间和模型耗时，用来评估本地推理服务需要多大的并发能力。
+
+接口与 ChatBot 的无状态方法一致（complete / stream_complete / complete_json），可以直接替换。
+'''
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class LlmRequest:
+    __slots__ = ("request_id", "method", "args", "kwargs", "future", "enqueued_at", "started_at")
+
+    def __init__(self, request_id, method, args, kwargs):
+        self.request_id = request_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+
+class DispatchStats:
+    """最近 window 个请求的排队时间 / 模型耗时 / 批大小"""
+
+    def __init__(self, window=200):
+        self.lock = threading.Lock()
+        self.queue_waits = deque(maxlen=window)
+        self.model_times = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.total = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def record(self, queue_wait, model_time):
+        with self.lock:
+            self.queue_waits.append(queue_wait)
+            self.model_times.append(model_time)
+            self.total += 1
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        def summary(values):
+            if not values:
+                return {"avg_ms": 0.0, "p95_ms": 0.0}
+            ordered = sorted(values)
+            return {
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+            }
+
+        with self.lock:
+            return {
+                "requests": self.total,
+                "queue_wait": summary(self.queue_waits),
+                "model_time": summary(self.model_times),
+                "avg_batch": round(sum(self.batch_sizes) / len(self.batch_sizes), 2) if self.batch_sizes else 0.0,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+class LlmDispatcher:
+    def __init__(self, bot, max_concurrency=4, batch_window=0.005, max_batch=8, log_every=50):
+        """
+        :param bot: ChatBot 实例（无状态方法线程安全）
+        :param max_concurrency: 同时发往推理服务的请求上限
+        :param batch_window: 收到一个请求后继续收集同批请求的时间（秒）
+        :param max_batch: 一批最多的请求数
+        """
+        self.bot = bot
+        self.max_concurrency = max_concurrency
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.log_every = log_every
+        self.ids = itertools.count(1)
+        self.pending = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self.stats = DispatchStats()
+        self.collector = threading.Thread(target=self.collect, name="llm-dispatch", daemon=True)
+        self.collector.start()
+
+    # ---- 与 ChatBot 相同的调用接口 ----
+
+    def complete(self, message, system_message=None, model=None, metrics=None):
+        return self.submit("complete", message, system_message, model, metrics).result()
+
+    def complete_json(self, message, system_message=None, model=None, metrics=None, **options):
+        return self.submit("complete_json", message, system_message, model, metrics, **options).result()
+
+    def stream_complete(self, message, system_message=None, model=None, metrics=None):
+        """流式请求：排队拿到并发名额后，在调用方线程中逐段产出，结束时归还名额
+        （边生成边执行命令时，模型耗时中也包含了调用方处理每段输出的时间）"""
+        slot = self.submit(None, message, system_message, model)
+        request = slot.result()
+        try:
+            yield from self.bot.stream_complete(message, system_message, model, metrics)
+        finally:
+            self.finish(request)
+
+    # ---- 调度 ----
+
+    def submit(self, method, *args, **kwargs):
+        """加入队列，返回 Future；method 为 None 时只申请一个并发名额（Future 结果为请求本身）"""
+        request = LlmRequest(next(self.ids), method, args, kwargs)
+        self.pending.put(request)
+        return request.future
+
+    def collect(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self.stats.lock:
+                self.stats.batch_sizes.append(len(batch))
+            for request in batch:
+                # 名额在收集线程中获取：并发已满时后续请求在队列里等待，排队时间如实计入
+                self.slots.acquire()
+                request.started_at = time.time()
+                self.stats.enter()
+                if request.method is None:
+                    request.future.set_result(request)
+                else:
+                    self.executor.submit(self.run, request)
+
+    def run(self, request):
+        try:
+            result = getattr(self.bot, request.method)(*request.args, **request.kwargs)
+            request.future.set_result(result)
+        except Exception as e:
+            request.future.set_exception(e)
+        finally:
+            self.finish(request)
+
+    def finish(self, request):
+        now = time.time()
+        self.stats.leave()
+        self.slots.release()
+        self.stats.record(request.started_at - request.enqueued_at, now - request.started_at)
+        if self.log_every and self.stats.total % self.log_every == 0:
+            print(f"[LLM DISPATCH] {self.stats.snapshot()}")
@@ -0,0 +1,125 @@
+'''
+LLM 请求计量
+每次请求记录首 token 时间（TTFT，约等于排队 + prefill）、总耗时、提示词 / 输出 token 数（优先用接口返回的 usage，
+没有时流式请求按分片数、其余按 estimate_tokens 估算）、decode 速度和重试次数，
+用来区分慢在大提示词的 prefill 还是 decode。LlmStats 对最近的请求做滚动分位统计。
+'''
+import threading
+import time
+from collections import deque
+from prompt_builder import estimate_tokens
+
+
+class LlmMetrics:
+    """单次 LLM 请求的计量；由调用方创建并传给 ChatBot，ChatBot 在请求过程中填写"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, model=None, stream=False):
+        self.model = model
+        self.stream = stream
+        self.started_at = time.time()
+        self.first_token_at = None
+        self.finished_at = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.usage_reported = False
+        self.retries = 0
+        self.error = None
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.time()
+
+    def finish(self, usage=None, messages=(), completion="", chunks=None, error=None):
+        """
+        :param usage: 接口返回的 usage（可能为 None）
+        :param chunks: 流式请求收到的内容分片数，没有 usage 时作为输出 token 数
+        """
+        self.finished_at = time.time()
+        self.error = error
+        if usage is not None and getattr(usage, "completion_tokens", None) is not None:
+            self.prompt_tokens = usage.prompt_tokens
+            self.completion_tokens = usage.completion_tokens
+            self.usage_reported = True
+        else:
+            self.prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+            self.completion_tokens = chunks if chunks is not None else estimate_tokens(completion or "")
+
+    @property
+    def ttft(self):
+        return self.first_token_at - self.started_at if self.first_token_at else None
+
+    @property
+    def total(self):
+        return self.finished_at - self.started_at if self.finished_at else None
+
+    @property
+    def decode_tps(self):
+        """首 token 之后的输出速度（token/s），只有流式请求能测出"""
+        if self.first_token_at is None or not self.finished_at or not self.completion_tokens:
+            return None
+        decode_time = self.finished_at - self.first_token_at
+        return (self.completion_tokens - 1) / decode_time if decode_time > 0 else None
+
+    def as_dict(self):
+        def ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            "model": self.model,
+            "stream": self.stream,
+            "ttft_ms": ms(self.ttft),
+            "total_ms": ms(self.total),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "decode_tps": round(self.decode_tps, 1) if self.decode_tps is not None else None,
+            "tokens_estimated": not self.usage_reported,
+            "retries": self.retries,
+        }
+
+
+class LlmStats:
+    """最近 window 个请求的滚动分位统计"""
+
+    FIELDS = ("ttft_ms", "total_ms", "prompt_tokens", "completion_tokens", "decode_tps")
+
+    def __init__(self, window=200, log_every=50):
+        self.lock = threading.Lock()
+        self.windows = {field: deque(maxlen=window) for field in self.FIELDS}
+        self.log_every = log_every
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+
+    def record(self, metrics):
+        values = metrics.as_dict()
+        with self.lock:
+            self.requests += 1
+            self.retries += metrics.retries
+            if metrics.error:
+                self.errors += 1
+            else:
+                for field in self.FIELDS:
+                    if values[field] is not None:
+                        self.windows[field].append(values[field])
+            requests = self.requests
+        if self.log_every and requests % self.log_every == 0:
+            print(f"[LLM STATS] {self.snapshot()}")
+
+    def snapshot(self):
+        def summary(values):
+            if not values:
+                return None
+            ordered = sorted(values)
+            return {
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            }
+
+        with self.lock:
+            result = {"requests": self.requests, "errors": self.errors, "retries": self.retries}
+            for field, values in self.windows.items():
+                result[field] = summary(values)
+            return result
@@ -0,0 +1,250 @@
+'''
+多推理服务路由
+LLM_BASE_URL 可配置多个以逗号分隔的地址（例如两台边缘推理盒子）。每个地址单独统计 EWMA 延迟，
+请求优先发往最快的健康节点；若在该节点历史延迟的某个分位数（LLM_HEDGE_PERCENTILE）内还没有响应，
+就向下一个节点发送对冲请求，先返回者胜出，另一个被取消（流式请求直接关闭连接；非流式请求无法中断，
+结果被丢弃）。被对冲请求抢先的主节点记一次失败，已等待的时间计入其延迟，卡住的节点因此会被降级、摘除；
+被取消的请求之后的出错、超时和迟到的延迟同样照常统计。
+连续失败的节点被摘除，后台定期探测（GET /models），恢复后重新加入。
+'''
+import queue
+import random
+import threading
+import time
+from collections import deque
+from openai import OpenAI
+
+
+class Endpoint:
+    def __init__(self, base_url, api_key, timeout=30.0, alpha=0.3, window=100):
+        self.base_url = base_url
+        self.client = OpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=0)
+        self.alpha = alpha
+        self.ewma = None
+        self.samples = deque(maxlen=window)
+        self.failures = 0
+        self.ejected = False
+        self.lock = threading.Lock()
+
+    def record_success(self, latency):
+        with self.lock:
+            self.add_sample(latency)
+            self.failures = 0
+
+    def record_latency(self, latency):
+        """只记录延迟，不清零连续失败次数（被取消的请求迟到的结果）"""
+        with self.lock:
+            self.add_sample(latency)
+
+    def add_sample(self, latency):
+        self.ewma = latency if self.ewma is None else self.alpha * latency + (1 - self.alpha) * self.ewma
+        self.samples.append(latency)
+
+    def record_failure(self, eject_after):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= eject_after and not self.ejected:
+                self.ejected = True
+                return True
+        return False
+
+    def percentile(self, p):
+        with self.lock:
+            if len(self.samples) < 5:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "base_url": self.base_url,
+                "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+                "failures": self.failures,
+                "ejected": self.ejected,
+            }
+
+
+class Attempt:
+    """一次发往某个节点的请求；流式请求在拿到第一段输出时即视为响应"""
+
+    def __init__(self, endpoint, started_at):
+        self.endpoint = endpoint
+        self.started_at = started_at
+        self.cancelled = False
+        self.penalized = False      # 被对冲请求抢先时已经记过一次失败
+        self.closed = False         # 流由本端关闭，之后的异常不是节点的问题
+        self.done = False
+        self.stream = None
+
+
+class EndpointRouter:
+    def __init__(self, base_urls, api_key, timeout=30.0, hedge_percentile=0.9, hedge_default=0.5,
+                 hedge_min=0.05, eject_after=2, probe_interval=10.0):
+        """
+        :param hedge_percentile: 以主节点延迟的该分位数作为对冲等待时间，0 表示不对冲
+        :param hedge_default: 样本不足时的对冲等待时间（秒）
+        :param hedge_min: 对冲等待时间下限（秒），避免在很快的节点上也总是双发
+        :param eject_after: 连续失败多少次后摘除节点
+        :param probe_interval: 被摘除节点的探测间隔（秒）
+        """
+        self.endpoints = [Endpoint(url, api_key, timeout) for url in base_urls]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default = hedge_default
+        self.hedge_min = hedge_min
+        self.eject_after = eject_after
+        self.probe_interval = probe_interval
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.prober = threading.Thread(target=self.probe_loop, name="llm-probe", daemon=True)
+        self.prober.start()
+
+    def ranked(self):
+        """健康节点按 EWMA 排序（没有样本的排在前面以便尽快获得样本）；全部被摘除时仍全部尝试"""
+        healthy = [e for e in self.endpoints if not e.ejected] or list(self.endpoints)
+        random.shuffle(healthy)
+        return sorted(healthy, key=lambda e: e.ewma if e.ewma is not None else 0.0)
+
+    def hedge_delay(self, endpoint):
+        if not self.hedge_percentile:
+            return None
+        delay = endpoint.percentile(self.hedge_percentile)
+        return max(self.hedge_min, delay if delay is not None else self.hedge_default)
+
+    def fail(self, endpoint, error):
+        print(f"[LLM ROUTER] {endpoint.base_url} failed: {error}")
+        if endpoint.record_failure(self.eject_after):
+            print(f"[LLM ROUTER] Ejected {endpoint.base_url} after {endpoint.failures} consecutive failures")
+
+    def call(self, request, info=None):
+        """
+        非流式请求：request(client) -> 响应
+        主节点超过对冲等待时间未返回时并发请求下一个节点，取最先成功的结果；全部失败时抛出最后一个异常
+        :param info: 可选 dict，返回时写入 attempts（实际发出的请求数，含对冲和故障转移）
+        """
+        return self.race(request, streaming=False, info=info)
+
+    def stream(self, request, info=None):
+        """流式请求：request(client) -> openai Stream；按首段输出到达的先后选出胜者，逐段产出"""
+        winner, first = self.race(request, streaming=True, info=info)
+        try:
+            yield first
+            for chunk in winner.stream:
+                yield chunk
+        finally:
+            winner.stream.close()
+
+    def race(self, request, streaming, info=None):
+        candidates = self.ranked()
+        results = queue.Queue()
+        attempts = []
+        info = info if info is not None else {}
+
+        def run(attempt):
+            try:
+                if streaming:
+                    attempt.stream = request(attempt.endpoint.client)
+                    first = next(iter(attempt.stream))
+                    value = first
+                else:
+                    value = request(attempt.endpoint.client)
+                latency = time.time() - attempt.started_at
+                if attempt.cancelled:
+                    # 落败后才返回：延迟照常计入，但节点刚因落败记过失败，不清零
+                    attempt.endpoint.record_latency(latency)
+                else:
+                    attempt.endpoint.record_success(latency)
+                attempt.done = True
+                results.put((attempt, value, None))
+            except Exception as e:
+                attempt.done = True
+                if not attempt.closed and not attempt.penalized:
+                    self.fail(attempt.endpoint, e)
+                results.put((attempt, None, e))
+
+        def launch():
+            attempt = Attempt(candidates[len(attempts)], time.time())
+            attempts.append(attempt)
+            info["attempts"] = len(attempts)
+            threading.Thread(target=run, args=(attempt,), daemon=True).start()
+
+        launch()
+        pending = 1
+        last_error = None
+        while pending:
+            delay = self.hedge_delay(attempts[-1].endpoint) if len(attempts) < len(candidates) else None
+            try:
+                attempt, value, error = results.get(timeout=delay)
+            except queue.Empty:
+                # 当前节点迟迟没有响应，对冲到下一个节点
+                self.hedged += 1
+                launch()
+                pending += 1
+                continue
+            pending -= 1
+            if error is None:
+                if attempt is not attempts[0]:
+                    self.hedge_wins += 1
+                self.cancel_others(attempts, attempt, results, pending)
+                return (attempt, value) if streaming else value
+            last_error = error
+            if not pending and len(attempts) < len(candidates):
+                # 失败立即转移到下一个节点，不必等对冲时间
+                launch()
+                pending += 1
+        raise last_error
+
+    def cancel_others(self, attempts, winner, results, pending):
+        """
+        标记落败的请求；流式请求在拿到首段输出后立即关闭连接
+        比胜者先发出却还没有响应的请求（被对冲抢先的主节点）记一次失败，已等待的时间作为延迟样本
+        """
+        now = time.time()
+        for attempt in attempts:
+            if attempt is not winner:
+                if not attempt.done and attempt.started_at < winner.started_at:
+                    attempt.penalized = True
+                    attempt.endpoint.record_latency(now - attempt.started_at)
+                    self.fail(attempt.endpoint, f"no response after {(now - attempt.started_at) * 1000:.0f} ms, "
+                                                f"lost to hedge on {winner.endpoint.base_url}")
+                attempt.cancelled = True
+                if attempt.stream is not None:
+                    attempt.closed = True
+                    # 已经建立连接的流式请求直接关闭，推理服务随即停止生成
+                    try:
+                        attempt.stream.close()
+                    except Exception:
+                        pass
+        if not pending:
+            return
+
+        def reap():
+            for _ in range(pending):
+                attempt, value, error = results.get()
+                if attempt.stream is not None:
+                    attempt.stream.close()
+
+        threading.Thread(target=reap, daemon=True).start()
+
+    def probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            for endpoint in self.endpoints:
+                if not endpoint.ejected:
+                    continue
+                try:
+                    endpoint.client.with_options(timeout=min(3.0, self.probe_interval)).models.list()
+                except Exception as e:
+                    print(f"[LLM ROUTER] Probe {endpoint.base_url} failed: {e}")
+                    continue
+                with endpoint.lock:
+                    endpoint.ejected = False
+                    endpoint.failures = 0
+                print(f"[LLM ROUTER] {endpoint.base_url} is healthy again")
+
+    def stats(self):
+        return {
+            "endpoints": [e.snapshot() for e in self.endpoints],
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
@@ -1,16 +1,11 @@
-import json
-import re
 import threading
 import time
-import wave
 import pyaudio
-import requests
 import queue
 import numpy as np
 import sounddevice as sd
-from chat import ChatBot
-from ha_control import control_light, control_curtain,control_fan,control_climate,call_service,control_lock,control_media_player,control_switch
-from config import ASR_API_URL, SYSTEM_PROMPT
+from pipeline import VoicePipeline
+from config import SYSTEM_PROMPT
 # 导入KWS和VAD模块
 try:
     from kws import KeywordSpotter
@@ -51,7 +46,7 @@ class AudioRecorder:
             self.frames.append(data)
     
     def stop_recording(self):
-        """Stop audio recording and save to file"""
+        """Stop audio recording and return the raw PCM data (kept in memory, no temp file)"""
         if not self.recording:
             return None
             
@@ -61,25 +56,13 @@ class AudioRecorder:
             self.stream.stop_stream()
             self.stream.close()
         
-        # Save to temporary WAV file
-        filename = "temp_recording.wav"
-        wf = wave.open(filename, 'wb')
-        wf.setnchannels(self.CHANNELS)
-        wf.setsampwidth(self.p.get_sample_size(self.FORMAT))
-        wf.setframerate(self.RATE)
-        wf.writeframes(b''.join(self.frames))
-        wf.close()
+        audio = b''.join(self.frames)
         print("Recording stopped")
-        return filename
+        return audio
 
-class HomeAssistantController:
+class HomeAssistantController(VoicePipeline):
     def __init__(self, api_key, base_url, model):
-        self.bot = ChatBot(
-            api_key=api_key,
-            base_url=base_url,
-            model=model,
-            system_message=SYSTEM_PROMPT
-        )
+        super().__init__(api_key=api_key, base_url=base_url, model=model)
         print("sys prompt:",SYSTEM_PROMPT)
         self.recorder = AudioRecorder()
         self.queue = queue.Queue()
@@ -99,191 +82,6 @@ class HomeAssistantController:
             print(f"Failed to initialize VAD: {e}")
             self.vad = None
     
-    def parse_response(self, response: str) -> list:
-        """
-        Extract homeassistant commands from LLM response
-        Returns a list of command dictionaries
-        """
-        commands = []
-        
-        # 匹配 ```homeassistant ... ``` 代码块
-        pattern = r"```homeassistant\n(.*?)\n```"
-        matches = re.findall(pattern, response, re.DOTALL)
-        
-        if not matches:
-            return commands
-        
-        for match in matches:
-            # 处理代码块中的内容，可能包含多个 JSON 对象
-            # 按行分割
-            lines = match.strip().split('\n')
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                try:
-                    # 尝试解析每一行作为 JSON
-                    command = json.loads(line)
-                    commands.append(command)
-                except json.JSONDecodeError as e:
-                    print(f"[WARNING] Failed to parse command: {line}")
-                    print(f"[WARNING] JSON Error: {e}")
-                    continue
-        
-        return commands
-    
-    def execute_command(self, command: dict):
-        """Execute a single homeassistant command"""
-        if not command:
-            return
-            
-        service = command.get("service")
-        target_device = command.get("target_device")
-        rgb_color = command.get("rgb_color")  # 修复：应该是 rgb_color 而不是 color
-        brightness = command.get("brightness")  # 修复：默认值应该是 None
-        position = command.get("position")
-        temperature = command.get("temperature")
-        fan_mode = command.get("fan_mode")
-        
-        if not service or not target_device:
-            print("[ERROR] Invalid command format: missing service or target_device.")
-            return
-        
-        # 解析服务名中的 domain 和具体服务
-        try:
-            domain, action = service.split('.')
-        except ValueError:
-            print(f"[ERROR] Invalid service format: '{service}'")
-            return
-        
-        print(f"[EXEC] Domain: {domain}, Device: {target_device}, Action: {action}")
-        
-        # 根据 domain 分发到对应的控制函数
-        if domain == "light":
-            # 如果有rgb_color，优先使用set_color行为
-            # if rgb_color is not None:
-                # action = "set_color"
-                # print(f"[EXEC] Detected rgb_color, switching to set_color action")
-            
-            if action == "turn_on":
-                print(f"[EXEC] Brightness: {brightness}")
-                control_light(target_device, "on", brightness=brightness, rgb_color=rgb_color if rgb_color else None)
-            elif action == "turn_off":
-                control_light(target_device, "off")
-            elif action == "set_color":
-                control_light(target_device, "color", rgb_color=rgb_color)
-            elif action == "get_state":
-                result = control_light(target_device, "state")
-                print(result)
-            else:
-                print(f"[ERROR] Unsupported light action: {action}")
-                
-        elif domain == "cover":
-            if action == "open_cover":
-                control_curtain(target_device, "open")
-            elif action == "close_cover":
-                control_curtain(target_device, "close")
-            elif action == "set_position":
-                control_curtain(target_device, "position", position=position)
-            elif action == "get_state":
-                result = control_curtain(target_device, "state")
-                print(result)
-            else:
-                print(f"[ERROR] Unsupported cover action: {action}")
-                
-        elif domain == "fan":
-            if action == "turn_on":
-                control_fan(target_device, "on")
-            elif action == "turn_off":
-                control_fan(target_device, "off")
-            elif action == "increase_speed":
-                control_fan(target_device, "increase_speed")
-            elif action == "decrease_speed":
-                control_fan(target_device, "decrease_speed")
-            elif action == "get_state":
-                result = control_fan(target_device, "state")
-                print(result)
-            else:
-                print(f"[ERROR] Unsupported fan action: {action}")
-                
-        elif domain == "climate":
-            if action == "set_temperature":
-                control_climate(target_device, "set_temperature", temperature=temperature)
-            elif action == "set_fan_mode":
-                control_climate(target_device, "set_fan_mode", fan_mode=fan_mode)
-            elif action == "get_state":
-                result = control_climate(target_device, "state")
-                print(result)
-            else:
-                print(f"[ERROR] Unsupported climate action: {action}")
-                
-        elif domain == "lock":
-            if action == "lock":
-                control_lock(target_device, "lock")
-            elif action == "unlock":
-                control_lock(target_device, "unlock")
-            elif action == "get_state":
-                result = control_lock(target_device, "state")
-                print(result)
-            else:
-                print(f"[ERROR] Unsupported lock action: {action}")
-                
-        elif domain == "media_player":
-            if action == "media_play":
-                control_media_player(target_device, "play")
-            elif action == "media_pause":
-                control_media_player(target_device, "pause")
-            elif action == "media_stop":
-                control_media_player(target_device, "stop")
-            elif action == "get_state":
-                result = control_media_player(target_device, "state")
-                print(result)
-            else:
-                print(f"[ERROR] Unsupported media player action: {action}")
-                
-        elif domain == "switch":
-            if action == "turn_on":
-                control_switch(target_device, "on")
-            elif action == "turn_off":
-                control_switch(target_device, "off")
-            elif action == "get_state":
-                result = control_switch(target_device, "state")
-                print(result)
-            else:
-                print(f"[ERROR] Unsupported switch action: {action}")
-        else:
-            print(f"[ERROR] Unsupported domain: {domain}")
-    
-    def execute_commands(self, commands: list):
-        """Execute multiple homeassistant commands in sequence"""
-        if not commands:
-            print("[INFO] No commands to execute")
-            return
-        
-        print(f"[INFO] Executing {len(commands)} command(s)...")
-        for idx, command in enumerate(commands, 1):
-            print(f"\n[Command {idx}/{len(commands)}]")
-            self.execute_command(command)
-            # 可选：添加命令之间的延迟，避免执行过快
-            if idx < len(commands):
-                time.sleep(0.1)
-        print(f"\n[INFO] All commands executed")
-            
-    def recognize_speech(self, filename):
-        """Send audio to ASR API and return recognized text"""
-        try:
-            with open(filename, "rb") as f:
-                files = {"audio": (filename, f, "audio/wav")}
-                response = requests.post(ASR_API_URL, files=files, timeout=10)
-                response.raise_for_status()
-                result = response.json()
-                return result.get('text', '')
-        except Exception as e:
-            print(f"[ASR ERROR] {str(e)}")
-            return None
-    
     def process_voice_command(self):
         """Process voice command using KWS and VAD"""
         if not self.kws or not self.vad:
@@ -337,17 +135,17 @@ class HomeAssistantController:
                             silence_count += 1
                             if silence_count > max_silence_count:
                                 # 停止录音
-                                filename = self.recorder.stop_recording()
+                                audio = self.recorder.stop_recording()
                                 
                                 # === 用户说话结束时间 ===
                                 end_speaking_time = time.time()
                                 user_speech_duration = end_speaking_time - start_speaking_time
                                 print(f"[Timing] User speech duration: {user_speech_duration:.2f} seconds")
                                 
-                                if filename:
+                                if audio:
                                     # === ASR识别开始时间 ===
                                     asr_start_time = time.time()
-                                    text = self.recognize_speech(filename)
+                                    text = self.recognize_speech(audio, self.recorder.RATE, self.recorder.CHANNELS)
                                     # === ASR识别结束时间 ===
                                     asr_end_time = time.time()
                                     asr_duration = asr_end_time - asr_start_time
@@ -358,20 +156,16 @@ class HomeAssistantController:
                                         
                                         # === LLM响应开始时间 ===
                                         llm_start_time = time.time()
-                                        content = self.bot.chat(text)
+                                        # 快速通道 / 意图缓存未命中时才调用 LLM；命令在生成过程中即被执行（支持多个命令）
+                                        content, commands, source, _ = self.understand_and_execute(text)
                                         # === LLM响应结束时间 ===
                                         llm_end_time = time.time()
                                         llm_duration = llm_end_time - llm_start_time
-                                        print(f"[Timing] LLM response time: {llm_duration:.2f} seconds")
+                                        print(f"[Timing] LLM response time ({source}): {llm_duration:.2f} seconds")
                                         
                                         print(f"\nAssistant: {content}")
-                                        self.bot.chat("reset")
                                         
-                                        # 解析并执行命令（支持多个命令）
-                                        commands = self.parse_response(content)
-                                        if commands:
-                                            self.execute_commands(commands)
-                                        else:
+                                        if not commands:
                                             print("[INFO] No valid commands found in response")
                                 break
                         else:
@@ -388,6 +182,7 @@ class HomeAssistantController:
     def run(self):
         """Main interactive loop with speech recognition"""
         print("Home Assistant Controller - Listening for wake word (Press Ctrl+C to exit)")
+        self.warm_up()
         
         try:
             # 启动语音命令处理
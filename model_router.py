@@ -0,0 +1,127 @@
+'''
+按复杂度选择模型档位
+简单的单设备控制指令交给小模型（prefill / decode 都更快），状态查询、多步骤、定时或条件类请求交给大模型。
+分类只做词法判断：动作词表由 devices.yaml 的服务名生成（light.turn_on -> turn / on），
+设备类型词来自 DeviceRegistry，每条文本微秒级。按档位统计 LLM 耗时并定期打印。
+'''
+import threading
+from collections import deque
+from device_registry import DeviceRegistry, normalize
+
+SMALL = "small"
+LARGE = "large"
+
+# 句首出现即视为提问（状态查询等）
+QUESTION_WORDS = {
+    "what", "whats", "is", "are", "was", "were", "how", "why", "when", "where", "which", "who",
+    "does", "do", "did", "tell", "check", "status",
+}
+
+# 多步骤、定时、条件
+COMPLEX_WORDS = {
+    "and", "then", "also", "after", "before", "until", "unless", "if", "while", "except",
+    "minutes", "minute", "seconds", "second", "hours", "hour", "timer", "schedule", "remind",
+    "tomorrow", "tonight", "every", "later", "scene", "routine",
+}
+
+# 句首的客套话，去掉后再判断（"can you turn on ..." 仍是简单指令）
+POLITE_PREFIXES = (
+    "hey", "please", "can you", "could you", "would you", "will you", "can u", "i want you to", "i want to",
+    "i would like to", "i d like to",
+)
+
+# 服务名里不会出现、但口语中常用来表达同样动作的词
+ACTION_SYNONYMS = {
+    "switch", "power", "shut", "start", "stop", "resume", "dim", "brighten", "raise", "lower", "change", "make",
+    "toggle", "kill", "enable", "disable",
+}
+
+
+class TierStats:
+    """每个档位最近 window 次请求的耗时"""
+
+    def __init__(self, window=200):
+        self.latencies = deque(maxlen=window)
+        self.total = 0
+        self.failures = 0
+
+    def snapshot(self):
+        if not self.latencies:
+            return {"requests": self.total, "failures": self.failures, "avg_ms": 0.0, "p95_ms": 0.0}
+        ordered = sorted(self.latencies)
+        return {
+            "requests": self.total,
+            "failures": self.failures,
+            "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        }
+
+
+class ModelRouter:
+    def __init__(self, registry=None, small_model="", large_model="", max_words=14, log_every=50):
+        """
+        :param small_model: 简单指令使用的模型
+        :param large_model: 提问 / 多步骤请求使用的模型
+        :param max_words: 超过该词数的文本直接交给大模型
+        """
+        self.models = {SMALL: small_model, LARGE: large_model}
+        self.max_words = max_words
+        self.log_every = log_every
+        self.rebind(registry or DeviceRegistry())
+        self.stats = {SMALL: TierStats(), LARGE: TierStats()}
+        self.lock = threading.Lock()
+
+    def rebind(self, registry):
+        """设备配置重新加载后换用新的注册表，档位统计保留"""
+        action_words = set(ACTION_SYNONYMS)
+        for service in registry.services:
+            action = service.split(".", 1)[-1]
+            action_words.update(w for w in action.split("_") if len(w) > 1)
+        self.registry = registry
+        self.action_words = action_words
+
+    def classify(self, text):
+        """
+        :return: (tier, reason)
+        """
+        words = normalize(text.replace("'", "")).split()
+        if not words:
+            return LARGE, "empty"
+        sentence = " ".join(words)
+        for prefix in POLITE_PREFIXES:
+            if sentence.startswith(prefix + " "):
+                words = words[len(prefix.split()):]
+                sentence = " ".join(words)
+        if words[0] in QUESTION_WORDS:
+            return LARGE, "question"
+        if COMPLEX_WORDS.intersection(words):
+            return LARGE, "multi_step"
+        if len(words) > self.max_words:
+            return LARGE, "long"
+        devices = self.registry.find_phrases(words)
+        if len(devices) > 1:
+            return LARGE, "multi_device"
+        if not devices and not self.registry.mentioned_domains(words):
+            return LARGE, "no_device"
+        if not self.action_words.intersection(words):
+            return LARGE, "no_action"
+        return SMALL, "command"
+
+    def route(self, text):
+        """:return: (tier, model)"""
+        tier, _ = self.classify(text)
+        return tier, self.models[tier]
+
+    def record(self, tier, elapsed, ok=True):
+        with self.lock:
+            stats = self.stats[tier]
+            stats.latencies.append(elapsed)
+            stats.total += 1
+            stats.failures += 0 if ok else 1
+            total = sum(s.total for s in self.stats.values())
+        if self.log_every and total % self.log_every == 0:
+            print(f"[MODEL TIER] {self.snapshot()}")
+
+    def snapshot(self):
+        with self.lock:
+            return {tier: dict(stats.snapshot(), model=self.models[tier]) for tier, stats in self.stats.items()}
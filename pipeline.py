@@ -0,0 +1,518 @@
+import inspect
+import json
+import re
+import time
+import types
+from asr import AsrClient, StreamingAsrClient
+from chat import ChatBot
+from device_registry import DeviceRegistry
+from entity_index import EntityIndex
+from fast_path import FastPathMatcher
+from intent_cache import IntentCache, config_fingerprint
+from config_store import ConfigStore
+from command_stream import IncrementalCommandParser
+from command_executor import CommandExecutor
+from prompt_builder import PromptBuilder
+from llm_dispatcher import LlmDispatcher
+from model_router import ModelRouter
+from structured_output import StructuredOutput, INSTRUCTION as STRUCTURED_INSTRUCTION
+from http_pool import preconnect
+import ha_ws
+from state_mirror import start_mirror
+from service_registry import SERVICE_REGISTRY
+from ha_control import call_service, describe_state
+from config import (
+    SYSTEM_PROMPT, DEVICE_CONFIG, DEVICE_CONFIG_PATH, CONFIG_RELOAD_INTERVAL, generate_system_prompt, HTTP_PRECONNECT, ASR_STREAM_URL, FAST_PATH_ENABLED,
+    INTENT_CACHE_SIZE, INTENT_CACHE_TTL, INTENT_CACHE_PATH, LLM_STREAM, PROMPT_TOP_K, PROMPT_PRUNE_SERVICES,
+    STRUCTURED_OUTPUT, STRUCTURED_MAX_TOKENS, LLM_MAX_CONCURRENCY, LLM_BATCH_WINDOW_MS, LLM_MAX_BATCH,
+    LLM_SMALL_MODEL, LLM_LARGE_MODEL, EXEC_MAX_IN_FLIGHT, EXEC_COALESCE, EXEC_VALIDATE_ENTITIES, HA_TRANSPORT
+)
+
+
+class DeviceSnapshot:
+    """一个版本的 devices.yaml 编译出的提示词、设备注册表和派生索引；热加载时整体替换"""
+    __slots__ = ("version", "system_prompt", "fingerprint", "registry", "entities", "fast_path", "prompts", "structured")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+
+class PinnedPipeline:
+    """
+    一个请求固定使用的配置快照：请求进行中 devices.yaml 被重新加载时，该请求的理解、校验和执行仍使用同一版本。
+    只保存快照本身，其余属性（LLM、执行器、意图缓存、模型档位统计等）的读写都直接落到共享的流水线上
+    """
+    __slots__ = ("pipeline", "snapshot")
+
+    def __init__(self, pipeline, snapshot):
+        object.__setattr__(self, "pipeline", pipeline)
+        object.__setattr__(self, "snapshot", snapshot)
+
+    def __getattr__(self, name):
+        value = getattr(self.pipeline, name)
+        if inspect.ismethod(value) and value.__self__ is self.pipeline:
+            # 方法重新绑定到本对象，方法内读到的 self.snapshot 即固定的快照
+            return types.MethodType(value.__func__, self)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self.pipeline, name, value)
+
+
+class VoicePipeline:
+    """服务端语音处理流水线：ASR -> LLM -> 解析 -> 执行
+
+    不创建任何音频设备、唤醒词或 VAD 模型，一个实例由所有连接共享。
+    """
+
+    def __init__(self, api_key, base_url, model):
+        self.bot = ChatBot(
+            api_key=api_key,
+            base_url=base_url,
+            model=model,
+            system_message=SYSTEM_PROMPT
+        )
+        # 可选的调度器：多个连接同时请求时合批、限流，并统计排队/模型耗时
+        self.llm = LlmDispatcher(
+            self.bot,
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            batch_window=LLM_BATCH_WINDOW_MS / 1000.0,
+            max_batch=LLM_MAX_BATCH
+        ) if LLM_MAX_CONCURRENCY > 0 else self.bot
+        self.asr = AsrClient()
+        self.streaming_asr = StreamingAsrClient() if ASR_STREAM_URL else None
+        self.services = SERVICE_REGISTRY
+        self.executor = CommandExecutor(self.execute_command, max_in_flight=EXEC_MAX_IN_FLIGHT)
+        # devices.yaml 派生的全部结构放在一个快照里，热加载时整体替换
+        self.structured_rejected = False    # 推理服务拒绝过结构化输出参数后不再尝试，热加载后沿用
+        self.snapshot = self.build_snapshot(DEVICE_CONFIG, 1)
+        # 模型档位的耗时统计跨配置版本累计，不放进快照，热加载时只换注册表
+        self.tiers = ModelRouter(
+            self.snapshot.registry, small_model=LLM_SMALL_MODEL, large_model=LLM_LARGE_MODEL
+        ) if LLM_SMALL_MODEL else None
+        self.config_store = ConfigStore(DEVICE_CONFIG_PATH, DEVICE_CONFIG, interval=CONFIG_RELOAD_INTERVAL)
+        self.config_store.listeners.append(self.apply_config)
+        self.intent_cache = IntentCache(
+            self.snapshot.fingerprint,
+            max_entries=INTENT_CACHE_SIZE,
+            ttl=INTENT_CACHE_TTL,
+            path=INTENT_CACHE_PATH or None
+        ) if INTENT_CACHE_SIZE > 0 else None
+
+    def build_snapshot(self, config, version):
+        """由一份设备配置编译提示词、设备注册表和各个派生索引"""
+        system_prompt = SYSTEM_PROMPT if config is DEVICE_CONFIG else generate_system_prompt(config)
+        registry = DeviceRegistry(config)
+        return DeviceSnapshot(
+            version=version,
+            system_prompt=system_prompt,
+            fingerprint=config_fingerprint(config, system_prompt),
+            registry=registry,
+            # 没有配置设备时无从校验，实体 ID 原样交给 HA
+            entities=EntityIndex(registry) if EXEC_VALIDATE_ENTITIES and registry.devices else None,
+            fast_path=FastPathMatcher(registry) if FAST_PATH_ENABLED else None,
+            prompts=PromptBuilder(
+                registry, top_k=PROMPT_TOP_K, prune_services=PROMPT_PRUNE_SERVICES
+            ) if PROMPT_TOP_K > 0 else None,
+            structured=StructuredOutput(
+                registry, mode=STRUCTURED_OUTPUT, max_tokens=STRUCTURED_MAX_TOKENS
+            ) if STRUCTURED_OUTPUT != "off" and not self.structured_rejected else None,
+        )
+
+    def apply_config(self, config, version):
+        """ConfigStore 监听者（在监视线程中调用）：先完整构建新快照，再一次赋值替换；
+        已经通过 pinned() 取得旧快照的请求不受影响"""
+        previous = self.snapshot
+        snapshot = self.build_snapshot(config, version)
+        self.snapshot = snapshot
+        if self.tiers:
+            self.tiers.rebind(snapshot.registry)
+        if self.intent_cache:
+            self.intent_cache.rebind(snapshot.fingerprint)
+        print(f"[CONFIG] Device snapshot {previous.version} -> {version}: {len(snapshot.registry.devices)} devices")
+
+    def pinned(self):
+        """固定当前快照，供一个请求从头用到尾（见 PinnedPipeline）"""
+        return PinnedPipeline(self, self.snapshot)
+
+    def warm_up(self):
+        """启动时预先建立 ASR / HA 的 keep-alive 连接，并启动状态镜像（HA_STATE_MIRROR）"""
+        if HTTP_PRECONNECT:
+            preconnect()
+            if HA_TRANSPORT == "websocket":
+                try:
+                    ha_ws.get_client().connect()
+                except ha_ws.NotConnected as e:
+                    print(f"[HA WS] Pre-connect failed: {e}")
+        start_mirror()
+        self.config_store.start()
+
+    def system_prompt_for(self, text: str) -> str:
+        """只包含与该文本相关设备的系统提示词（设备不多时即完整提示词）"""
+        snapshot = self.snapshot
+        return snapshot.prompts.build(text) if snapshot.prompts else snapshot.system_prompt
+
+    def model_for(self, text: str):
+        """按复杂度选择模型档位：(tier, model)；未配置小模型时为 (None, None)，使用 ChatBot 的默认模型"""
+        return self.tiers.route(text) if self.tiers else (None, None)
+
+    def record_tier(self, tier, started: float, ok: bool = True):
+        if tier and self.tiers:
+            self.tiers.record(tier, time.time() - started, ok)
+
+    def ask_llm(self, text: str, metrics=None) -> str:
+        """发送文本给LLM（无状态请求，多个连接可并发调用，无需重置上下文）
+
+        :param metrics: 可选的 LlmMetrics，返回后包含本次请求的 TTFT / token 数 / 重试次数
+        """
+        tier, model = self.model_for(text)
+        start = time.time()
+        content = self.llm.complete(text, self.system_prompt_for(text), model, metrics)
+        self.record_tier(tier, start, ok=not isinstance(content, dict))
+        if isinstance(content, dict):
+            # 调用失败时 ChatBot 返回 {"error": ...}，统一成文本，下游按"无命令"处理
+            content = content.get("error", "")
+        return content
+
+    def match_local(self, text: str):
+        """
+        不调用 LLM 的本地匹配：快速通道 -> 意图缓存，均为微秒级
+        :return: (content, commands, source)，未命中返回 None
+        """
+        fast_path = self.snapshot.fast_path
+        if fast_path:
+            result = fast_path.match(text)
+            if result:
+                return result.content, result.commands, "fast_path"
+        if self.intent_cache:
+            cached = self.intent_cache.get(text)
+            stats = self.intent_cache.stats()
+            if (stats["hits"] + stats["misses"]) % 50 == 0:
+                print(f"[CACHE] {stats}")
+            if cached:
+                return cached[0], cached[1], "cache"
+        return None
+
+    def remember(self, text: str, content, commands: list):
+        """把 LLM 的结果写入意图缓存；请求开始后配置已重新加载时不写入（结果基于旧配置）"""
+        if self.intent_cache and self.intent_cache.fingerprint == self.snapshot.fingerprint:
+            self.intent_cache.put(text, content, commands)
+
+    def understand(self, text: str, metrics=None):
+        """
+        把识别文本转换为命令：先尝试快速通道和意图缓存，未命中（或有歧义）再交给 LLM
+        :return: (content, commands, source)，source 为 'fast_path'、'cache' 或 'llm'
+        """
+        local = self.match_local(text)
+        if local:
+            return local
+        content = self.ask_llm(text, metrics)
+        commands = self.parse_response(content)
+        self.remember(text, content, commands)
+        return content, commands, "llm"
+
+    def close(self):
+        """退出前把意图缓存落盘"""
+        if self.intent_cache:
+            self.intent_cache.maybe_save(force=True)
+
+    def parse_response(self, response: str) -> list:
+        """
+        Extract homeassistant commands from LLM response
+        Returns a list of command dictionaries
+        """
+        commands = []
+        
+        # 匹配 ```homeassistant ... ``` 代码块
+        pattern = r"```homeassistant\n(.*?)\n```"
+        matches = re.findall(pattern, response, re.DOTALL)
+        
+        if not matches:
+            return commands
+        
+        for match in matches:
+            # 处理代码块中的内容，可能包含多个 JSON 对象
+            # 按行分割
+            lines = match.strip().split('\n')
+            
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                
+                try:
+                    # 尝试解析每一行作为 JSON
+                    command = json.loads(line)
+                    commands.append(command)
+                except json.JSONDecodeError as e:
+                    print(f"[WARNING] Failed to parse command: {line}")
+                    print(f"[WARNING] JSON Error: {e}")
+                    continue
+        
+        return commands
+    
+    def execute_command(self, command: dict):
+        """Execute a single homeassistant command
+
+        按服务名在服务注册表中查表（O(1)），由注册表构建服务数据后调用 HA；
+        未登记的服务按通用规则转发，参数缺失或不合法时抛出 ValueError
+        """
+        if not command:
+            return
+            
+        service = command.get("service")
+        target_device = command.get("target_device")
+        
+        if not service or not target_device:
+            print("[ERROR] Invalid command format: missing service or target_device.")
+            return
+        
+        try:
+            spec = self.services.lookup(service)
+        except ValueError as e:
+            print(f"[ERROR] {e}")
+            return
+        
+        print(f"[EXEC] Domain: {spec.domain}, Device: {target_device}, Action: {spec.action}")
+        
+        if spec.query:
+            result = describe_state(target_device)
+            print(result)
+            return result
+        
+        data = spec.build_payload(target_device, command)
+        result = call_service(spec.ha_domain, spec.ha_service, data)
+        if result is None:
+            # call_service 出错时已打印原因并返回 None，这里让该命令的状态记为失败
+            raise RuntimeError(f"Home Assistant call {spec.ha_domain}.{spec.ha_service} failed")
+        return result
+    
+    def validate_command(self, command: dict):
+        """
+        提交前校验命令：格式、服务名、实体 ID 及该实体是否支持该服务、服务参数（与 execute_command 构建服务数据的规则相同）
+        :return: 错误信息，合法时返回 None
+        """
+        if not isinstance(command, dict):
+            return "invalid command format"
+        service = command.get("service")
+        target_device = command.get("target_device")
+        if not service or not target_device:
+            return "missing service or target_device"
+        if not isinstance(service, str):
+            return f"invalid service '{service}'"
+        entities = self.snapshot.entities
+        if entities:
+            if not isinstance(target_device, str) or target_device not in entities.devices:
+                return f"unknown entity '{target_device}'"
+            if not entities.supports(target_device, service):
+                return f"{service} is not supported by {target_device}"
+        try:
+            spec = self.services.lookup(service)
+            if not spec.query:
+                spec.build_payload(target_device, command)
+        except ValueError as e:
+            return str(e)
+        return None
+
+    def expand_groups(self, commands: list) -> list:
+        """组目标（"light.all"、"all"）按设备注册表展开为逐个实体的命令，执行结果也逐个实体返回"""
+        expanded = []
+        for command in commands:
+            members = None
+            if isinstance(command, dict):
+                members = self.snapshot.registry.group_members(command.get("service"), command.get("target_device"))
+            if members:
+                expanded.extend(dict(command, target_device=entity_id) for entity_id in members)
+            else:
+                expanded.append(command)
+        return expanded
+
+    def resolve_targets(self, commands: list) -> list:
+        """不在设备注册表中的实体 ID 按名称修正为最接近的实体（如 light.living_room -> light.livingroom）；
+        无法确定的保持原样，由 validate_command 拒绝"""
+        entities = self.snapshot.entities
+        if not entities:
+            return commands
+        resolved = []
+        for command in commands:
+            target = command.get("target_device") if isinstance(command, dict) else None
+            if isinstance(target, str) and target not in entities.devices:
+                entity_id = entities.resolve(target, command.get("service"))
+                if entity_id:
+                    print(f"[EXEC] Resolved unknown entity {target} -> {entity_id}")
+                    command = dict(command, target_device=entity_id)
+            resolved.append(command)
+        return resolved
+
+    def can_coalesce(self, command: dict) -> bool:
+        """状态查询逐个实体执行，其余服务都可以合并"""
+        service = command.get("service")
+        if not EXEC_COALESCE or not isinstance(service, str):
+            return False
+        try:
+            return not self.services.lookup(service).query
+        except ValueError:
+            return False
+
+    def queue_commands(self, commands: list, on_executed=None):
+        """
+        校验并提交命令后立即返回，不等执行完成；同一实体的命令排在之前提交的命令之后（见 CommandExecutor）
+        :return: ExecutionBatch，wait() 取得全部结果，snapshot() 取得当前状态
+        """
+        batch = self.executor.batch(on_executed, self.validate_command)
+        if not commands:
+            print("[INFO] No commands to execute")
+            return batch
+        commands = self.resolve_targets(self.expand_groups(commands))
+        print(f"[INFO] Executing {len(commands)} command(s)...")
+        batch.submit_many(commands, self.can_coalesce)
+        return batch
+
+    def execute_commands(self, commands: list, on_executed=None) -> list:
+        """Execute multiple homeassistant commands
+
+        不同实体的命令并发执行，同一实体按顺序执行（见 CommandExecutor）；
+        服务和参数相同的命令合并为一次 HA 调用（entity_id 为列表）；不合法的命令不执行，状态为 rejected
+        :param on_executed: 每条命令执行完后回调 on_executed(index, command, status)
+        :return: 每条命令（组目标展开后）的结果 {index, service, target_device, status, started, duration, coalesced}，按命令顺序
+        """
+        if not commands:
+            print("[INFO] No commands to execute")
+            return []
+        results = self.queue_commands(commands, on_executed).wait()
+        print(f"\n[INFO] All commands executed")
+        return results
+
+    @staticmethod
+    def summarize_status(results: list) -> str:
+        """整体执行状态：第一条错误；没有错误时，有命令尚未执行完为 'queued'，否则为 'success'"""
+        statuses = [r["status"] for r in results]
+        error = next((s for s in statuses if s not in ("success", "queued")), None)
+        return error or ("queued" if "queued" in statuses else "success")
+
+    def stream_llm(self, text: str, on_executed=None, metrics=None):
+        """
+        流式调用 LLM：代码块中的每条命令一闭合就立即提交执行，不等模型输出结尾的寒暄，
+        也不等前一条命令执行完（同一实体的命令仍按顺序执行）
+        :return: (content, commands, batch)，batch 中的命令可能仍在执行
+        """
+        parser = IncrementalCommandParser()
+        batch = self.executor.batch(on_executed, self.validate_command)
+        tier, model = self.model_for(text)
+        start = time.time()
+
+        def run(commands):
+            for command in self.resolve_targets(self.expand_groups(commands)):
+                index = batch.submit(command)
+                print(f"[EXEC] Streamed command {index + 1}: {command}")
+
+        try:
+            for delta in self.llm.stream_complete(text, self.system_prompt_for(text), model, metrics):
+                run(parser.feed(delta))
+            self.record_tier(tier, start)
+        except Exception as e:
+            print(f"[LLM ERROR] Streaming failed: {e}")
+            self.record_tier(tier, start, ok=False)
+            if not parser.parts:
+                parser.parts.append(f"API call failed: {str(e)}")
+        # 回复被截断时代码块末尾没有换行的半行不执行（见 IncrementalCommandParser.close）
+        parser.close()
+        return parser.content, parser.commands, batch
+
+    def structured_output(self):
+        """本次请求使用的 StructuredOutput；未开启或推理服务拒绝过时为 None"""
+        return None if self.structured_rejected else self.snapshot.structured
+
+    def ask_llm_structured(self, text: str, metrics=None):
+        """
+        结构化输出模式调用 LLM
+        :return: (content, commands)；推理服务不支持或输出不合法时返回 None（调用方回退到自由文本）
+        """
+        structured = self.structured_output()
+        tier, model = self.model_for(text)
+        start = time.time()
+        try:
+            raw = self.llm.complete_json(
+                text, self.system_prompt_for(text) + STRUCTURED_INSTRUCTION, model, metrics,
+                **structured.request_options()
+            )
+            self.record_tier(tier, start)
+        except Exception as e:
+            self.record_tier(tier, start, ok=False)
+            if getattr(e, "status_code", None) in (400, 404, 422):
+                # 推理服务不支持 response_format / tools，不再尝试，避免每条指令都多一次失败请求
+                print(f"[LLM ERROR] Structured output rejected by the server, using free text from now on: {e}")
+                self.structured_rejected = True
+            else:
+                print(f"[LLM ERROR] Structured output failed, falling back to free text: {e}")
+            return None
+        result = structured.parse(raw)
+        if result is None:
+            print(f"[WARNING] Invalid structured output, falling back to free text: {str(raw)[:200]}")
+        return result
+
+    def llm_and_queue(self, text: str, on_executed=None, metrics=None):
+        """
+        调用 LLM 并提交命令：结构化输出 -> 流式自由文本 -> 整段自由文本，依配置和可用性依次选择
+        :return: (content, commands, batch)，不等命令执行完
+        """
+        if self.structured_output():
+            result = self.ask_llm_structured(text, metrics)
+            if result:
+                content, commands = result
+                return content, commands, self.queue_commands(commands, on_executed)
+        if LLM_STREAM:
+            return self.stream_llm(text, on_executed, metrics)
+        content = self.ask_llm(text, metrics)
+        commands = self.parse_response(content)
+        return content, commands, self.queue_commands(commands, on_executed)
+
+    def llm_and_execute(self, text: str, on_executed=None, metrics=None):
+        """
+        调用 LLM 并执行命令（见 llm_and_queue），等全部命令执行完
+        :return: (content, commands, results)
+        """
+        content, commands, batch = self.llm_and_queue(text, on_executed, metrics)
+        return content, commands, batch.wait()
+
+    def understand_and_queue(self, text: str, on_executed=None, metrics=None):
+        """
+        理解并提交命令：本地匹配命中直接提交；否则调用 LLM。命令校验通过、进入队列后即返回
+        :return: (content, commands, source, batch)
+        """
+        local = self.match_local(text)
+        if local:
+            content, commands, source = local
+            return content, commands, source, self.queue_commands(commands, on_executed)
+        content, commands, batch = self.llm_and_queue(text, on_executed, metrics)
+        self.remember(text, content, commands)
+        return content, commands, "llm", batch
+
+    def understand_and_execute(self, text: str, on_executed=None, metrics=None):
+        """
+        理解并执行：本地匹配命中直接执行；否则调用 LLM（LLM_STREAM 开启时边生成边执行）
+        :param metrics: 可选的 LlmMetrics，调用了 LLM 时填入本次请求的计量
+        :return: (content, commands, source, results)
+        """
+        content, commands, source, batch = self.understand_and_queue(text, on_executed, metrics)
+        return content, commands, source, batch.wait()
+
+    def open_asr_stream(self, sample_rate=16000, channels=1):
+        """为流式上传的语音创建增量识别会话，未配置 ASR_STREAM_URL 时返回 None"""
+        if not self.streaming_asr:
+            return None
+        return self.streaming_asr.open(sample_rate, channels)
+
+    def recognize_speech(self, audio, sample_rate=16000, channels=1, asr_stream=None):
+        """Send audio (raw PCM or a WAV file path) to ASR API and return recognized text
+
+        If an incremental session is given, most of the audio has already been recognized
+        during upload; only fall back to full recognition when the session failed.
+        """
+        if asr_stream is not None:
+            text = asr_stream.finish()
+            if text is not None:
+                return text
+            print("[ASR] Streaming session failed, falling back to full recognition")
+        return self.asr.recognize(audio, sample_rate, channels)
@@ -0,0 +1,88 @@
+'''
+按相关性裁剪的系统提示词
+设备很多时，把全部设备写进 SYSTEM_PROMPT 会让边缘小模型把大部分 prefill 花在无关设备上。
+这里用本地词法索引（设备名、别名、实体ID、房间词、类型词）为每条识别文本挑出 top-k 候选设备，
+只把它们写进提示词。头部和服务列表保持不变放在最前面，作为稳定前缀供推理服务复用 KV cache。
+'''
+import re
+from collections import defaultdict
+from config import format_device, render_system_prompt
+from device_registry import DeviceRegistry, normalize
+
+# 不参与打分的常见词
+STOP_WORDS = {
+    "the", "a", "an", "to", "in", "on", "off", "of", "my", "and", "please", "set", "turn", "switch",
+    "is", "it", "at", "for", "me", "room", "up", "down",
+}
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数（单词 + 标点），用于比较裁剪前后的提示词长度"""
+    return len(_TOKEN_RE.findall(text))
+
+
+class PromptBuilder:
+    def __init__(self, registry=None, top_k=16, prune_services=False):
+        """
+        :param top_k: 每次最多写入的设备数；设备总数不超过 top_k 时与完整提示词相同
+        :param prune_services: 只保留候选设备所属 domain 的服务（服务列表不再是稳定前缀）
+        """
+        self.registry = registry or DeviceRegistry()
+        self.top_k = top_k
+        self.prune_services = prune_services
+        self.order = {device_id: i for i, device_id in enumerate(self.registry.devices)}
+
+        # 单词 -> 设备，补充整句短语匹配之外的部分命中（如只说了房间名）
+        self.word_index = defaultdict(set)
+        for device in self.registry.devices.values():
+            for phrase in device.phrases:
+                for word in phrase.split():
+                    if word not in STOP_WORDS:
+                        self.word_index[word].add(device.id)
+
+        services = self.registry.service_specs
+        devices = [device.spec for device in self.registry.devices.values()]
+        self.full_prompt = render_system_prompt(services, devices)
+        marker = "\nDevices:\n"
+        self.stable_prefix = self.full_prompt[:self.full_prompt.index(marker) + len(marker)]
+
+    def score(self, text):
+        """为每个设备打分：整句短语命中 > 单词命中 > 只提到设备类型"""
+        words = normalize(text).split()
+        scores = defaultdict(float)
+        for start, end, ids in self.registry.find_phrases(words):
+            for device_id in ids:
+                scores[device_id] += 3.0 * (end - start)
+        for word in set(words):
+            for device_id in self.word_index.get(word, ()):
+                scores[device_id] += 1.0
+        for domain in self.registry.mentioned_domains(words):
+            for device in self.registry.by_domain.get(domain, []):
+                scores[device.id] += 0.5
+        return scores
+
+    def select(self, text):
+        """返回 top-k 候选设备（保持 devices.yaml 中的顺序），没有任何命中时返回 None"""
+        scores = self.score(text)
+        if not scores:
+            return None
+        ranked = sorted(scores, key=lambda device_id: (-scores[device_id], self.order[device_id]))[:self.top_k]
+        return [self.registry.devices[device_id] for device_id in sorted(ranked, key=self.order.get)]
+
+    def build(self, text):
+        """
+        为一条识别文本构建系统提示词
+        设备总数不多、或文本里找不到任何相关设备（如闲聊、提问）时使用完整提示词
+        """
+        if len(self.registry.devices) <= self.top_k:
+            return self.full_prompt
+        devices = self.select(text)
+        if not devices:
+            return self.full_prompt
+        if not self.prune_services:
+            return self.stable_prefix + "\n".join(format_device(device.spec) for device in devices)
+        domains = {device.domain for device in devices}
+        services = [svc for svc in self.registry.service_specs if svc["name"].split(".", 1)[0] in domains]
+        return render_system_prompt(services, [device.spec for device in devices])
@@ -1,41 +1,59 @@
 import socket
 import threading
-import wave
 import time
-import json
 import uuid
-from main import HomeAssistantController
-from config import LLM_API_KEY, LLM_BASE_URL, LLM_MODEL
+from contextlib import nullcontext
+from framing import FrameReader, encode_message
+from pipeline import VoicePipeline
+from llm_metrics import LlmMetrics
+from config import LLM_API_KEY, LLM_BASE_URL, LLM_MODEL, EXEC_OPTIMISTIC_ACK
+from device_registry import normalize
 
 import string
-def normalize(s: str) -> str:
-    trans = str.maketrans({p: " " for p in r"""!"#$%&()*+,-./:;<=>?@[\]^_`{|}~"""})
-    return " ".join(s.lower().translate(trans).split())
+
+def log_chunk_progress(client_id, chunk_count, total):
+    # 可选：打印一下进度，防止看起来像卡死
+    if chunk_count % 10 == 0:
+        print(f"[{client_id}] .. received {chunk_count} chunks, total {total} bytes")
+
+def execution_result(batch, result, remaining):
+    """乐观确认模式下推送的 EXECUTION_RESULT 数据"""
+    return {
+        'index': result['index'],
+        'command': batch.commands[result['index']],
+        'status': result['status'],
+        'duration': result['duration'],
+        'elapsed': round(result['started'] + result['duration'], 3),
+        'remaining': remaining
+    }
+
+class ClientSession:
+    """单个连接的状态，只保存 socket 与少量元数据"""
+    __slots__ = ('socket', 'address', 'connected_at')
+
+    def __init__(self, client_socket, address):
+        self.socket = client_socket
+        self.address = address
+        self.connected_at = time.time()
+
 class LightweightVoiceServer:
     """轻量级语音控制服务器 - 只处理语音命令，不处理唤醒"""
     
-    def __init__(self, host='0.0.0.0', port=9999):
+    def __init__(self, host='0.0.0.0', port=9999, pipeline=None):
         self.host = host
         self.port = port
         
-        # 为每个客户端创建独立的Controller实例，避免对话上下文混乱
-        self.client_controllers = {}
-        self.controller_lock = threading.Lock()
+        # 所有客户端共享同一条流水线（ASR/LLM/解析/执行），不创建音频设备和唤醒/VAD模型
+        self.pipeline = pipeline or VoicePipeline(
+            api_key=LLM_API_KEY,
+            base_url=LLM_BASE_URL,
+            model=LLM_MODEL
+        )
         
         self.server_socket = None
         self.active_clients = {}
-        
-    def get_controller(self, client_id):
-        """获取或创建客户端专属的Controller"""
-        with self.controller_lock:
-            if client_id not in self.client_controllers:
-                self.client_controllers[client_id] = HomeAssistantController(
-                    api_key=LLM_API_KEY,
-                    base_url=LLM_BASE_URL,
-                    model=LLM_MODEL
-                )
-                print(f"[{client_id}] Created dedicated controller")
-            return self.client_controllers[client_id]
+        # 乐观确认模式下执行结果由后台线程推送，与连接线程的发送互斥，帧不会交错
+        self.send_locks = {}
     
     def start(self):
         """启动服务器"""
@@ -44,12 +62,16 @@ class LightweightVoiceServer:
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(10)
         
+        self.pipeline.warm_up()
+        
         print(f" Lightweight Voice Server started on {self.host}:{self.port}")
         print(f" Waiting for clients...")
         
         try:
             while True:
                 client_socket, address = self.server_socket.accept()
+                # 响应帧（ASR_PARTIAL / ASR_RESULT ...）连续小包发送，关闭 Nagle 避免与延迟 ACK 叠加
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 client_id = f"{address[0]}:{address[1]}"
                 print(f"✅ Client connected: {client_id}")
                 
@@ -61,41 +83,25 @@ class LightweightVoiceServer:
                 )
                 client_thread.start()
                 
-                self.active_clients[client_id] = {
-                    'socket': client_socket,
-                    'address': address,
-                    'connected_at': time.time()
-                }
+                self.active_clients[client_id] = ClientSession(client_socket, address)
                 
         except KeyboardInterrupt:
             print("\n Server shutting down...")
         finally:
+            self.pipeline.close()
             if self.server_socket:
                 self.server_socket.close()
-
-    def recv_exact(self, sock, count):
-        buf = b''
-        while len(buf) < count:
-            newbuf = sock.recv(count - len(buf))
-            if not newbuf: return None
-            buf += newbuf
-        return buf
     
     def handle_client(self, client_socket, address, client_id):
         """处理客户端请求"""
+        reader = FrameReader(client_socket)
+        self.send_locks[client_socket] = threading.Lock()
         try:
             while True:
-                # 1. 接收消息头长度 (4字节)
-                header_size_bytes = self.recv_exact(client_socket, 4)
-                if not header_size_bytes: break
-                
-                header_length = int.from_bytes(header_size_bytes, 'big')
+                # 1. 接收消息头 [4字节长度][JSON]
+                header = reader.read_json()
+                if header is None: break
                 
-                # 2. 接收消息头 JSON
-                header_data = self.recv_exact(client_socket, header_length)
-                if not header_data: break
-                
-                header = json.loads(header_data.decode('utf-8'))
                 msg_type = header.get('type')
                 request_id = header.get('request_id', str(uuid.uuid4()))
                 
@@ -105,60 +111,47 @@ class LightweightVoiceServer:
                     self.send_response(client_socket, 'PONG', 'alive', request_id)
                     
                 elif msg_type == 'VOICE_COMMAND':
-                    # === 核心修改部分开始 ===
                     audio_size = header.get('size', 0) # 如果是 0 或 -1，代表流式传输
                     
-                    audio_data = bytearray()
-                    
+                    asr_stream = None
                     if audio_size > 0:
                         # --- 兼容旧模式：一次性接收固定长度 ---
                         print(f"[{client_id}] Receiving fixed audio: {audio_size} bytes")
-                        data = self.recv_exact(client_socket, audio_size)
-                        if not data:
-                            print(f"[{client_id}] Connection lost during audio recv")
-                            break
-                        audio_data.extend(data)
                     else:
                         # --- 新模式：流式接收 (Chunked) ---
                         # C++ 客户端逻辑：循环发送 [4字节长度][数据]，最后发送 [0000] 结束
                         print(f"[{client_id}] Receiving streamed audio...")
-                        chunk_count = 0
-                        while True:
-                            # 1. 读分片长度
-                            chunk_len_bytes = self.recv_exact(client_socket, 4)
-                            if not chunk_len_bytes: break
-                            
-                            chunk_len = int.from_bytes(chunk_len_bytes, 'big')
-                            
-                            # 2. 如果长度为0，表示传输结束
-                            if chunk_len == 0:
-                                print(f"[{client_id}] End of stream signal received.")
-                                break
-                                
-                            # 3. 读分片数据
-                            chunk = self.recv_exact(client_socket, chunk_len)
-                            if not chunk: break
-                            
-                            audio_data.extend(chunk)
-                            chunk_count += 1
-                            # 可选：打印一下进度，防止看起来像卡死
-                            if chunk_count % 10 == 0:
-                                print(f"[{client_id}] .. received {chunk_count} chunks, total {len(audio_data)} bytes")
-
-                    # === 核心修改部分结束 ===
-                    
-                    final_size = len(audio_data)
-                    print(f"[{client_id}] Audio received completely. Total: {final_size} bytes")
+                        # 配置了增量 ASR 时边收边识别，并推送 ASR_PARTIAL
+                        asr_stream = self.pipeline.open_asr_stream(header.get('sample_rate', 16000), header.get('channels', 1))
                     
-                    if final_size == 0:
-                         self.send_response(client_socket, 'ERROR', 'Empty audio', request_id)
-                         continue
-
-                    # 立即发送ACK
-                    self.send_response(client_socket, 'ACK', 'Audio received', request_id)
+                    try:
+                        # 直接 recv_into 到池化缓冲区，音频以 memoryview 交给后续处理，不做整段拷贝
+                        audio = reader.read_audio(
+                            audio_size,
+                            on_chunk=lambda chunk, count, total: self.forward_chunk(client_socket, client_id, request_id, asr_stream, chunk, count, total)
+                        )
+                        if audio is None:
+                            print(f"[{client_id}] Connection lost during audio recv")
+                            break
                     
-                    # 转回 bytes 类型供后续处理
-                    self.process_voice_command(client_socket, client_id, bytes(audio_data), header, request_id)
+                        try:
+                            final_size = len(audio)
+                            print(f"[{client_id}] Audio received completely. Total: {final_size} bytes")
+                        
+                            if final_size == 0:
+                                self.send_response(client_socket, 'ERROR', 'Empty audio', request_id)
+                                continue
+                        
+                            # 立即发送ACK
+                            self.send_response(client_socket, 'ACK', 'Audio received', request_id)
+                        
+                            self.process_voice_command(client_socket, client_id, audio.view, header, request_id, asr_stream)
+                        finally:
+                            audio.release()
+                    finally:
+                        # 上传中断、空语音等没有走到识别（finish）时，结束服务端已创建的增量识别会话
+                        if asr_stream is not None:
+                            asr_stream.abort()
                 
                 elif msg_type == 'PING':
                     self.send_response(client_socket, 'PONG', 'Server is alive', request_id)
@@ -173,36 +166,37 @@ class LightweightVoiceServer:
             import traceback
             traceback.print_exc()
         finally:
-            client_socket.close()
-            if client_id in self.active_clients:
-                del self.active_clients[client_id]
-            if client_id in self.client_controllers:
-                del self.client_controllers[client_id]
+            with self.send_locks.pop(client_socket):
+                client_socket.close()
+            self.active_clients.pop(client_id, None)
             print(f"[{client_id}]  Client disconnected")
     
-    def process_voice_command(self, client_socket, client_id, audio_data, header, request_id):
+    def forward_chunk(self, client_socket, client_id, request_id, asr_stream, chunk, chunk_count, total):
+        """每收到一个音频分片：打印进度，转发给增量 ASR，并把新的中间结果推给客户端"""
+        log_chunk_progress(client_id, chunk_count, total)
+        if asr_stream is None:
+            return
+        asr_stream.feed(chunk)
+        for partial in asr_stream.pop_partials():
+            self.send_response(client_socket, 'ASR_PARTIAL', {
+                'text': normalize(partial),
+                'audio_bytes': total
+            }, request_id)
+
+    def process_voice_command(self, client_socket, client_id, audio_data, header, request_id, asr_stream=None):
         """处理语音命令：ASR + LLM + 执行"""
         try:
-            # 获取客户端专属controller
-            controller = self.get_controller(client_id)
+            # 固定本请求使用的设备配置快照，处理过程中 devices.yaml 被重新加载也不受影响
+            pipeline = self.pipeline.pinned()
             
-            # 保存为临时WAV文件
-            timestamp = int(time.time() * 1000)
-            filename = f"temp_cmd_{client_id.replace(':', '_')}_{timestamp}.wav"
             sample_rate = header.get('sample_rate', 16000)
             channels = header.get('channels', 1)
             
-            with wave.open(filename, 'wb') as wf:
-                wf.setnchannels(channels)
-                wf.setsampwidth(2)  # 16-bit
-                wf.setframerate(sample_rate)
-                wf.writeframes(audio_data)
-            
             # 1. ASR识别
             print(f"[{client_id}][{request_id[:8]}]  Running ASR...")
             asr_start = time.time()
-            text = controller.recognize_speech(filename)
-            text = normalize(text)
+            text = pipeline.recognize_speech(audio_data, sample_rate, channels, asr_stream)
+            text = normalize(text) if text else text
             asr_time = time.time() - asr_start
             
             if not text or not text.strip():
@@ -222,38 +216,55 @@ class LightweightVoiceServer:
             print(f"[{client_id}][{request_id[:8]}]  Processing with LLM...")
             llm_start = time.time()
             
-            # 确保使用UTF-8编码传递中文
-            content = controller.bot.chat(text)
+            # 每条命令执行完立即推送 COMMAND_EXECUTED，不等 LLM 输出结束
+            def on_executed(index, cmd, status):
+                self.send_response(client_socket, 'COMMAND_EXECUTED', {
+                    'index': index,
+                    'command': cmd,
+                    'status': status,
+                    'elapsed': round(time.time() - llm_start, 3)
+                }, request_id)
+            
+            # 常见指令走快速通道/意图缓存，其余交给 LLM；命令在理解过程中即被执行
+            metrics = LlmMetrics()
+            batch = None
+            if EXEC_OPTIMISTIC_ACK:
+                # 乐观确认：命令校验通过、进入队列即回复，不等 HA 返回；执行结果由后台线程推送。
+                # 同一设备的命令排在之前的命令之后执行，按说话顺序生效；不等上一次回复的其他命令
+                content, command, source, batch = pipeline.understand_and_queue(text, None, metrics)
+                results = batch.snapshot()
+            else:
+                content, command, source, results = pipeline.understand_and_execute(text, on_executed, metrics)
             
             llm_time = time.time() - llm_start
+            # 调用了 LLM 时附带 TTFT / token 数 / decode 速度，区分慢在 prefill 还是 decode
+            llm_metrics = metrics.as_dict() if source == "llm" else None
             
-            print(f"[{client_id}][{request_id[:8]}]  LLM Response ({llm_time:.2f}s):")
+            print(f"[{client_id}][{request_id[:8]}]  LLM Response [{source}] ({llm_time:.2f}s):")
             print(f"   {content[:200]}...")  # 打印前200字符
             
-            # 重置对话上下文
-            controller.bot.chat("reset")
-            
-            # 3. 解析并执行命令
-            command = controller.parse_response(content)
-            
             if command:
-                print(f"[{client_id}][{request_id[:8]}]  Executing: {command}")
-                try:
-                    controller.execute_commands(command)
-                    execution_status = "success"
-                except Exception as e:
-                    print(f"[{client_id}][{request_id[:8]}]  Execution error: {e}")
-                    execution_status = f"error: {str(e)}"
+                execution_status = pipeline.summarize_status(results)
+                print(f"[{client_id}][{request_id[:8]}]  Executed: {command} ({execution_status})")
                 
                 self.send_response(client_socket, 'SUCCESS', {
                     'text': text,
                     'response': content,
                     'command': command,
                     'execution_status': execution_status,
+                    'results': results,
                     'asr_time': round(asr_time, 2),
                     'llm_time': round(llm_time, 2),
+                    'source': source,
+                    'llm_metrics': llm_metrics,
                     'total_time': round(asr_time + llm_time, 2)
                 }, request_id)
+                if batch is not None:
+                    threading.Thread(
+                        target=self.follow_execution,
+                        args=(client_socket, client_id, request_id, batch),
+                        daemon=True
+                    ).start()
             else:
                 print(f"[{client_id}][{request_id[:8]}] ℹ No executable command")
                 self.send_response(client_socket, 'INFO', {
@@ -261,7 +272,9 @@ class LightweightVoiceServer:
                     'response': content,
                     'message': 'No executable command found in response',
                     'asr_time': round(asr_time, 2),
-                    'llm_time': round(llm_time, 2)
+                    'llm_time': round(llm_time, 2),
+                    'source': source,
+                    'llm_metrics': llm_metrics
                 }, request_id)
         
         except Exception as e:
@@ -270,6 +283,19 @@ class LightweightVoiceServer:
             traceback.print_exc()
             self.send_response(client_socket, 'ERROR', str(e), request_id)
     
+    def follow_execution(self, client_socket, client_id, request_id, batch):
+        """乐观确认之后：每条命令执行完推送 EXECUTION_RESULT，有命令失败时最后推送一条 EXECUTION_FAILED 更正"""
+        results = batch.follow(lambda result, remaining: self.send_response(
+            client_socket, 'EXECUTION_RESULT', execution_result(batch, result, remaining), request_id
+        ))
+        execution_status = self.pipeline.summarize_status(results)
+        print(f"[{client_id}][{request_id[:8]}]  Execution finished ({execution_status})")
+        if execution_status != "success":
+            self.send_response(client_socket, 'EXECUTION_FAILED', {
+                'execution_status': execution_status,
+                'results': results
+            }, request_id)
+    
     def send_response(self, client_socket, msg_type, data, request_id=None):
         """发送响应给客户端"""
         try:
@@ -279,16 +305,19 @@ class LightweightVoiceServer:
                 'request_id': request_id,
                 'timestamp': time.time()
             }
-            response_json = json.dumps(response, ensure_ascii=False).encode('utf-8')
-            
             # 发送响应长度 + 响应内容
-            size = len(response_json).to_bytes(4, 'big')
-            client_socket.sendall(size + response_json)
+            with self.send_locks.get(client_socket) or nullcontext():
+                client_socket.sendall(encode_message(response))
             
             print(f"    Sent {msg_type} response (ID: {request_id[:8] if request_id else 'N/A'})")
         except Exception as e:
             print(f"    Error sending response: {e}")
 
 if __name__ == "__main__":
-    server = LightweightVoiceServer(host='0.0.0.0', port=9999)
+    from config import SERVER_MODE
+    if SERVER_MODE == "async":
+        from async_server import AsyncVoiceServer
+        server = AsyncVoiceServer(host='0.0.0.0', port=9999)
+    else:
+        server = LightweightVoiceServer(host='0.0.0.0', port=9999)
     server.start()
\ No newline at end of file
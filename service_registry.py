@@ -0,0 +1,169 @@
+'''
+服务注册表
+把 "domain.service" 映射到参数表和请求体构建方式，执行时按服务名 O(1) 查表，
+取代按 domain / action 逐级 if/elif 判断。
+未登记的服务按通用规则处理：entity_id 加上命令中的其余字段原样作为服务数据，任何 HA domain 都不需要新代码。
+参数的 JSON Schema 供结构化输出使用，服务的默认参数供提示词和设备注册表使用（devices.yaml 未写参数时）。
+本模块只描述数据，不发请求，也不依赖 config，可以被任何模块导入。
+'''
+import ast
+
+
+def to_brightness(value):
+    """0-1 的小数按比例换算为 HA 的 0-255，大于 1 的值视为已经是 0-255"""
+    value = float(value)
+    if value < 0:
+        raise ValueError(f"brightness must not be negative: {value}")
+    return int(value * 255) if value <= 1 else min(255, int(value))
+
+
+def to_rgb(value):
+    """[r, g, b] / (r, g, b) / "(r, g, b)" -> [r, g, b]"""
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            raise ValueError(f"Failed to parse rgb_color: {value}")
+    if not isinstance(value, (list, tuple)) or len(value) != 3:
+        raise ValueError(f"rgb_color must have 3 components: {value}")
+    return [int(c) for c in value]
+
+
+def to_number(value):
+    """数字原样保留（22 不变成 22.0），字符串转换为 float"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+
+def to_percent(value):
+    value = int(float(value))
+    if not 0 <= value <= 100:
+        raise ValueError(f"Value must be between 0 and 100: {value}")
+    return value
+
+
+class Param:
+    __slots__ = ("name", "schema", "coerce")
+
+    def __init__(self, name, schema, coerce=None):
+        self.name = name
+        self.schema = schema          # 结构化输出使用的 JSON Schema
+        self.coerce = coerce          # 命令中的值 -> HA 服务数据中的值
+
+
+PARAMS = {param.name: param for param in [
+    # 与 to_brightness 一致：0-1 为比例，大于 1 视为 0-255
+    Param("brightness", {"type": "number", "minimum": 0, "maximum": 255}, to_brightness),
+    Param("rgb_color", {
+        "type": "array", "items": {"type": "integer", "minimum": 0, "maximum": 255},
+        "minItems": 3, "maxItems": 3,
+    }, to_rgb),
+    Param("color_name", {"type": "string"}, str),
+    Param("position", {"type": "integer", "minimum": 0, "maximum": 100}, to_percent),
+    Param("percentage", {"type": "integer", "minimum": 0, "maximum": 100}, to_percent),
+    Param("temperature", {"type": "number"}, to_number),
+    Param("fan_mode", {"type": "string", "enum": ["auto", "low", "medium", "high"]}, str),
+    Param("hvac_mode", {"type": "string", "enum": ["off", "heat", "cool", "heat_cool", "auto", "dry", "fan_only"]}, str),
+    Param("volume_level", {"type": "number", "minimum": 0, "maximum": 1}, to_number),
+]}
+
+# 未登记参数的 schema
+ANY_PARAM_SCHEMA = {"type": ["string", "number"]}
+
+
+class Service:
+    __slots__ = ("name", "domain", "action", "params", "required", "required_any", "ha_domain", "ha_service", "query")
+
+    def __init__(self, name, params=None, required=(), required_any=(), ha_service=None, query=False):
+        """
+        :param params: 接受的参数名；None 表示不限制（通用服务，命令中的其余字段原样转发）
+        :param required: 必须提供的参数
+        :param required_any: 至少要提供其中一个的参数
+        :param ha_service: 实际调用的 HA 服务（别名服务，如 light.set_color -> light.turn_on）
+        :param query: 只查询状态，不调用服务
+        """
+        self.name = name
+        self.domain, self.action = name.split(".", 1)
+        self.params = tuple(params) if params is not None else None
+        self.required = tuple(required)
+        self.required_any = tuple(required_any)
+        self.ha_domain, self.ha_service = (ha_service or name).split(".", 1)
+        self.query = query
+
+    def build_payload(self, entity_id, command):
+        """命令 -> HA 服务数据；参数缺失或不合法时抛出 ValueError"""
+        data = {"entity_id": entity_id}
+        for key, value in command.items():
+            if key in ("service", "target_device") or value is None:
+                continue
+            if self.params is not None and key not in self.params:
+                continue
+            param = PARAMS.get(key)
+            data[key] = param.coerce(value) if param and param.coerce else value
+        for key in self.required:
+            if key not in data:
+                raise ValueError(f"Missing parameter '{key}' for {self.name}")
+        if self.required_any and not any(key in data for key in self.required_any):
+            raise ValueError(f"{self.name} requires one of: {', '.join(self.required_any)}")
+        return data
+
+
+# 需要参数换算、别名或限定参数的服务；其余服务（包括任何新 domain）走通用规则
+SERVICE_TABLE = [
+    Service("light.turn_on", params=("brightness", "rgb_color")),
+    Service("light.turn_off", params=()),
+    # 别名到 light.turn_on，没有颜色参数时会变成单纯开灯，因此必须带颜色
+    Service("light.set_color", params=("rgb_color", "color_name"), required_any=("rgb_color", "color_name"),
+            ha_service="light.turn_on"),
+    Service("cover.open_cover", params=()),
+    Service("cover.close_cover", params=()),
+    Service("cover.set_position", params=("position",), required=("position",), ha_service="cover.set_cover_position"),
+    Service("cover.set_cover_position", params=("position",), required=("position",)),
+    Service("fan.turn_on", params=()),
+    Service("fan.turn_off", params=()),
+    Service("fan.increase_speed", params=()),
+    Service("fan.decrease_speed", params=()),
+    Service("climate.set_temperature", params=("temperature",), required=("temperature",)),
+    Service("climate.set_fan_mode", params=("fan_mode",), required=("fan_mode",)),
+    Service("lock.lock", params=()),
+    Service("lock.unlock", params=()),
+    Service("media_player.media_play", params=()),
+    Service("media_player.media_pause", params=()),
+    Service("media_player.media_stop", params=()),
+    Service("switch.turn_on", params=()),
+    Service("switch.turn_off", params=()),
+]
+
+
+class ServiceRegistry:
+    def __init__(self, services=SERVICE_TABLE):
+        self.services = {service.name: service for service in services}
+        self.generic = {}   # 按需生成的通用服务，缓存下来保持 O(1)
+
+    def lookup(self, name):
+        """服务名 -> Service；格式不合法（包括不是字符串）时抛出 ValueError"""
+        if not isinstance(name, str):
+            raise ValueError(f"Invalid service format: {name!r}")
+        service = self.services.get(name) or self.generic.get(name)
+        if service:
+            return service
+        domain, sep, action = name.partition(".")
+        if not sep or not domain or not action or "." in action:
+            raise ValueError(f"Invalid service format: '{name}'")
+        # <domain>.get_state 只查询状态
+        service = Service(name, query=action == "get_state")
+        self.generic[name] = service
+        return service
+
+    def default_params(self, name):
+        """登记的服务接受的参数，devices.yaml 没有写参数时使用"""
+        service = self.services.get(name)
+        return list(service.params or ()) if service else []
+
+    @staticmethod
+    def param_schema(param):
+        return PARAMS[param].schema if param in PARAMS else ANY_PARAM_SCHEMA
+
+
+SERVICE_REGISTRY = ServiceRegistry()
@@ -0,0 +1,141 @@
+'''
+Home Assistant 状态镜像
+连接上 HA WebSocket 后订阅 state_changed 事件并全量加载一次 get_states，之后由事件保持最新，
+状态查询直接读内存（微秒级），不再为每次查询发一个 GET /api/states/<entity_id>。
+订阅在线时镜像视为最新；连接断开后镜像开始变旧，断开超过 max_stale 秒时 lookup 返回 None，
+调用方回退到向 HA 查询。重连（ha_ws 在后台自动完成）后重新全量加载。
+'''
+import threading
+import time
+import ha_ws
+from config import HA_STATE_MIRROR, HA_MIRROR_MAX_STALE
+
+
+class StateMirror:
+    def __init__(self, client, max_stale=30.0):
+        """
+        :param client: HaWebSocketClient
+        :param max_stale: 与 HA 断开超过该秒数后不再使用镜像中的状态
+        """
+        self.client = client
+        self.max_stale = max_stale
+        self.lock = threading.Lock()
+        self.states = {}            # entity_id -> (state, 收到的时间)
+        self.live = False
+        self.synced_at = None       # 最近一次全量加载完成的时间
+        self.lost_at = None         # 订阅断开的时间
+        self.updated_during_load = None
+        self.events = 0
+
+    def start(self):
+        """订阅事件并全量加载；HA 暂时连不上时抛出 NotConnected，连上后会自动加载"""
+        self.client.on_connect.append(self.reload)
+        self.client.on_disconnect.append(self.disconnected)
+        connected = self.client.ws is not None
+        self.client.subscribe("state_changed", self.on_event)
+        if connected:
+            # 已有连接时 subscribe 不会触发 on_connect，这里手动加载
+            self.reload()
+
+    def reload(self):
+        """全量加载；先订阅后加载，加载期间由事件更新过的实体以事件为准"""
+        with self.lock:
+            self.updated_during_load = set()
+        start = time.time()
+        try:
+            snapshot = self.client.request({"type": "get_states"})
+        except BaseException:
+            with self.lock:
+                self.updated_during_load = None
+            raise
+        now = time.time()
+        with self.lock:
+            states = {s["entity_id"]: (s, now) for s in snapshot or () if s.get("entity_id")}
+            for entity_id in self.updated_during_load:
+                if entity_id in self.states:
+                    states[entity_id] = self.states[entity_id]
+                else:
+                    states.pop(entity_id, None)
+            self.states = states
+            self.updated_during_load = None
+            self.live = True
+            self.synced_at = now
+            self.lost_at = None
+        print(f"[HA MIRROR] Loaded {len(states)} entities in {(now - start) * 1000:.1f} ms")
+
+    def on_event(self, event):
+        data = event.get("data") or {}
+        entity_id = data.get("entity_id")
+        if not entity_id:
+            return
+        new_state = data.get("new_state")
+        now = time.time()
+        with self.lock:
+            if new_state is None:
+                self.states.pop(entity_id, None)    # 实体被删除
+            else:
+                self.states[entity_id] = (new_state, now)
+            if self.updated_during_load is not None:
+                self.updated_during_load.add(entity_id)
+            self.events += 1
+
+    def disconnected(self):
+        with self.lock:
+            if self.live:
+                self.live = False
+                self.lost_at = time.time()
+
+    def lookup(self, entity_id):
+        """
+        :return: (state, freshness)，镜像中没有该实体时 state 为 None（HA 中也没有）；
+                 镜像从未加载或已过旧时返回 None，调用方应向 HA 查询
+        freshness: {"live": 订阅是否在线, "age": 距收到该状态的秒数, "stale_for": 已断开的秒数}
+        """
+        now = time.time()
+        with self.lock:
+            if self.synced_at is None:
+                return None
+            stale_for = now - self.lost_at if not self.live and self.lost_at else 0.0
+            if stale_for > self.max_stale:
+                return None
+            entry = self.states.get(entity_id)
+            live = self.live
+        if entry is None:
+            return None, {"live": live, "age": None, "stale_for": round(stale_for, 3)}
+        state, received_at = entry
+        return state, {"live": live, "age": round(now - received_at, 3), "stale_for": round(stale_for, 3)}
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "live": self.live,
+                "entities": len(self.states),
+                "events": self.events,
+                "synced_at": self.synced_at,
+                "stale_for": round(time.time() - self.lost_at, 3) if self.lost_at else 0.0,
+            }
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """已启动的镜像；未开启 HA_STATE_MIRROR 或尚未启动时返回 None"""
+    return _mirror
+
+
+def start_mirror():
+    """HA_STATE_MIRROR 开启时启动共享镜像（只启动一次）"""
+    global _mirror
+    if not HA_STATE_MIRROR:
+        return None
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = StateMirror(ha_ws.get_client(), HA_MIRROR_MAX_STALE)
+            try:
+                _mirror.start()
+            except (ha_ws.NotConnected, ha_ws.HaError, TimeoutError) as e:
+                # 后台重连成功后会自动订阅并加载，期间查询走 HA
+                print(f"[HA MIRROR] Start deferred: {e}")
+    return _mirror
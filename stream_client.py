@@ -9,12 +9,14 @@ from kws import KeywordSpotter
 from vad import SileroVAD
 from collections import OrderedDict
 import struct
+from framing import FrameReader, encode_frame, encode_message
 
 class StreamingVoiceClient:
     def __init__(self, server_host, server_port=9999):
         self.server_host = server_host
         self.server_port = server_port
         self.socket = None
+        self.reader = None
         self.connected = False
         
         # 状态控制
@@ -47,6 +49,9 @@ class StreamingVoiceClient:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.server_host, self.server_port))
+            # 小分片高频发送，关闭 Nagle 避免结束标记被延迟
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.reader = FrameReader(self.socket)
             self.connected = True
             print(f"✅ Connected to {self.server_host}:{self.server_port}")
             
@@ -71,16 +76,14 @@ class StreamingVoiceClient:
             'sample_rate': self.sample_rate,
             'channels': 1
         }
-        header_json = json.dumps(header, ensure_ascii=False).encode('utf-8')
         # 发送头长度(4 bytes) + 头内容
-        self.socket.sendall(len(header_json).to_bytes(4, 'big') + header_json)
+        self.socket.sendall(encode_message(header))
         print(f"📡 Stream started (ID: {request_id[:8]})")
 
     def send_stream_chunk(self, audio_chunk_bytes):
         """步骤2: 发送音频分片"""
         # 协议: [4字节长度] + [数据]
-        length = len(audio_chunk_bytes)
-        self.socket.sendall(length.to_bytes(4, 'big') + audio_chunk_bytes)
+        self.socket.sendall(encode_frame(audio_chunk_bytes))
 
     def finish_stream(self):
         """步骤3: 发送结束标记"""
@@ -162,26 +165,13 @@ class StreamingVoiceClient:
         """接收服务端响应（和之前逻辑类似，略微简化）"""
         while self.should_receive:
             try:
-                # 读4字节长度
-                len_bytes = self.recv_bytes(4)
-                if not len_bytes: break
-                msg_len = int.from_bytes(len_bytes, 'big')
-                
-                # 读内容
-                msg_bytes = self.recv_bytes(msg_len)
-                resp = json.loads(msg_bytes.decode('utf-8'))
+                # 读 [4字节长度][JSON]
+                resp = self.reader.read_json()
+                if resp is None: break
                 self.handle_response(resp)
             except Exception:
                 break
     
-    def recv_bytes(self, n):
-        data = b''
-        while len(data) < n:
-            chunk = self.socket.recv(n - len(data))
-            if not chunk: return None
-            data += chunk
-        return data
-
     def handle_response(self, resp):
         rid = resp.get('request_id')
         msg_type = resp.get('type')
@@ -197,6 +187,8 @@ class StreamingVoiceClient:
 
         if msg_type == 'ASR_RESULT':
             print(f"📝 ASR Real-time: {resp['data'].get('text')} (Latency: {latency})")
+        elif msg_type == 'COMMAND_EXECUTED':
+            print(f"⚡ Executed: {resp['data'].get('command')} (Latency: {latency})")
         elif msg_type == 'SUCCESS':
             print(f"🤖 LLM Response: {resp['data'].get('response')[:50]}...")
             print(f"🚀 Command: {resp['data'].get('command')}")
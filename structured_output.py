@@ -0,0 +1,116 @@
+'''
+结构化输出模式
+由设备注册表生成命令的 JSON Schema（实体ID、服务为枚举，brightness / rgb_color / position /
+temperature / fan_mode 等参数带类型和范围），通过 response_format（json_schema）或强制的工具调用
+发给 LLM，配合较小的 max_tokens，模型只输出一个 JSON 对象，不再需要正则从自由文本中恢复命令。
+推理服务不支持或输出不合法时返回 None，由调用方回退到原来的自由文本模式。
+'''
+import json
+from command_stream import render_content
+from service_registry import SERVICE_REGISTRY
+
+TOOL_NAME = "execute_commands"
+
+INSTRUCTION = (
+    "\n\nRespond with a single JSON object: "
+    '{"reply": <short answer to the user>, "commands": [{"service": ..., "target_device": ..., <params>}]}. '
+    "Use an empty commands list when no device should be controlled. "
+    "brightness is a fraction between 0 and 1, or a level from 2 to 255 on Home Assistant's scale."
+)
+
+# 防止个别推理服务在 JSON 结束后继续输出空白或代码块
+STOP_SEQUENCES = ["\n\n\n", "```"]
+
+
+def build_command_schema(registry):
+    params = []
+    for service_params in registry.services.values():
+        for param in service_params:
+            if param not in params:
+                params.append(param)
+
+    command = {
+        "type": "object",
+        "properties": {
+            "service": {"type": "string", "enum": sorted(registry.services)},
+            "target_device": {"type": "string", "enum": list(registry.devices)},
+        },
+        "required": ["service", "target_device"],
+        "additionalProperties": False,
+    }
+    for param in params:
+        # 参数的类型约束来自服务注册表
+        command["properties"][param] = SERVICE_REGISTRY.param_schema(param)
+
+    return {
+        "type": "object",
+        "properties": {
+            "reply": {"type": "string"},
+            "commands": {"type": "array", "items": command},
+        },
+        "required": ["reply", "commands"],
+        "additionalProperties": False,
+    }
+
+
+class StructuredOutput:
+    def __init__(self, registry, mode="json_schema", max_tokens=256):
+        """
+        :param mode: 'json_schema' 使用 response_format；'tools' 使用强制的工具调用
+        :param max_tokens: 单次回复的 token 上限，只需容纳一个小 JSON
+        """
+        if mode not in ("json_schema", "tools"):
+            raise ValueError(f"Unsupported structured output mode: {mode}")
+        self.registry = registry
+        self.mode = mode
+        self.max_tokens = max_tokens
+        self.schema = build_command_schema(registry)
+
+    def request_options(self):
+        """传给 ChatBot.complete_json 的额外请求参数"""
+        options = {"max_tokens": self.max_tokens, "stop": STOP_SEQUENCES}
+        if self.mode == "json_schema":
+            options["response_format"] = {
+                "type": "json_schema",
+                # 不加 strict：strict 模式要求所有属性都 required 且不支持 minimum/maximum，
+                # 而参数都是可选的，服务端会直接返回 400
+                "json_schema": {"name": "home_commands", "schema": self.schema},
+            }
+        else:
+            options["tools"] = [{
+                "type": "function",
+                "function": {
+                    "name": TOOL_NAME,
+                    "description": "Reply to the user and control Home Assistant devices",
+                    "parameters": self.schema,
+                },
+            }]
+            options["tool_choice"] = {"type": "function", "function": {"name": TOOL_NAME}}
+        return options
+
+    def parse(self, raw):
+        """
+        解析模型输出的 JSON，丢弃不在注册表中的服务/设备（推理服务未严格执行 schema 时）
+        :return: (content, commands)，JSON 不合法（或服务、设备不是字符串）时返回 None
+        """
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("commands", []), list):
+            return None
+
+        commands = []
+        for command in data.get("commands") or []:
+            if not isinstance(command, dict):
+                continue
+            if not isinstance(command.get("service"), str) or not isinstance(command.get("target_device"), str):
+                # 不可哈希的值（列表等）无法在注册表中查找，整段输出视为不合法
+                return None
+            if command.get("service") not in self.registry.services or command.get("target_device") not in self.registry.devices:
+                print(f"[WARNING] Dropping command outside the device registry: {command}")
+                continue
+            commands.append(command)
+        reply = str(data.get("reply") or "")
+        # 与自由文本模式保持相同的 content 格式，日志、缓存、客户端都不用区分
+        return render_content(reply, commands), commands
@@ -210,7 +210,6 @@ def main():
         # user_input += 'no_think'
         response = bot.chat(user_input, stream=False)
         print(response)
-        response = bot.chat("reset", stream=False)
         
         
 
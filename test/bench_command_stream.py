@@ -0,0 +1,101 @@
+'''
+增量命令解析基准：把 LLM 风格的回复切成随机大小的 delta 喂给 IncrementalCommandParser，检查
+  - 完整回复：解析出的命令与 VoicePipeline.parse_response 完全一致
+  - 截断的回复（在代码块内任意位置截断，模拟断流 / max_tokens）：只执行已经换行的完整命令行，
+    末尾的半行不执行（parse_response 会整块丢弃，已执行的命令无法收回，见 command_stream 模块说明）
+  - 每个 delta 的解析耗时
+
+用法：python test/bench_command_stream.py [--responses 500] [--seed 1]
+'''
+import argparse
+import contextlib
+import csv
+import functools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.update(HA_BASE_URL="http://127.0.0.1:1", HA_STATE_MIRROR="false", CONFIG_RELOAD_INTERVAL="0")
+
+from command_stream import IncrementalCommandParser, FENCE_OPEN, render_content
+from bench_fast_path import parse_params
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_response(cases, rng):
+    """(回复文本, 命令列表)：1~4 条命令，偶尔在代码块后面再跟一句寒暄"""
+    commands = []
+    for case in rng.sample(cases, rng.randint(1, 4)):
+        commands.append({"service": case["expected_service"], "target_device": case["target_device"],
+                         **parse_params(case["expected_params"])})
+    content = render_content("Sure, doing that now.", commands)
+    if rng.random() < 0.5:
+        content += "\nAnything else?"
+    return content, commands
+
+
+def stream(content, rng):
+    """按随机大小切分，返回 (解析出的命令, 各 delta 的解析耗时)"""
+    parser = IncrementalCommandParser()
+    latencies = []
+    i = 0
+    while i < len(content):
+        size = rng.randint(1, 8)
+        start = time.perf_counter()
+        parser.feed(content[i:i + size])
+        latencies.append(time.perf_counter() - start)
+        i += size
+    parser.close()
+    return parser.commands, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental command parser benchmark")
+    parser.add_argument("--cases", default=os.path.join(HERE, "test_cases.csv"))
+    parser.add_argument("--responses", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from pipeline import VoicePipeline
+    parse_response = functools.partial(VoicePipeline.parse_response, None)    # 不依赖实例状态
+
+    with open(args.cases, newline="", encoding="utf-8") as f:
+        cases = list(csv.DictReader(f))
+    rng = random.Random(args.seed)
+
+    mismatches = truncated = half_lines = dropped_whole = 0
+    latencies = []
+    # 截断的代码块会打印警告，这里只看统计
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        for _ in range(args.responses):
+            content, commands = make_response(cases, rng)
+            streamed, elapsed = stream(content, rng)
+            latencies.extend(elapsed)
+            mismatches += streamed != parse_response(content) or streamed != commands
+
+            # 在代码块内随机截断：只应执行截断点之前已经换行的命令
+            block_start = content.index(FENCE_OPEN) + len(FENCE_OPEN)
+            block_end = content.index("\n```", block_start)
+            cut = rng.randint(block_start, block_end)
+            prefix = content[:cut]
+            complete = prefix[block_start:].split("\n")[:-1]
+            expected = [json.loads(line) for line in complete if line.strip()]
+            streamed, _ = stream(prefix, rng)
+            truncated += 1
+            half_lines += streamed != expected
+            dropped_whole += not parse_response(prefix)
+
+    latencies.sort()
+    print(f"complete responses: {args.responses - mismatches}/{args.responses} match parse_response")
+    print(f"truncated responses: {half_lines}/{truncated} executed a cut-off line (should be 0); "
+          f"parse_response dropped the whole block in {dropped_whole}/{truncated}")
+    print(f"feed(): p50 {latencies[len(latencies) // 2] * 1e6:.1f} us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us per delta ({len(latencies)} deltas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+'''
+实体索引基准：按房间 x 设备类型生成几千个实体，测量
+  - 校验：合法实体 ID 的查表耗时
+  - 修正：LLM 常见的错误写法（分写 / 合写、拼写错误、词序颠倒、domain 写成复数）能否修正到正确实体，以及耗时
+  - 拒绝：不存在的设备不应被"修正"成别的实体（误修正率）
+
+用法：python test/bench_entity_index.py [--rooms 400] [--seed 1]
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from device_registry import DeviceRegistry
+from entity_index import EntityIndex
+
+ROOM_WORDS = ["living", "dining", "master", "guest", "kids", "study", "laundry", "garage", "attic", "basement",
+              "north", "south", "east", "west", "upper", "lower", "front", "back", "corner", "sun"]
+ROOM_NOUNS = ["room", "bedroom", "hall", "kitchen", "office", "bathroom", "porch", "landing", "closet", "lounge"]
+KINDS = {"light": "light", "cover": "curtain", "fan": "fan", "switch": "plug", "climate": "ac"}
+SERVICES = ["light.turn_on(brightness)", "light.turn_off", "cover.open_cover", "cover.close_cover", "fan.turn_on",
+            "fan.turn_off", "switch.turn_on", "switch.turn_off", "climate.set_temperature(temperature)"]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def build_config(rooms, rng):
+    names = set()
+    while len(names) < rooms:
+        names.add((rng.choice(ROOM_WORDS), rng.choice(ROOM_NOUNS), rng.randint(1, 9)))
+    devices = []
+    for first, noun, floor in sorted(names):
+        for domain, kind in KINDS.items():
+            devices.append({"id": f"{domain}.{first}{noun}_{floor}", "name": f"{first} {noun} {floor} {kind}"})
+    return {"devices": devices, "services": [{"name": s} for s in SERVICES]}
+
+
+def typo(word, rng):
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:] if rng.random() < 0.5 else word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def corrupt(device, rng):
+    """LLM 的常见错误写法：(错误的 ID, 类型)"""
+    domain, object_id = device.id.split(".", 1)
+    first, noun, floor = device.name.split()[:3]
+    kind = rng.choice(["split", "typo", "order", "plural", "name"])
+    if kind == "split":
+        return f"{domain}.{first}_{noun}_{floor}", kind
+    if kind == "typo":
+        return f"{domain}.{typo(first + noun, rng)}_{floor}", kind
+    if kind == "order":
+        return f"{domain}.{noun}_{first}_{floor}", kind
+    if kind == "plural":
+        return f"{domain}s.{object_id}", kind
+    return f"{domain}.{first}_{noun}_{floor}_{KINDS[domain]}", kind
+
+
+def timed(func, args_list):
+    latencies = []
+    outputs = []
+    for args in args_list:
+        start = time.perf_counter()
+        outputs.append(func(*args))
+        latencies.append(time.perf_counter() - start)
+    return latencies, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entity index benchmark")
+    parser.add_argument("--rooms", type=int, default=400, help="房间数，每个房间 5 个设备")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    config = build_config(args.rooms, rng)
+    start = time.perf_counter()
+    index = EntityIndex(DeviceRegistry(config))
+    print(f"{len(index.devices)} entities, index built in {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"({len(index.keys)} keys, {len(index.postings)} trigram postings)")
+
+    devices = list(index.devices.values())
+    valid = [(rng.choice(devices).id, None) for _ in range(args.samples)]
+    cases = []
+    for _ in range(args.samples):
+        device = rng.choice(devices)
+        target, kind = corrupt(device, rng)
+        cases.append((target, f"{device.domain}.turn_on", device.id, kind))
+    unknown = [(f"light.{rng.choice(['pantry', 'cellar', 'nursery', 'gym'])}_{rng.randint(1, 9)}", "light.turn_on")
+               for _ in range(args.samples)]
+
+    print(f"\n{'lookup':<14}{'p50':>10}{'p95':>10}{'p99':>10}  result")
+    latencies, outputs = timed(index.resolve, valid)
+    print(f"{'valid':<14}{percentile(latencies, 0.5) * 1e6:>8.1f}us{percentile(latencies, 0.95) * 1e6:>8.1f}us"
+          f"{percentile(latencies, 0.99) * 1e6:>8.1f}us  {sum(o == v[0] for o, v in zip(outputs, valid))}/{len(valid)}")
+    by_kind = {}
+    for target, service, expected, kind in cases:
+        start = time.perf_counter()
+        resolved = index.resolve(target, service)
+        by_kind.setdefault(kind, []).append((time.perf_counter() - start, resolved == expected, resolved is None))
+    for kind, rows in sorted(by_kind.items()):
+        latencies = [r[0] for r in rows]
+        print(f"{'repair/' + kind:<14}{percentile(latencies, 0.5) * 1e6:>8.1f}us{percentile(latencies, 0.95) * 1e6:>8.1f}us"
+              f"{percentile(latencies, 0.99) * 1e6:>8.1f}us  {sum(r[1] for r in rows)}/{len(rows)} correct, "
+              f"{sum(r[2] for r in rows)} unresolved, {sum(not r[1] and not r[2] for r in rows)} wrong")
+    latencies, outputs = timed(index.resolve, unknown)
+    print(f"{'unknown':<14}{percentile(latencies, 0.5) * 1e6:>8.1f}us{percentile(latencies, 0.95) * 1e6:>8.1f}us"
+          f"{percentile(latencies, 0.99) * 1e6:>8.1f}us  {sum(o is not None for o in outputs)}/{len(unknown)} wrongly repaired")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+'''
+快速通道命中率基准：用 test_cases.csv 中的指令测试 FastPathMatcher 的命中率、准确率和单次匹配耗时
+
+默认按用例中出现的设备和服务构造设备表（与 devices.yaml 无关）；也可以用 --devices 指定 yaml。
+用法：python test/bench_fast_path.py [--cases test/test_cases.csv] [--devices devices.yaml] [--rounds 1000]
+'''
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from device_registry import DeviceRegistry
+from fast_path import FastPathMatcher
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 不应命中快速通道的指令（必须回退到 LLM）
+NEGATIVE_COMMANDS = [
+    "Is the living room light on",
+    "What is the temperature in the living room",
+    "Turn off the living room light in ten minutes",
+    "Don't turn on the bedroom light",
+    "Turn on all the bedroom lights",
+    "Turn off all lights in the kitchen",
+    "Tell me a joke",
+    # 多个意图：规则只能表达一个动作，不能套用到所有设备上
+    "Turn on the living room light and turn off the bedroom fan",
+    "Turn off the bedroom fan and turn on the coffee machine",
+    "Turn on the living room light with 50 percent brightness and turn off the bedroom light",
+    "Turn on the master room light and turn off the fan",
+    "Turn off the fan and turn on the heater",
+    "Turn on the master room light with 50 percent brightness and turn off the guest room light",
+    # 定时：不能立即执行
+    "Turn on the living room light in 5 min",
+    "Turn on the living room light at 11 pm",
+    "Turn on the living room light at sunset",
+    "Turn on the coffee machine at 7 am",
+    # 参数不能被规则完整表达，不能静默丢掉
+    "Turn on the living room light at 50 percent",
+    "Open the living room curtain to 50 percent",
+    "Close the living room curtain to 30 percent",
+    "Change the living room light to red and 30 percent brightness",
+    "Set the living room light to 50 percent brightness in red",
+    "Set the living room light to 150 percent brightness",
+    "Set the AC to 72 degrees Fahrenheit",
+    # 限定词改变了要操作的设备
+    "Turn on the living room light instead of the bedroom light",
+    "Turn on the living room light or the bedroom light",
+    "Turn off all lights except the living room",
+]
+
+
+def parse_params(text):
+    """brightness=50 / rgb_color=[0,0,255] -> dict"""
+    if not text:
+        return {}
+    key, _, value = text.partition("=")
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return {key.strip(): value}
+
+
+def config_from_cases(cases):
+    services = {}
+    devices = {}
+    for case in cases:
+        params = services.setdefault(case["expected_service"], [])
+        for key in parse_params(case["expected_params"]):
+            if key not in params:
+                params.append(key)
+        object_id = case["target_device"].split(".", 1)[1]
+        devices[case["target_device"]] = {
+            "id": case["target_device"],
+            "name": object_id.replace("_", " ").title(),
+        }
+    return {
+        "services": [{"name": name, "params": params} for name, params in services.items()],
+        "devices": list(devices.values()),
+    }
+
+
+def same_params(expected, command):
+    for key, value in expected.items():
+        actual = command.get(key)
+        # 快速通道与 LLM 一样输出 0~1 的亮度比例，用例里写的是百分比
+        if key == "brightness" and isinstance(actual, (int, float)):
+            actual = round(actual * 100)
+        if isinstance(value, str) and isinstance(actual, str):
+            value, actual = value.lower(), actual.lower()
+        if actual != value:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast path intent matcher benchmark")
+    parser.add_argument("--cases", default=os.path.join(HERE, "test_cases.csv"))
+    parser.add_argument("--devices", help="devices.yaml 路径，默认由用例生成")
+    parser.add_argument("--rounds", type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(args.cases, newline="", encoding="utf-8") as f:
+        cases = list(csv.DictReader(f))
+
+    if args.devices:
+        with open(args.devices, encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    else:
+        config = config_from_cases(cases)
+    matcher = FastPathMatcher(DeviceRegistry(config))
+
+    hits = correct = 0
+    for case in cases:
+        result = matcher.match(case["voice_command"])
+        if result is None:
+            print(f"  [LLM ] {case['id']:<6} {case['voice_command']}")
+            continue
+        hits += 1
+        ok = (len(result.commands) == 1
+              and result.commands[0]["service"] == case["expected_service"]
+              and result.commands[0]["target_device"] == case["target_device"]
+              and same_params(parse_params(case["expected_params"]), result.commands[0]))
+        correct += ok
+        print(f"  [{'FAST' if ok else 'MISS'}] {case['id']:<6} {case['voice_command']} -> {result.commands}")
+
+    false_hits = 0
+    for text in NEGATIVE_COMMANDS:
+        result = matcher.match(text)
+        if result is not None:
+            false_hits += 1
+            print(f"  [MISS] {'NEG':<6} {text} -> {result.commands}")
+
+    texts = [case["voice_command"] for case in cases] + NEGATIVE_COMMANDS
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for text in texts:
+            matcher.match(text)
+    per_match = (time.perf_counter() - start) / (args.rounds * len(texts))
+
+    print()
+    print(f"Hit rate:        {hits}/{len(cases)} ({hits / max(1, len(cases)):.0%})")
+    print(f"Precision:       {correct}/{hits} ({correct / max(1, hits):.0%})")
+    print(f"Negative hits:   {false_hits}/{len(NEGATIVE_COMMANDS)} (should be 0)")
+    print(f"Match time:      {per_match * 1e6:.1f} us/utterance")
+
+
+if __name__ == "__main__":
+    main()
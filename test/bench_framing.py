@@ -0,0 +1,128 @@
+'''
+帧接收路径基准：对比旧的 buf += newbuf 实现与 framing.FrameReader 的用户态拷贝量
+
+用法：python test/bench_framing.py [--seconds 5] [--requests 20]
+'''
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from framing import COPY_STATS, BufferPool, FrameReader, encode_frame, encode_message
+
+
+def send_requests(sock, audio, requests, chunk_size):
+    """模拟卫星设备：交替发送定长和流式 VOICE_COMMAND"""
+    for i in range(requests):
+        if i % 2 == 0:
+            sock.sendall(encode_message({'type': 'VOICE_COMMAND', 'size': len(audio)}) + audio)
+        else:
+            sock.sendall(encode_message({'type': 'VOICE_COMMAND', 'size': 0}))
+            for off in range(0, len(audio), chunk_size):
+                sock.sendall(encode_frame(audio[off:off + chunk_size]))
+            sock.sendall((0).to_bytes(4, 'big'))
+    sock.close()
+
+
+class LegacyReceiver:
+    """旧实现（server.recv_exact + bytearray.extend + bytes()），同时统计拷贝字节数"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.bytes_copied = 0
+        self.allocations = 0
+
+    def recv_exact(self, count):
+        buf = b''
+        while len(buf) < count:
+            newbuf = self.sock.recv(count - len(buf))
+            if not newbuf: return None
+            self.allocations += 1
+            if buf:
+                # bytes 拼接会把旧内容和新分片都复制到一个新对象
+                self.bytes_copied += len(buf) + len(newbuf)
+                self.allocations += 1
+            buf += newbuf
+        return buf
+
+    def read_request(self):
+        import json
+        size = self.recv_exact(4)
+        if not size: return None
+        header = json.loads(self.recv_exact(int.from_bytes(size, 'big')))
+        audio_data = bytearray()
+        if header['size'] > 0:
+            data = self.recv_exact(header['size'])
+            audio_data.extend(data)
+            self.bytes_copied += len(data)
+        else:
+            while True:
+                chunk_len = int.from_bytes(self.recv_exact(4), 'big')
+                if chunk_len == 0: break
+                chunk = self.recv_exact(chunk_len)
+                audio_data.extend(chunk)
+                self.bytes_copied += len(chunk)
+        audio = bytes(audio_data)
+        self.bytes_copied += len(audio)
+        self.allocations += 1
+        return audio
+
+
+def run(receiver_factory, audio, requests, chunk_size):
+    a, b = socket.socketpair()
+    a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 16)
+    sender = threading.Thread(target=send_requests, args=(a, audio, requests, chunk_size), daemon=True)
+    start = time.perf_counter()
+    sender.start()
+    total = receiver_factory(b)
+    elapsed = time.perf_counter() - start
+    sender.join()
+    b.close()
+    return total, elapsed
+
+
+def legacy(sock):
+    rx = LegacyReceiver(sock)
+    received = 0
+    while True:
+        audio = rx.read_request()
+        if audio is None: break
+        received += len(audio)
+    return received, rx.bytes_copied, rx.allocations
+
+
+def zero_copy(sock):
+    COPY_STATS.reset()
+    reader = FrameReader(sock, pool=BufferPool())
+    received = 0
+    while True:
+        header = reader.read_json()
+        if header is None: break
+        audio = reader.read_audio(header['size'])
+        received += len(audio)
+        audio.release()
+    return received, COPY_STATS.bytes_copied, COPY_STATS.allocations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=5.0, help='每条语音的时长（16kHz 16bit 单声道）')
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=1024, help='流式模式每片字节数（512 采样）')
+    args = parser.parse_args()
+
+    audio = os.urandom(int(args.seconds * 16000) * 2)
+    print(f"audio: {len(audio)} bytes x {args.requests} requests (half fixed-size, half streamed)")
+    print(f"{'receiver':<12}{'received':>12}{'copied':>14}{'copied/req':>14}{'allocs/req':>12}{'time':>10}")
+    for name, factory in (('legacy', legacy), ('framing', zero_copy)):
+        (received, copied, allocs), elapsed = run(factory, audio, args.requests, args.chunk_size)
+        print(f"{name:<12}{received:>12}{copied:>14}{copied // args.requests:>14}"
+              f"{allocs / args.requests:>12.1f}{elapsed * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
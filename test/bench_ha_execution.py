@@ -0,0 +1,167 @@
+'''
+命令执行层压测（使用进程内的 fake_ha_server，不需要真实 HA）
+替身 HA 由 devices.yaml 初始化，按 HA 的语义校验参数并改变状态；通过真实的 VoicePipeline.execute_commands
+（服务注册表 -> ha_control -> REST / WebSocket）执行命令：
+  - 功能：每个实体执行一条命令，检查替身中的状态是否变成预期值
+  - 串行：逐条执行单条命令，单条命令的 p50 / p95 / p99
+  - 并发：多个"连接"同时执行多命令回复，回复的 p50 / p95 / p99、命令吞吐和成功率
+--seed 固定命令序列和替身的延迟 / 故障序列，结果可复现。
+
+用法：python test/bench_ha_execution.py [--transport rest|websocket] [--latency-ms 5 --jitter-ms 10]
+      [--error-rate 0.02] [--domain-latency-ms cover=300] [--devices devices.yaml | --cases]
+'''
+import argparse
+import contextlib
+import csv
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # config 从当前目录读取 devices.yaml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT = 18626
+TOKEN = "test-token"
+
+# 每个 domain 可用的命令，以及执行后替身中应有的状态（None 表示不检查）
+COMMANDS = {
+    "light": [("light.turn_on", {"brightness": 0.5}, "on"), ("light.turn_off", {}, "off"),
+              ("light.turn_on", {"rgb_color": [255, 0, 0]}, "on")],
+    "cover": [("cover.open_cover", {}, "open"), ("cover.close_cover", {}, "closed"),
+              ("cover.set_cover_position", {"position": 40}, "open")],
+    "fan": [("fan.turn_on", {}, "on"), ("fan.turn_off", {}, "off"), ("fan.increase_speed", {}, None)],
+    "climate": [("climate.set_temperature", {"temperature": 22}, None),
+                ("climate.set_fan_mode", {"fan_mode": "high"}, None)],
+    "lock": [("lock.lock", {}, "locked"), ("lock.unlock", {}, "unlocked")],
+    "media_player": [("media_player.media_play", {}, "playing"), ("media_player.media_pause", {}, "paused")],
+    "switch": [("switch.turn_on", {}, "on"), ("switch.turn_off", {}, "off")],
+}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+def make_command(rng, device_ids):
+    entity_id = rng.choice(device_ids)
+    service, params, expected = rng.choice(COMMANDS[entity_id.split(".", 1)[0]])
+    return {"service": service, "target_device": entity_id, **params}
+
+
+def report(name, latencies, extra=""):
+    print(f"{name:<12}{percentile(latencies, 0.5) * 1000:>8.1f}ms{percentile(latencies, 0.95) * 1000:>8.1f}ms"
+          f"{percentile(latencies, 0.99) * 1000:>8.1f}ms  {extra}")
+
+
+def quiet():
+    """执行层每条命令都会打印日志，测量期间丢弃（工作线程同样生效）"""
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Command execution benchmark against a fake Home Assistant")
+    parser.add_argument("--transport", choices=("rest", "websocket"), default="rest")
+    parser.add_argument("--devices", default="devices.yaml", help="替身 HA 的设备表")
+    parser.add_argument("--cases", action="store_true", help="改用 test/test_cases.csv 中的设备（覆盖全部 7 个 domain）")
+    parser.add_argument("--commands", type=int, default=300, help="串行阶段的命令数")
+    parser.add_argument("--clients", type=int, default=8, help="并发阶段的连接数")
+    parser.add_argument("--replies", type=int, default=40, help="每个连接的回复数")
+    parser.add_argument("--per-reply", type=int, default=3, help="每条回复的命令数")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--domain-latency-ms", default="")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # config 在导入时读取环境变量，必须在导入任何项目模块之前设置
+    os.environ.update(HA_BASE_URL=f"http://127.0.0.1:{PORT}", HA_TOKEN=TOKEN, HA_WS_URL="",
+                      HA_TRANSPORT=args.transport, HA_STATE_MIRROR="false")
+    from fake_ha_server import start_fake_ha, load_devices, parse_domain_latency
+    if args.cases:
+        from bench_fast_path import config_from_cases
+        with open(os.path.join(HERE, "test_cases.csv"), newline="", encoding="utf-8") as f:
+            devices = config_from_cases(list(csv.DictReader(f)))["devices"]
+    else:
+        devices = load_devices(args.devices)
+    devices = [d for d in devices if d["id"].split(".", 1)[0] in COMMANDS]
+    server, ha = start_fake_ha(
+        port=PORT, token=TOKEN, devices=devices, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        domain_latency_ms=parse_domain_latency(args.domain_latency_ms), error_rate=args.error_rate, seed=args.seed,
+    )
+    from pipeline import VoicePipeline
+    pipeline = VoicePipeline(api_key="sk-", base_url="http://127.0.0.1:9/v1", model="bench")
+    if pipeline.snapshot.entities:
+        # 命令针对替身 HA 中的设备（--cases 时与 devices.yaml 不同），实体校验改用同一份设备表
+        from device_registry import DeviceRegistry
+        from entity_index import EntityIndex
+        pipeline.snapshot.entities = EntityIndex(DeviceRegistry({"devices": devices}))
+    pipeline.warm_up()
+    device_ids = [d["id"] for d in devices]
+    rng = random.Random(args.seed)
+    print(f"{len(device_ids)} entities, transport {args.transport}, latency {args.latency_ms} ms "
+          f"+ exp({args.jitter_ms} ms), error rate {args.error_rate}")
+
+    # ---- 功能 ----
+    ok = 0
+    checked = 0
+    for entity_id in device_ids:
+        service, params, expected = COMMANDS[entity_id.split(".", 1)[0]][0]
+        with quiet():
+            results = pipeline.execute_commands([{"service": service, "target_device": entity_id, **params}])
+        if expected is None or results[0]["status"] != "success":
+            continue
+        checked += 1
+        ok += ha.get_state(entity_id)["state"] == expected
+    print(f"\nfunctional: {ok}/{checked} entities reached the expected state")
+
+    # ---- 串行 ----
+    latencies = []
+    failures = 0
+    for _ in range(args.commands):
+        command = make_command(rng, device_ids)
+        start = time.perf_counter()
+        with quiet():
+            failures += pipeline.execute_commands([command])[0]["status"] != "success"
+        latencies.append(time.perf_counter() - start)
+    print(f"\n{'phase':<12}{'p50':>10}{'p95':>10}{'p99':>10}")
+    report("serial", latencies, f"{args.commands / sum(latencies):.0f} cmd/s, {failures} failed")
+
+    # ---- 并发 ----
+    replies = [[[make_command(rng, device_ids) for _ in range(args.per_reply)] for _ in range(args.replies)]
+               for _ in range(args.clients)]
+    reply_latencies = []
+    statuses = []
+    lock = threading.Lock()
+
+    def client(batches):
+        for commands in batches:
+            start = time.perf_counter()
+            results = pipeline.execute_commands(commands)
+            elapsed = time.perf_counter() - start
+            with lock:
+                reply_latencies.append(elapsed)
+                statuses.extend(r["status"] for r in results)
+
+    threads = [threading.Thread(target=client, args=(batches,)) for batches in replies]
+    start = time.perf_counter()
+    with quiet():
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - start
+    succeeded = sum(s == "success" for s in statuses)
+    report("concurrent", reply_latencies,
+           f"{len(statuses) / wall:.0f} cmd/s, {succeeded}/{len(statuses)} succeeded "
+           f"({args.clients} clients x {args.per_reply} cmds/reply)")
+    print(f"\nfake HA: {dict(ha.stats.most_common(6))}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+'''
+HA 传输方式基准：REST（每次调用一个 HTTP 请求，共享 keep-alive 连接池）与 WebSocket（一条长连接按 id 复用）
+  - 串行：逐条调用 call_service，比较单条命令的 p50 / p95
+  - 并发：多个线程同时调用，比较吞吐
+  - 重连：强制断开 WebSocket 后下一次调用自动重连
+默认使用进程内的 fake_ha_server；--url / --token 时使用真实 HA（会真的切换 --entity 的开关状态）。
+
+用法：python test/bench_ha_transport.py [--calls 200] [--threads 8] [--latency-ms 2]
+'''
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+PORT = 18623
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def serial(call, entity, calls):
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        if call("switch", "turn_on" if i % 2 else "turn_off", {"entity_id": entity}) is None:
+            raise RuntimeError("call_service failed")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def concurrent(call, entity, calls, threads):
+    def worker():
+        for i in range(calls // threads):
+            call("switch", "turn_on" if i % 2 else "turn_off", {"entity_id": entity})
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return (calls // threads * threads) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Home Assistant REST vs WebSocket transport benchmark")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="替身 HA 每次服务调用的处理耗时")
+    parser.add_argument("--url", help="真实 HA 地址，如 http://192.168.1.10:8123")
+    parser.add_argument("--token", default="test-token")
+    parser.add_argument("--entity", default="switch.bench")
+    args = parser.parse_args()
+
+    server = None
+    if not args.url:
+        from fake_ha_server import start_fake_ha
+        server, _ = start_fake_ha(port=PORT, token=args.token, latency_ms=args.latency_ms, entities=[args.entity])
+        args.url = f"http://127.0.0.1:{PORT}"
+    # config 在导入时读取环境变量，必须先设置
+    os.environ["HA_BASE_URL"] = args.url
+    os.environ["HA_TOKEN"] = args.token
+    os.environ["HA_WS_URL"] = ""
+    import ha_control
+    import ha_ws
+
+    transports = {
+        "rest": lambda domain, service, data: ha_control.call_service(domain, service, data),
+        "websocket": ha_ws.call_service,
+    }
+    for call in transports.values():
+        serial(call, args.entity, 5)  # 预热：建立连接
+
+    print(f"{args.calls} calls, server latency {args.latency_ms} ms" if server else f"{args.calls} calls against {args.url}")
+    print(f"{'transport':<12}{'p50':>10}{'p95':>10}{'max':>10}{'throughput':>16}")
+    for name, call in transports.items():
+        latencies = serial(call, args.entity, args.calls)
+        throughput = concurrent(call, args.entity, args.calls, args.threads)
+        print(f"{name:<12}{percentile(latencies, 0.5) * 1000:>8.2f}ms{percentile(latencies, 0.95) * 1000:>8.2f}ms"
+              f"{max(latencies) * 1000:>8.2f}ms{throughput:>10.0f} req/s  ({args.threads} threads)")
+
+    client = ha_ws.get_client()
+    client.ws.sock.shutdown(socket.SHUT_RDWR)  # 模拟连接被对端断开
+    time.sleep(0.1)
+    start = time.perf_counter()
+    ok = ha_ws.call_service("switch", "turn_on", {"entity_id": args.entity}) is not None
+    print(f"\nreconnect: {'ok' if ok else 'FAILED'} in {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"connections made: {client.connects}")
+    client.close()
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+'''
+LLM 调度器基准：模拟多个卫星设备同时发起请求（如各房间的"晚安"场景）
+对比每个连接直接请求推理服务与经过 LlmDispatcher（合批 + 并发上限）两种方式，
+输出端到端耗时，以及调度器统计的排队等待 / 模型耗时，用于评估本地推理服务的并发能力。
+推理服务使用进程内的 fake_llm_server（--slots 模拟其并发能力）。
+
+用法：python test/bench_llm_dispatch.py [--clients 8] [--rounds 5] [--slots 2] [--cap 2]
+'''
+import argparse
+import csv
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # config 从当前目录读取 devices.yaml
+
+from chat import ChatBot
+from device_registry import DeviceRegistry
+from fake_llm_server import start_fake_llm
+from fast_path import FastPathMatcher
+from llm_dispatcher import LlmDispatcher
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT = 18600
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def fire(llm, texts, rounds):
+    """每轮所有客户端同时发起请求，返回每个请求的端到端耗时"""
+    latencies = []
+    lock = threading.Lock()
+    for _ in range(rounds):
+        barrier = threading.Barrier(len(texts))
+
+        def client(text):
+            barrier.wait()
+            start = time.perf_counter()
+            llm.complete(text)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client, args=(text,)) for text in texts]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM dispatcher benchmark")
+    parser.add_argument("--cases", default=os.path.join(HERE, "test_cases.csv"))
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--slots", type=int, default=2, help="模拟推理服务能同时处理的请求数")
+    parser.add_argument("--cap", type=int, default=2, help="调度器并发上限")
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--decode-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    with open(args.cases, newline="", encoding="utf-8") as f:
+        cases = list(csv.DictReader(f))
+    texts = [cases[i % len(cases)]["voice_command"] for i in range(args.clients)]
+
+    config = {
+        "services": [{"name": name} for name in {case["expected_service"] for case in cases}],
+        "devices": [{"id": case["target_device"]} for case in cases],
+    }
+    server, state = start_fake_llm(
+        port=PORT, slots=args.slots, decode_ms=args.decode_ms,
+        matcher=FastPathMatcher(DeviceRegistry(config))
+    )
+    bot = ChatBot(api_key="sk-", base_url=f"http://127.0.0.1:{PORT}/v1", model="fake")
+    bot.complete("warm up")
+
+    print(f"clients: {args.clients}, rounds: {args.rounds}, server slots: {args.slots}, dispatcher cap: {args.cap}")
+    print(f"{'mode':<12}{'avg':>10}{'p95':>10}{'queue wait':>14}{'model time':>14}{'server peak':>13}")
+
+    state.peak_active = 0
+    direct = fire(bot, texts, args.rounds)
+    print(f"{'direct':<12}{sum(direct) / len(direct) * 1000:>8.0f}ms{percentile(direct, 0.95) * 1000:>8.0f}ms"
+          f"{'-':>14}{'-':>14}{state.peak_active:>13}")
+
+    state.peak_active = 0
+    dispatcher = LlmDispatcher(bot, max_concurrency=args.cap, batch_window=args.window_ms / 1000.0, log_every=0)
+    batched = fire(dispatcher, texts, args.rounds)
+    stats = dispatcher.stats.snapshot()
+    print(f"{'dispatcher':<12}{sum(batched) / len(batched) * 1000:>8.0f}ms{percentile(batched, 0.95) * 1000:>8.0f}ms"
+          f"{stats['queue_wait']['avg_ms']:>12.0f}ms{stats['model_time']['avg_ms']:>12.0f}ms{state.peak_active:>13}")
+    print(f"avg batch size: {stats['avg_batch']}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
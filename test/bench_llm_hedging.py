@@ -0,0 +1,123 @@
+'''
+多推理服务对冲路由基准
+启动两个进程内的 fake_llm_server，都按一定概率卡顿（模拟边缘推理盒子的长尾延迟），
+对比只用一个节点与经 EndpointRouter 对冲路由两种方式的 p50 / p95 / 最大延迟；
+随后让当前最快的节点一直卡住（对冲请求每次都抢先），确认它被降级并摘除，而不是让之后的请求都等满对冲时间再双发；
+最后让其中一个节点故障，观察摘除、故障转移以及恢复后的重新加入。
+
+用法：python test/bench_llm_hedging.py [--requests 100] [--stall-prob 0.05] [--stall-ms 800] [--stream]
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # config 从当前目录读取 devices.yaml
+os.environ.setdefault("LLM_PROBE_INTERVAL", "1")
+
+from chat import ChatBot
+from fake_llm_server import start_fake_llm
+
+PORTS = (18610, 18611)
+TEXT = "Turn on the master room light"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def run(bot, count, stream):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        if stream:
+            for _ in bot.stream_complete(TEXT):
+                pass
+        else:
+            bot.complete(TEXT)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, latencies):
+    print(f"{name:<10}{percentile(latencies, 0.5) * 1000:>8.0f}ms{percentile(latencies, 0.95) * 1000:>8.0f}ms"
+          f"{max(latencies) * 1000:>8.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM hedged routing benchmark")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--stall-prob", type=float, default=0.05,
+                        help="卡顿概率；应低于 1 - LLM_HEDGE_PERCENTILE，否则对冲等待时间本身落在长尾上")
+    parser.add_argument("--stall-ms", type=float, default=800)
+    parser.add_argument("--decode-ms", type=float, default=2)
+    parser.add_argument("--stream", action="store_true", help="使用流式请求（落败的连接会被直接关闭）")
+    args = parser.parse_args()
+
+    servers = [start_fake_llm(port=port, decode_ms=args.decode_ms, stall_prob=args.stall_prob, stall_ms=args.stall_ms)
+               for port in PORTS]
+    urls = [f"http://127.0.0.1:{port}/v1" for port in PORTS]
+    single = ChatBot(api_key="sk-", base_url=urls[0], model="fake")
+    hedged = ChatBot(api_key="sk-", base_url=",".join(urls), model="fake")
+    single.complete("warm up")
+    run(hedged, 10, args.stream)  # 先积累延迟样本，对冲等待时间才会收敛到分位数
+    hedged.router.hedged = hedged.router.hedge_wins = 0
+
+    print(f"requests: {args.requests}, stall: {args.stall_prob:.0%} x {args.stall_ms:.0f}ms, "
+          f"mode: {'stream' if args.stream else 'complete'}")
+    print(f"{'mode':<10}{'p50':>10}{'p95':>10}{'max':>10}")
+    report("single", run(single, args.requests, args.stream))
+    report("hedged", run(hedged, args.requests, args.stream))
+    stats = hedged.router.stats()
+    print(f"hedged requests: {stats['hedged']}, won by hedge: {stats['hedge_wins']}")
+    for endpoint in stats["endpoints"]:
+        print(f"  {endpoint['base_url']}  ewma {endpoint['ewma_ms']}ms")
+
+    router = hedged.router
+    for _, s in servers:
+        s.stall_prob = 0.0
+
+    # 卡住的节点：请求不报错也不返回，每次都被对冲请求抢先；落败应计为失败，节点很快被摘除
+    stalled = router.ranked()[0]
+    state = servers[router.endpoints.index(stalled)][1]
+    state.stall_prob, state.stall_ms = 1.0, 5000
+    router.hedged = 0
+    ejected_after = None
+    latencies = []
+    for i in range(15):
+        start = time.perf_counter()
+        hedged.complete(TEXT)
+        latencies.append(time.perf_counter() - start)
+        if ejected_after is None and stalled.ejected:
+            ejected_after = i + 1
+    print(f"\nstalled: {stalled.base_url} stalls {state.stall_ms:.0f}ms on every request")
+    print(f"  hedged {router.hedged}/15, p50 {percentile(latencies, 0.5) * 1000:.0f}ms, "
+          f"ejected after {ejected_after} requests, ewma {stalled.snapshot()['ewma_ms']}ms")
+    assert ejected_after is not None, f"stalled endpoint was never ejected: {stalled.snapshot()}"
+    state.stall_prob = 0.0
+    deadline = time.time() + router.probe_interval * 3
+    while stalled.ejected and time.time() < deadline:
+        time.sleep(0.1)
+
+    # 故障转移：当前最快的节点宕机后应在 LLM_EJECT_AFTER 次失败内被摘除，请求全部由另一个节点完成
+    primary = router.ranked()[0]
+    state = servers[router.endpoints.index(primary)][1]
+    print(f"\nfailover: {primary.base_url} down")
+    state.down = True
+    failures = sum(1 for _ in range(10) if isinstance(hedged.complete(TEXT), dict))
+    print(f"  failed requests: {failures}/10, ejected: {primary.ejected}")
+
+    state.down = False
+    deadline = time.time() + router.probe_interval * 3
+    while primary.ejected and time.time() < deadline:
+        time.sleep(0.1)
+    print(f"  back up, ejected: {primary.ejected}")
+
+    for server, _ in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
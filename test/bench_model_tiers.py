@@ -0,0 +1,134 @@
+'''
+模型分档基准
+  - 分类器：test_cases.csv 中的用例都是单设备控制指令，应分到小模型；另附一组提问 / 多步骤文本，应分到大模型
+  - 按档位请求 LLM，与"全部使用大模型"对比各档的耗时和命令准确率（服务 + 目标设备与用例期望一致）
+默认使用进程内的 fake_llm_server（small / large 两个模型名的 decode 速度不同）；
+--llm 时使用 .env 中的 LLM_BASE_URL、LLM_SMALL_MODEL、LLM_LARGE_MODEL。
+
+用法：python test/bench_model_tiers.py [--runs 3] [--llm]
+'''
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # config 从当前目录读取 devices.yaml
+
+from chat import ChatBot
+from command_stream import IncrementalCommandParser
+from config import render_system_prompt
+from device_registry import DeviceRegistry
+from fast_path import FastPathMatcher
+from model_router import ModelRouter, SMALL, LARGE
+from bench_fast_path import config_from_cases
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT = 18620
+
+# 需要大模型的请求
+COMPLEX_CASES = [
+    "Is the front door locked?",
+    "What's the temperature in the living room",
+    "Turn on the living room light and the bedroom fan",
+    "Turn off the coffee machine in 10 minutes",
+    "Close the living room curtain then turn off the bedroom light",
+    "If it gets cold turn on the AC",
+    "I'm cold",
+    "Good night",
+    "How long has the coffee machine been on",
+    "Make it cozy in here",
+]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def parse_commands(content):
+    if isinstance(content, dict):
+        return []
+    parser = IncrementalCommandParser()
+    parser.feed(content)
+    parser.close()
+    return parser.commands
+
+
+def run_cases(bot, prompt, cases, pick_model, runs):
+    """返回 {tier: (latencies, correct, total)}"""
+    results = {}
+    for _ in range(runs):
+        for case, tier in cases:
+            model = pick_model(tier)
+            start = time.perf_counter()
+            content = bot.complete(case["voice_command"], prompt, model)
+            elapsed = time.perf_counter() - start
+            commands = parse_commands(content)
+            ok = any(cmd.get("service") == case["expected_service"] and cmd.get("target_device") == case["target_device"]
+                     for cmd in commands)
+            latencies, correct, total = results.get(tier, ([], 0, 0))
+            latencies.append(elapsed)
+            results[tier] = (latencies, correct + ok, total + 1)
+    return results
+
+
+def report(name, results):
+    for tier, (latencies, correct, total) in sorted(results.items()):
+        print(f"{name:<12}{tier:<8}{sum(latencies) / len(latencies) * 1000:>8.0f}ms"
+              f"{percentile(latencies, 0.95) * 1000:>8.0f}ms{correct:>8}/{total}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model tier routing benchmark")
+    parser.add_argument("--cases", default=os.path.join(HERE, "test_cases.csv"))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--llm", action="store_true", help="使用 .env 中配置的真实推理服务和模型")
+    args = parser.parse_args()
+
+    with open(args.cases, newline="", encoding="utf-8") as f:
+        cases = list(csv.DictReader(f))
+    config = config_from_cases(cases)
+    registry = DeviceRegistry(config)
+    router = ModelRouter(registry, small_model="small", large_model="large", log_every=0)
+
+    # ---- 分类 ----
+    labelled = [(case["voice_command"], SMALL) for case in cases] + [(text, LARGE) for text in COMPLEX_CASES]
+    wrong = [(text, expected, router.classify(text)) for text, expected in labelled if router.classify(text)[0] != expected]
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text, _ in labelled:
+            router.classify(text)
+    classify_us = (time.perf_counter() - start) / (rounds * len(labelled)) * 1e6
+    print(f"classifier: {len(labelled) - len(wrong)}/{len(labelled)} correct, {classify_us:.1f} us/utterance")
+    for text, expected, (tier, reason) in wrong:
+        print(f"  [WRONG] {text!r}: expected {expected}, got {tier} ({reason})")
+
+    # ---- 按档位请求 LLM ----
+    if args.llm:
+        from config import LLM_API_KEY, LLM_BASE_URL, LLM_MODEL, LLM_SMALL_MODEL, LLM_LARGE_MODEL
+        bot = ChatBot(api_key=LLM_API_KEY or "sk-", base_url=LLM_BASE_URL, model=LLM_MODEL)
+        router.models = {SMALL: LLM_SMALL_MODEL or LLM_MODEL, LARGE: LLM_LARGE_MODEL}
+        server = None
+    else:
+        from fake_llm_server import start_fake_llm
+        server, _ = start_fake_llm(port=PORT, matcher=FastPathMatcher(registry),
+                                   model_decode_ms={"small": 4.0, "large": 15.0})
+        bot = ChatBot(api_key="sk-", base_url=f"http://127.0.0.1:{PORT}/v1", model="large")
+    prompt = render_system_prompt(config["services"], config["devices"])
+    bot.complete("warm up", prompt)
+
+    routed = [(case, router.classify(case["voice_command"])[0]) for case in cases]
+    print(f"\nmodels: {router.models}, runs: {args.runs}")
+    print(f"{'mode':<12}{'tier':<8}{'avg':>10}{'p95':>10}{'accuracy':>10}")
+    report("tiered", run_cases(bot, prompt, routed, lambda tier: router.models[tier], args.runs))
+    report("large only", run_cases(bot, prompt, [(case, LARGE) for case, _ in routed],
+                                   lambda tier: router.models[LARGE], args.runs))
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
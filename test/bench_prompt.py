@@ -0,0 +1,116 @@
+'''
+提示词裁剪基准：在一个有上百个实体的模拟住宅里，对比完整提示词与按相关性裁剪后的提示词
+  - 平均提示词长度（估算 token 数）和节省比例
+  - 召回率：用例期望的目标设备是否在候选设备中
+  - 构建耗时
+  - 可选 --llm：用 .env 中的 LLM 配置分别以两种提示词请求，对比端到端耗时
+
+用法：python test/bench_prompt.py [--rooms 20] [--top-k 16] [--llm --runs 3]
+'''
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from device_registry import DeviceRegistry
+from prompt_builder import PromptBuilder, estimate_tokens
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ROOMS = [
+    "kitchen", "dining room", "study", "hallway", "garage", "basement", "attic", "laundry room",
+    "guest room", "kids room", "office", "bathroom", "balcony", "porch", "garden", "gym",
+    "library", "pantry", "nursery", "playroom", "cellar", "loft", "den", "sunroom",
+]
+
+KINDS = [
+    ("light", "{room}", "{room} light"),
+    ("cover", "{room}_curtain", "{room} curtain"),
+    ("fan", "{room}_fan", "{room} fan"),
+    ("climate", "{room}_ac", "{room} ac"),
+    ("switch", "{room}_plug", "{room} plug"),
+    ("media_player", "{room}_speaker", "{room} speaker"),
+]
+
+
+def build_house(cases, rooms):
+    """用例里的设备 + 每个房间一套常见设备"""
+    devices = {}
+    services = []
+    for case in cases:
+        if case["expected_service"] not in services:
+            services.append(case["expected_service"])
+        object_id = case["target_device"].split(".", 1)[1]
+        devices[case["target_device"]] = {"id": case["target_device"], "name": object_id.replace("_", " ").title()}
+    for room in ROOMS[:rooms]:
+        slug = room.replace(" ", "_")
+        for domain, object_id, name in KINDS:
+            entity_id = f"{domain}.{object_id.format(room=slug)}"
+            devices.setdefault(entity_id, {"id": entity_id, "name": name.format(room=room).title()})
+    return {"services": [{"name": name} for name in services], "devices": list(devices.values())}
+
+
+def time_llm(prompts, texts, runs):
+    from chat import ChatBot
+    from config import LLM_API_KEY, LLM_BASE_URL, LLM_MODEL
+    bot = ChatBot(api_key=LLM_API_KEY or "sk-", base_url=LLM_BASE_URL, model=LLM_MODEL)
+    start = time.perf_counter()
+    for _ in range(runs):
+        for text in texts:
+            bot.complete(text, prompts(text))
+    return (time.perf_counter() - start) / (runs * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relevance-pruned prompt benchmark")
+    parser.add_argument("--cases", default=os.path.join(HERE, "test_cases.csv"))
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=16)
+    parser.add_argument("--llm", action="store_true", help="同时测量真实 LLM 的端到端耗时")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.cases, newline="", encoding="utf-8") as f:
+        cases = list(csv.DictReader(f))
+
+    builder = PromptBuilder(DeviceRegistry(build_house(cases, args.rooms)), top_k=args.top_k)
+    texts = [case["voice_command"] for case in cases]
+
+    full_tokens = estimate_tokens(builder.full_prompt)
+    prefix_tokens = estimate_tokens(builder.stable_prefix)
+    pruned_tokens = []
+    recalled = 0
+    for case in cases:
+        prompt = builder.build(case["voice_command"])
+        pruned_tokens.append(estimate_tokens(prompt))
+        hit = case["target_device"] + " " in prompt
+        recalled += hit
+        if not hit:
+            print(f"  [MISS] {case['id']:<6} {case['voice_command']} (expected {case['target_device']})")
+
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            builder.build(text)
+    build_us = (time.perf_counter() - start) / (rounds * len(texts)) * 1e6
+
+    avg_pruned = sum(pruned_tokens) / len(pruned_tokens)
+    print(f"devices: {len(builder.registry.devices)}, top-k: {args.top_k}, cases: {len(cases)}")
+    print(f"Full prompt:     ~{full_tokens} tokens")
+    print(f"Pruned prompt:   ~{avg_pruned:.0f} tokens avg (stable prefix ~{prefix_tokens}), "
+          f"saving {1 - avg_pruned / full_tokens:.0%}")
+    print(f"Target recall:   {recalled}/{len(cases)}")
+    print(f"Build time:      {build_us:.1f} us/utterance")
+
+    if args.llm:
+        full = time_llm(lambda text: builder.full_prompt, texts, args.runs)
+        pruned = time_llm(builder.build, texts, args.runs)
+        print(f"LLM latency:     full {full * 1000:.0f} ms, pruned {pruned * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+'''
+状态镜像基准（使用进程内的 fake_ha_server）
+  - 查询：describe_state 走 REST（GET /api/states/<id>）与走内存镜像的单次耗时
+  - 事件：替身 HA 中状态变化后，镜像多久能看到
+  - 断线：连接断开后镜像标记为不在线；断开超过 max_stale 后查询回退到 REST，重连后自动重新加载
+
+用法：python test/bench_state_mirror.py [--entities 2000] [--queries 2000]
+'''
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+PORT = 18625
+TOKEN = "test-token"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def timed(func, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def wait_for(condition, timeout=5.0):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return None
+        time.sleep(0.0005)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Home Assistant state mirror benchmark")
+    parser.add_argument("--entities", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    from fake_ha_server import start_fake_ha
+    entities = [f"light.bench_{i}" for i in range(args.entities)]
+    server, ha = start_fake_ha(port=PORT, token=TOKEN, entities=entities)
+    # config 在导入时读取环境变量，必须先设置
+    os.environ.update(HA_BASE_URL=f"http://127.0.0.1:{PORT}", HA_TOKEN=TOKEN, HA_WS_URL="",
+                      HA_TRANSPORT="rest", HA_STATE_MIRROR="true", HA_MIRROR_MAX_STALE="30")
+    import ha_control
+    import state_mirror
+
+    queries = [(entities[i % len(entities)],) for i in range(args.queries)]
+    ha_control.describe_state(entities[0])  # 预热连接
+    rest = timed(ha_control.describe_state, queries)
+
+    start = time.perf_counter()
+    mirror = state_mirror.start_mirror()
+    print(f"mirror start (subscribe + get_states, {args.entities} entities): "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+    cached = timed(ha_control.describe_state, queries)
+
+    print(f"\n{'describe_state':<16}{'p50':>10}{'p95':>10}")
+    for name, latencies in (("rest", rest), ("mirror", cached)):
+        print(f"{name:<16}{percentile(latencies, 0.5) * 1e6:>8.1f}us{percentile(latencies, 0.95) * 1e6:>8.1f}us")
+
+    # ---- 事件传播 ----
+    delays = []
+    for i in range(50):
+        entity_id = entities[i]
+        value = "on" if i % 2 else "off"
+        start = time.perf_counter()
+        ha.set_state(entity_id, value, {"brightness": i})
+        delays.append(wait_for(lambda: (mirror.lookup(entity_id)[0] or {}).get("attributes", {}).get("brightness") == i)
+                      or float("inf"))
+    print(f"\nstate_changed -> mirror: p50 {percentile(delays, 0.5) * 1000:.2f} ms, "
+          f"max {max(delays) * 1000:.2f} ms ({len(delays)} events)")
+
+    # ---- 断线与回退 ----
+    client = mirror.client
+    good_url = client.url
+    mirror.max_stale = 0.2
+    client.url = "ws://127.0.0.1:1/api/websocket"   # 让后台重连暂时失败
+    client.ws.sock.shutdown(socket.SHUT_RDWR)
+    wait_for(lambda: not mirror.live)
+    state, freshness = mirror.lookup(entities[0])
+    print(f"\nafter disconnect: served from mirror, freshness={freshness}")
+    time.sleep(0.3)
+    print(f"after max_stale: lookup={mirror.lookup(entities[0])}, "
+          f"get_state source={'mirror' if 'mirror' in (ha_control.get_state(entities[0]) or {}) else 'rest'}")
+    client.url = good_url
+    reloaded = wait_for(lambda: mirror.live, timeout=40)
+    print(f"reconnected and reloaded after {reloaded:.2f} s: {mirror.snapshot()}" if reloaded is not None
+          else "reconnect FAILED")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+'''
+增量 ASR 基准：对比流式上传时“整段识别”和“边传边识别”从结束标记到 ASR_RESULT 的延迟
+完全离线：使用 fake_asr_server.py 作为 ASR 服务，LLM 阶段的失败不影响测量。
+
+用法：python test/bench_streaming_asr.py [--seconds 3] [--rtf 0.1] [--runs 3]
+'''
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+ASR_PORT = 18801
+SERVER_PORT = 19801
+os.environ['ASR_API_URL'] = f'http://127.0.0.1:{ASR_PORT}/recognize'
+os.environ['ASR_STREAM_URL'] = f'http://127.0.0.1:{ASR_PORT}/stream'
+os.environ.setdefault('LLM_API_KEY', 'sk-offline')
+os.environ['LLM_BASE_URL'] = 'http://127.0.0.1:9/v1'
+os.environ['HTTP_PRECONNECT'] = 'false'
+
+from fake_asr_server import start_fake_asr
+from framing import FrameReader, encode_frame, encode_message
+from server import LightweightVoiceServer
+
+
+def stream_utterance(reader, sock, seconds, pace):
+    """按实时节奏（pace=1.0）发送 32ms 分片，返回 (结束标记到 ASR_RESULT 的耗时, 中间结果数)"""
+    request_id = str(uuid.uuid4())
+    sock.sendall(encode_message({'type': 'VOICE_COMMAND', 'request_id': request_id, 'size': 0,
+                                 'sample_rate': 16000, 'channels': 1}))
+    chunk = bytes(1024)  # 512 采样
+    for _ in range(int(seconds * 16000 / 512)):
+        sock.sendall(encode_frame(chunk))
+        if pace:
+            time.sleep(0.032 / pace)
+    sock.sendall((0).to_bytes(4, 'big'))
+    end_of_stream = time.perf_counter()
+
+    partials = 0
+    while True:
+        resp = reader.read_json()
+        if resp['type'] == 'ASR_PARTIAL':
+            partials += 1
+        elif resp['type'] == 'ASR_RESULT':
+            latency = time.perf_counter() - end_of_stream
+        elif resp['type'] in ('SUCCESS', 'INFO', 'ERROR'):
+            return latency, partials
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--rtf', type=float, default=0.1)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--pace', type=float, default=1.0, help='发送速度倍率，0 表示不限速')
+    args = parser.parse_args()
+
+    start_fake_asr(port=ASR_PORT, text='turn on the living room light', rtf=args.rtf)
+    server = LightweightVoiceServer(host='127.0.0.1', port=SERVER_PORT)
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(0.5)
+
+    streaming = server.pipeline.streaming_asr
+    sys.stdout, real_stdout = open(os.devnull, 'w'), sys.stdout  # 屏蔽服务端日志
+    results = {}
+    try:
+        for mode in ('batch', 'streaming'):
+            server.pipeline.streaming_asr = streaming if mode == 'streaming' else None
+            sock = socket.create_connection(('127.0.0.1', SERVER_PORT))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            reader = FrameReader(sock)
+            results[mode] = [stream_utterance(reader, sock, args.seconds, args.pace) for _ in range(args.runs)]
+            sock.close()
+    finally:
+        sys.stdout = real_stdout
+
+    print(f"utterance: {args.seconds}s, fake ASR rtf={args.rtf}, runs={args.runs}")
+    print(f"{'mode':<12}{'end-of-stream -> ASR_RESULT':>30}{'ASR_PARTIAL frames':>22}")
+    for mode, runs in results.items():
+        latency = sum(r[0] for r in runs) / len(runs)
+        partials = sum(r[1] for r in runs) / len(runs)
+        print(f"{mode:<12}{latency * 1000:>28.1f}ms{partials:>22.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+'''
+最小的 WebSocket（RFC 6455）实现（客户端与服务端共用）
+只支持 HA WebSocket API 用到的部分：文本帧、ping / pong、close，分片消息会被拼接；
+不支持扩展（permessage-deflate 等）。只依赖标准库，不额外引入 websocket 包。
+'''
+import base64
+import hashlib
+import os
+import socket
+import ssl
+import struct
+import threading
+from urllib.parse import urlsplit
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_MESSAGE_SIZE = 16 << 20      # get_states 在大型安装上可能有几 MB
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketClosed(ConnectionError):
+    pass
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def read_http_head(sock):
+    """读取 HTTP 头（到空行为止），返回 (首行, {小写头名: 值}, 头后面已经读到的字节)"""
+    data = b""
+    while b"\r\n\r\n" not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise WebSocketClosed("Connection closed during handshake")
+        data += chunk
+        if len(data) > 65536:
+            raise ConnectionError("HTTP header too large")
+    head, _, rest = data.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return lines[0], headers, rest
+
+
+def connect(url, timeout=10, headers=None):
+    """建立 WebSocket 连接（ws:// 或 wss://），返回 WebSocket"""
+    parts = urlsplit(url)
+    secure = parts.scheme == "wss"
+    port = parts.port or (443 if secure else 80)
+    sock = socket.create_connection((parts.hostname, port), timeout=timeout)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        request = [
+            f"GET {path} HTTP/1.1",
+            f"Host: {parts.netloc}",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Key: {key}",
+            "Sec-WebSocket-Version: 13",
+        ] + [f"{name}: {value}" for name, value in (headers or {}).items()]
+        sock.sendall(("\r\n".join(request) + "\r\n\r\n").encode("latin-1"))
+        # 服务端可能紧跟着握手响应发出第一帧（HA 的 auth_required），多读到的字节交给 WebSocket
+        status, response_headers, rest = read_http_head(sock)
+        if " 101 " not in status + " ":
+            raise ConnectionError(f"WebSocket handshake failed: {status}")
+        if response_headers.get("sec-websocket-accept") != accept_key(key):
+            raise ConnectionError("WebSocket handshake failed: bad Sec-WebSocket-Accept")
+    except BaseException:
+        sock.close()
+        raise
+    return WebSocket(sock, mask=True, buffered=rest)
+
+
+class WebSocket:
+    def __init__(self, sock, mask, buffered=b""):
+        """
+        :param mask: 客户端发出的帧必须加掩码，服务端发出的帧不加
+        :param buffered: 握手时多读到的字节
+        """
+        self.sock = sock
+        self.mask = mask
+        self.buffered = buffered
+        self.closed = False
+        # 读线程自动回复的 pong / close 与其他线程发送的数据帧不能交错
+        self.send_lock = threading.Lock()
+
+    def recv_exact(self, n):
+        buf = bytearray(n)
+        view = memoryview(buf)
+        got = 0
+        if self.buffered:
+            got = min(n, len(self.buffered))
+            view[:got] = self.buffered[:got]
+            self.buffered = self.buffered[got:]
+        while got < n:
+            size = self.sock.recv_into(view[got:], n - got)
+            if not size:
+                raise WebSocketClosed("Connection closed")
+            got += size
+        return bytes(buf)
+
+    def send_frame(self, opcode, payload=b""):
+        """发送一帧；可以在多个线程中调用"""
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        mask_bit = 0x80 if self.mask else 0
+        if length < 126:
+            header.append(mask_bit | length)
+        elif length < 1 << 16:
+            header.append(mask_bit | 126)
+            header += struct.pack("!H", length)
+        else:
+            header.append(mask_bit | 127)
+            header += struct.pack("!Q", length)
+        if self.mask:
+            key = os.urandom(4)
+            header += key
+            payload = mask_payload(payload, key)
+        with self.send_lock:
+            self.sock.sendall(bytes(header) + payload)
+
+    def send_text(self, text):
+        self.send_frame(OP_TEXT, text.encode("utf-8"))
+
+    def recv_frame(self):
+        """:return: (fin, opcode, payload)"""
+        first, second = self.recv_exact(2)
+        fin, opcode = first & 0x80, first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self.recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self.recv_exact(8))[0]
+        if length > MAX_MESSAGE_SIZE:
+            raise ConnectionError(f"WebSocket frame too large: {length}")
+        key = self.recv_exact(4) if second & 0x80 else None
+        payload = self.recv_exact(length) if length else b""
+        if key:
+            payload = mask_payload(payload, key)
+        return fin, opcode, payload
+
+    def recv_text(self):
+        """
+        接收一条完整的数据消息（拼接分片），自动回复 ping
+        :return: 文本；对端关闭时抛出 WebSocketClosed
+        """
+        parts = []
+        while True:
+            fin, opcode, payload = self.recv_frame()
+            if opcode == OP_PING:
+                self.send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                self.close()
+                raise WebSocketClosed("Closed by peer")
+            parts.append(payload)
+            if sum(len(p) for p in parts) > MAX_MESSAGE_SIZE:
+                raise ConnectionError("WebSocket message too large")
+            if fin:
+                return b"".join(parts).decode("utf-8")
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.send_frame(OP_CLOSE, struct.pack("!H", 1000))
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def mask_payload(payload, key):
+    # 按 4 字节掩码整体异或：转成大整数一次完成，比逐字节循环快得多
+    n = len(payload)
+    if not n:
+        return payload
+    mask = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(mask, "big")).to_bytes(n, "big")